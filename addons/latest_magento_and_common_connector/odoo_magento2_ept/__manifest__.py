@@ -1,7 +1,7 @@
 {
     # App information
     'name': "Odoo Magento 2 Connector",
-    'version': '19.0.0.1',
+    'version': '19.0.0.2',
     'category': 'eCommerce',
     'license': 'OPL-1',
     'summary': 'Odoo Magento 2 Connector helps you integrate your Magento 2.x website with Odoo and automates various operations between Odoo and Magento.Apart from Odoo Magento Connector, we do have other ecommerce solutions or applications such as Woocommerce connector , Shopify connector , and also we have solutions for Marketplace Integration such as Odoo Amazon connector , Odoo eBay Connector , Odoo Walmart Connector , Odoo Bol.com Connector.Aside from ecommerce integration and ecommerce marketplace integration, we also provide solutions for various operations, such as shipping , logistics , shipping labels , and shipping carrier management with our shipping integration , known as the Shipstation connector.For the customers who are into Dropship business, we do provide EDI Integration that can help them manage their Dropshipping business with our Dropshipping integration or Dropshipper integration It is listed as Dropshipping EDI integration and Dropshipper EDI integration.Emipro applications can be searched with different keywords like Amazon integration , Shopify integration , Woocommerce integration, Magento integration , Amazon vendor center module , Amazon seller center module , Inter company transfer , Ebay integration , Bol.com integration , inventory management , warehouse transfer module , dropship and dropshipper integration and other Odoo integration application or module',
@@ -45,6 +45,8 @@
         'views/customer_queue_line_ept.xml',
         'views/export_stock_queue.xml',
         'views/export_stock_queue_line.xml',
+        'views/magento_bulk_request_view.xml',
+        'views/magento_api_stats_view.xml',
         'data/magento_data_cron.xml',
         'data/ir_cron_data.xml',
         'data/ir_attachment_data.xml',
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+The instances existing before the field projection keep downloading the full Magento records,
+the customisations reading other keys go on working. The projection is enabled on the new
+instances, or by hand in the instance settings.
+The queue sizings of the existing instances are created here, the new instances get theirs
+when they are created.
+"""
+from odoo.addons.odoo_magento2_ept.models.magento_queue_sizing import QUEUE_STREAMS
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute("UPDATE magento_instance SET magento_api_field_projection = false")
+    for stream, (_cron, queue_size, page_size) in QUEUE_STREAMS.items():
+        cr.execute("""
+            INSERT INTO magento_queue_sizing (magento_instance_id, stream, mode, queue_size, page_size,
+                                              create_date, write_date)
+            SELECT id, %s, 'fixed', %s, %s, now() at time zone 'UTC', now() at time zone 'UTC'
+            FROM magento_instance
+            ON CONFLICT (magento_instance_id, stream) DO NOTHING
+        """, (stream, queue_size, page_size))
@@ -3,6 +3,9 @@
 """Importing models."""
 from . import magento_instance
 from . import common_log_lines_ept
+from . import queue_line_claim
+from . import queue_payload
+from . import order_reference_cache
 from . import customer_queue
 from . import customer_queue_line
 from . import magento_storeview
@@ -36,6 +39,10 @@ from . import magento_financial_status_ept
 from . import res_company
 from . import magento_res_partner_ept
 from . import magento_api_request_page
+from . import magento_sync_watermark
+from . import magento_bulk_request
+from . import magento_api_stats
+from . import magento_queue_sizing
 from . import magento_attribute_set
 from . import magento_product_attribute
 from . import magento_attribute_option
@@ -7,7 +7,7 @@ from odoo.tools import frozendict, groupby, split_every
 
 class AccountTaxCode(models.Model):
     """Inherited account tax model to calculate tax."""
-    _inherit = 'account.tax'
+    _inherit = ['account.tax', 'magento.reference.data.mixin']
 
     def get_tax_from_rate(self, rate, name, is_tax_included=False, country=False):
         """
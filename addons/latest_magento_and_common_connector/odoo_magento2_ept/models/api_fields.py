@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Fields requested from the Magento list APIs per import stream.
+Only the JSON paths read while processing the queue lines are downloaded, a nested list
+selects the keys of an object and a plain name downloads the whole value.
+When a new key of the response is read by the connector, it must be added here.
+"""
+
+ORDER_ITEM_FIELDS = [
+    'item_id', 'parent_item_id', 'product_id', 'product_type', 'sku', 'name', 'qty_ordered',
+    'price', 'base_price', 'price_incl_tax', 'base_price_incl_tax', 'original_price',
+    'base_original_price', 'tax_percent', 'parent_item', 'extension_attributes'
+]
+
+IMPORT_FIELDS = {
+    # process_order_queue_line(), create_sale_order_ept() and sale.order.line
+    'order': [
+        'entity_id', 'increment_id', 'created_at', 'updated_at', 'status', 'store_id',
+        'customer_id', 'customer_is_guest', 'customer_firstname', 'customer_lastname',
+        'customer_email', 'base_currency_code', 'order_currency_code', 'shipping_amount',
+        'base_shipping_amount', 'shipping_incl_tax', 'base_shipping_incl_tax', 'discount_amount',
+        'base_discount_amount', 'billing_address',
+        {'payment': ['method']},
+        {'items': ORDER_ITEM_FIELDS},
+        {'extension_attributes': [
+            'shipping_assignments', 'is_invoice', 'is_shipment', 'order_response',
+            'apply_shipping_on_prices', 'apply_discount_on_prices', 'item_applied_taxes',
+            'ept_option_title'
+        ]},
+    ],
+    # import_cancel_order()
+    'cancel_order': ['entity_id', 'increment_id', 'created_at', 'updated_at'],
+    # import_products() of the product queue lines and of the orders
+    'product': [
+        'id', 'sku', 'name', 'attribute_set_id', 'price', 'status', 'visibility', 'type_id',
+        'created_at', 'updated_at', 'weight', 'extension_attributes', 'custom_attributes',
+        'media_gallery_entries'
+    ],
+    # create_magento_customer()
+    'customer': [
+        'id', 'email', 'firstname', 'lastname', 'website_id', 'store_id', 'taxvat', 'created_at',
+        'updated_at', 'addresses'
+    ],
+}
+
+
+def get_import_fields(instance, stream):
+    """
+    Return the fields parameter of a list API call for the stream, or an empty list when the
+    instance downloads the full records.
+    :param instance: magento.instance()
+    :param stream: Key of IMPORT_FIELDS
+    :return: list, to be given as fields of create_search_criteria()
+    """
+    if not instance.magento_api_field_projection:
+        return []
+    return ['items[{}]'.format(render_fields(IMPORT_FIELDS.get(stream)))]
+
+
+def render_fields(fields):
+    """
+    Render the fields in the syntax of Magento, like sku,payment[method].
+    """
+    values = []
+    for field in fields:
+        if isinstance(field, dict):
+            values += ['{}[{}]'.format(key, render_fields(sub_fields)) for key, sub_fields in field.items()]
+        else:
+            values.append(field)
+    return ','.join(values)
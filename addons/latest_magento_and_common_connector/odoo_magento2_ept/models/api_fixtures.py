@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Record and replay of the Magento API answers, to measure and test the import and export
+pipelines without a live store. It is enabled in the Odoo server configuration file:
+
+    magento_api_record_dir = /path/to/fixtures    every answer of Magento is stored in the directory
+    magento_api_replay_dir = /path/to/fixtures    answers are read from the directory, Magento is
+                                                  never called
+
+A replayed request gets the answer recorded for the same method, path and body. When the
+path differs, like the dates of a scheduled import, the answers recorded for the same method
+and endpoint template are returned one after the other.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from requests.models import Response
+from odoo import _
+from odoo.exceptions import UserError
+from odoo.tools import config as odoo_config
+
+_fixture_indexes = {}
+_fixture_lock = threading.Lock()
+
+
+def get_fixture_mode():
+    """
+    Return ('replay', directory), ('record', directory) or (False, False).
+    """
+    if odoo_config.get('magento_api_replay_dir'):
+        return 'replay', odoo_config.get('magento_api_replay_dir')
+    if odoo_config.get('magento_api_record_dir'):
+        return 'record', odoo_config.get('magento_api_record_dir')
+    return False, False
+
+
+def get_fixture_key(method, path, data):
+    # The standard json module is kept, the recorded fixtures are named from its output.
+    payload = json.dumps([method.upper(), path, data], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:20]
+
+
+def record_response(directory, method, path, data, template, response):
+    """
+    Store the answer of Magento in the directory, one JSON file per request.
+    :param response: requests.Response()
+    """
+    key = get_fixture_key(method, path, data)
+    fixture = {
+        'method': method.upper(),
+        'path': path,
+        'template': template,
+        'data': data,
+        'status_code': response.status_code,
+        'body': response.content.decode('utf-8', errors='replace'),
+        'recorded_at': time.time_ns(),
+    }
+    os.makedirs(directory, exist_ok=True)
+    file_name = os.path.join(directory, '{}.json'.format(key))
+    with open(file_name + '.tmp', 'w', encoding='utf-8') as fixture_file:
+        json.dump(fixture, fixture_file, indent=1, default=str)
+    os.replace(file_name + '.tmp', file_name)
+    with _fixture_lock:
+        # The next replay from this directory reads it again.
+        _fixture_indexes.pop(directory, None)
+    return True
+
+
+def replay_response(directory, method, path, data, template):
+    """
+    Return the recorded answer of the request as a requests.Response().
+    """
+    index = _get_fixture_index(directory)
+    fixture = index['by_key'].get(get_fixture_key(method, path, data))
+    if not fixture:
+        with _fixture_lock:
+            fixtures = index['by_template'].get((method.upper(), template))
+            if fixtures:
+                position = index['positions'].get((method.upper(), template), 0)
+                fixture = fixtures[position % len(fixtures)]
+                index['positions'][(method.upper(), template)] = position + 1
+    if not fixture:
+        raise UserError(_("No recorded Magento answer for %s %s in %s.", method.upper(), path, directory))
+    response = Response()
+    response.status_code = fixture.get('status_code')
+    response._content = fixture.get('body', '').encode('utf-8')
+    response.headers['Content-Type'] = 'application/json'
+    response.url = path
+    return response
+
+
+def _get_fixture_index(directory):
+    with _fixture_lock:
+        index = _fixture_indexes.get(directory)
+        if index:
+            return index
+        index = {'by_key': {}, 'by_template': {}, 'positions': {}}
+        fixtures = []
+        for file_name in os.listdir(directory) if os.path.isdir(directory) else []:
+            if file_name.endswith('.json'):
+                with open(os.path.join(directory, file_name), encoding='utf-8') as fixture_file:
+                    fixtures.append((file_name[:-5], json.load(fixture_file)))
+        for key, fixture in sorted(fixtures, key=lambda item: item[1].get('recorded_at', 0)):
+            index['by_key'][key] = fixture
+            index['by_template'].setdefault((fixture.get('method'), fixture.get('template')), []).append(fixture)
+        _fixture_indexes[directory] = index
+    return index
@@ -3,57 +3,601 @@
 """
 Requrests API to magento.
 """
-import json
 import logging
+import os
+import random
+import re
 import socket
+import threading
+import time
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import requests
+from requests.adapters import HTTPAdapter
 from odoo import _
 from odoo.exceptions import UserError
+from odoo.tools import config as odoo_config
+from .api_fixtures import get_fixture_mode, record_response, replay_response
+from .json_codec import dumps, loads, set_codec
 
 _logger = logging.getLogger("Magento EPT")
 
+# The JSON codec is the fastest one installed, unless magento_json_codec is set in the server
+# configuration (orjson, ujson or json).
+if odoo_config.get('magento_json_codec'):
+    try:
+        set_codec(odoo_config.get('magento_json_codec'))
+    except ValueError as codec_error:
+        _logger.warning("Magento JSON codec not changed: %s", codec_error)
+
+# Keep-alive sessions shared by every caller of req(), keyed by (database, instance id).
+_session_pool = {}
+_session_pool_lock = threading.Lock()
+_rate_limiters = {}
+_circuit_breakers = {}
+# API call statistics waiting to be flushed, keyed by (database, instance id, bucket, endpoint, method).
+_api_stats = {}
+_api_stats_lock = threading.Lock()
+_api_stats_flushed_at = {}
+
+# Status codes on which an idempotent request is sent again.
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+RETRY_BACKOFF_BASE = 1.0
+MAX_RETRY_DELAY = 60.0
+# Status codes counted as a failure of the endpoint by the circuit breaker.
+CIRCUIT_FAILURE_CODES = (500, 502, 503, 504)
+# Endpoint read by the order and product queue processors.
+PRODUCT_API_PATH = '/V1/products'
+# Length of the time buckets of the API statistics, and delay between two flushes of a worker.
+STATS_BUCKET_SECONDS = 900
+STATS_FLUSH_INTERVAL = 60
+# Upper bounds of the latency histogram, in milliseconds. Slower calls go to the last bucket.
+LATENCY_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# Sub-resources of /V1/products, any other segment after it is a SKU.
+PRODUCT_ROUTES = ('attributes', 'attribute-sets', 'base-prices', 'special-price', 'tier-prices', 'types',
+                  'options', 'links', 'media', 'cost', 'updatestock')
+UUID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+
+
+class MagentoCircuitOpenError(UserError):
+    """
+    Raised without calling Magento while the circuit breaker of the endpoint is open.
+    """
+
 
 def req(instance, path, method='GET', data=None, params=None, is_raise=False):
     """
     This method use for base on API request it call API method.
+    Idempotent GET requests are retried with an exponential backoff when Magento is busy.
+    """
+    try:
+        return request_api(get_api_config(instance), path, method=method, data=data, params=params,
+                           is_raise=is_raise)
+    finally:
+        flush_api_stats(instance.env)
+
+
+def flush_api_stats(env, force=False):
+    """
+    Store the statistics buffered by this worker, at most once per STATS_FLUSH_INTERVAL.
+    :param env: Odoo environment of the database
+    :param force: Flush even if the last flush is recent
+    """
+    dbname = env.cr.dbname
+    now = time.monotonic()
+    if not force and now - _api_stats_flushed_at.get(dbname, 0) < STATS_FLUSH_INTERVAL:
+        return True
+    _api_stats_flushed_at[dbname] = now
+    entries = take_api_stats(dbname)
+    if entries:
+        env['magento.api.stats'].store_api_stats(entries)
+    return True
+
+
+def get_api_config(instance):
     """
-    location_url = check_location_url(instance.magento_url)
-    verify_ssl = instance.magento_verify_ssl
-    api_url = '{}{}'.format(location_url, path)
-    headers = get_headers(instance.access_token)
+    Read the connection settings of the instance once, so the request can be sent from a
+    worker thread without touching the ORM.
+    :param instance: magento.instance()
+    :return: dict
+    """
+    return {
+        'key': (instance.env.cr.dbname, instance.id),
+        'url': check_location_url(instance.magento_url),
+        'token': instance.access_token,
+        'verify_ssl': instance.magento_verify_ssl,
+        'pool_size': instance.magento_api_pool_size or 10,
+        'timeout': (instance.magento_api_connect_timeout or 10, instance.magento_api_read_timeout or 120),
+        'rate_limit': instance.magento_api_rate_limit,
+        'max_retries': max(instance.magento_api_max_retries, 0),
+        'breaker_threshold': instance.magento_api_breaker_threshold,
+        'breaker_cooldown': max(instance.magento_api_breaker_cooldown, 1),
+        'collect_stats': instance.magento_api_stats,
+    }
+
+
+def request_api(config, path, method='GET', data=None, params=None, is_raise=False):
+    """
+    Send the request with the settings prepared by get_api_config().
+    :param config: dict from get_api_config()
+    :return: Response of Magento
+    """
+    api_url = '{}{}'.format(config.get('url'), path)
     method = method.lower()
-    if hasattr(requests, method):
-        try:
-            if verify_ssl:
-                if data:
-                    # We only pass the data variable as an argument for the GET request.
-                    # If we all the data = '' as blank then also it gives an error from Magento end.
-                    data = json.dumps(data)
-                    response = getattr(requests, method)(url=api_url, headers=headers,
-                                                         data=data, verify=True, params=params)
-                else:
-                    response = getattr(requests, method)(url=api_url, headers=headers,
-                                                         verify=True, params=params)
+    fixture_mode, fixture_dir = get_fixture_mode()
+    if fixture_mode == 'replay':
+        return handle_response(replay_response(fixture_dir, method, path, data, get_endpoint_template(path)),
+                               is_raise)
+    session = get_session(config)
+    if hasattr(session, method):
+        breaker = get_circuit_breaker(config, path)
+        if breaker and not breaker.allow():
+            raise MagentoCircuitOpenError(_(
+                "Magento API %s is paused for %s seconds after %s consecutive failures.",
+                breaker.family, int(breaker.remaining()), breaker.threshold))
+        kwargs = {'params': params, 'timeout': config.get('timeout')}
+        if config.get('verify_ssl'):
+            kwargs.update({'verify': True})
+        if data:
+            # We only pass the data variable as an argument for the GET request.
+            # If we all the data = '' as blank then also it gives an error from Magento end.
+            kwargs.update({'data': dumps(data)})
+        retries = config.get('max_retries') if method == 'get' else 0
+        bucket = get_rate_limiter(config)
+        for attempt in range(retries + 1):
+            if bucket:
+                bucket.acquire()
+            started_at = time.monotonic()
+            try:
+                response = getattr(session, method)(url=api_url, **kwargs)
+                _logger.info(api_url)
+                record_api_call(config, path, method, response.status_code, len(kwargs.get('data') or ''),
+                                len(response.content or b''), time.monotonic() - started_at)
+            except (socket.gaierror, socket.error, socket.timeout, requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as error:
+                record_api_call(config, path, method, 0, len(kwargs.get('data') or ''), 0,
+                                time.monotonic() - started_at)
+                if attempt < retries:
+                    _logger.warning("Retrying %s after network error: %s", api_url, error)
+                    time.sleep(get_retry_delay(attempt))
+                    continue
+                if breaker:
+                    breaker.record_failure()
+                raise UserError(_('A network error caused the failure of the job: %s', error))
+            except Exception as error:
+                if breaker:
+                    breaker.release()
+                message = get_common_error_message(str(error))
+                raise UserError(_(message))
+            if response.status_code == 429 and bucket:
+                bucket.slow_down()
+            if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                delay = get_retry_delay(attempt, response.headers.get('Retry-After'))
+                _logger.warning("Magento answered %s for %s, retrying in %.1f seconds.",
+                                response.status_code, api_url, delay)
+                time.sleep(delay)
+                continue
+            break
+        if breaker:
+            if response.status_code in CIRCUIT_FAILURE_CODES:
+                breaker.record_failure()
             else:
-                if data:
-                    # We only pass the data variable as an argument for the GET request.
-                    # If we all the data = '' as blank then also it gives an error from Magento end.
-                    data = json.dumps(data)
-                    response = getattr(requests, method)(url=api_url, headers=headers,
-                                                         data=data, params=params)
-                else:
-                    response = getattr(requests, method)(url=api_url, headers=headers,
-                                                         params=params)
-            _logger.info(api_url)
-        except (socket.gaierror, socket.error, socket.timeout) as error:
-            raise UserError(_('A network error caused the failure of the job: %s', error))
-        except Exception as error:
-            message = get_common_error_message(str(error))
-            raise UserError(_(message))
+                breaker.record_success()
+        if fixture_mode == 'record':
+            record_response(fixture_dir, method, path, data, get_endpoint_template(path), response)
         return handle_response(response, is_raise)
     return dict()
 
 
+def fetch_pages(instance, get_path, pages, is_raise=False, on_page=None):
+    """
+    Download the pages of a searchCriteria listing concurrently and yield them in page order,
+    so the caller can create the queue lines and store its page counter page by page.
+    At most twice the configured number of workers are downloaded ahead of the caller.
+    :param instance: magento.instance()
+    :param get_path: Function returning the API path of a page number
+    :param pages: Page numbers to download, in order
+    :param is_raise: If True, raise the error of a failed page
+    :param on_page: Function called with the response and duration of each page, before it is yielded
+    :return: Generator of (page, response)
+    """
+    config = get_api_config(instance)
+    workers = max(instance.magento_api_page_workers, 1)
+    pages = iter(pages)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='magento_page') as executor:
+        try:
+            for page in pages:
+                pending.append((page, executor.submit(_timed_request_api, config, get_path(page), is_raise)))
+                if len(pending) < workers * 2:
+                    continue
+                page, future = pending.popleft()
+                yield page, _page_result(future, on_page)
+            while pending:
+                page, future = pending.popleft()
+                yield page, _page_result(future, on_page)
+        finally:
+            # The caller stopped early (last page reached or error), drop what is not started yet.
+            for _page, future in pending:
+                future.cancel()
+    flush_api_stats(instance.env)
+
+
+def _timed_request_api(config, path, is_raise):
+    started_at = time.monotonic()
+    response = request_api(config, path, is_raise=is_raise)
+    return response, time.monotonic() - started_at
+
+
+def _page_result(future, on_page):
+    response, seconds = future.result()
+    if on_page:
+        on_page(response, seconds)
+    return response
+
+
+def fetch_cursor_pages(instance, get_path, cursor=0, page_size=50, item_key='entity_id', is_raise=False,
+                       on_page=None):
+    """
+    Download the records of a searchCriteria listing with keyset pagination. Each request asks
+    for the records after the highest id of the previous page, so the pages are downloaded one
+    after the other and records updated during the run are neither skipped nor duplicated.
+    :param instance: magento.instance()
+    :param get_path: Function returning the API path of the records after a cursor
+    :param cursor: Last id already imported
+    :param page_size: Page size used by get_path
+    :param item_key: Key of the id in the response items
+    :param is_raise: If True, raise the error of a failed page
+    :param on_page: Function called with the response and duration of each page, before it is yielded
+    :return: Generator of (cursor, response), the cursor being the last id of the response
+    """
+    while True:
+        started_at = time.monotonic()
+        response = req(instance, get_path(cursor), is_raise=is_raise)
+        if on_page:
+            on_page(response, time.monotonic() - started_at)
+        items = (response.get('items') or []) if isinstance(response, dict) else []
+        if not items:
+            return
+        cursor = max(int(item.get(item_key)) for item in items)
+        yield cursor, response
+        if len(items) < page_size:
+            return
+
+
+def get_retry_delay(attempt, retry_after=None):
+    """
+    Return the seconds to wait before the next attempt. Retry-After sent by Magento is honoured,
+    otherwise an exponential backoff with full jitter is used.
+    :param attempt: Number of the failed attempt, starting from 0
+    :param retry_after: Retry-After header value, in seconds or as HTTP date
+    :return: Seconds to sleep
+    """
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = 0
+        if delay > 0:
+            return min(delay, MAX_RETRY_DELAY)
+    return random.uniform(0, min(RETRY_BACKOFF_BASE * (2 ** attempt), MAX_RETRY_DELAY))
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket used to keep the requests of an instance under the configured
+    requests per second. The rate is halved when Magento answers 429 and recovers step by step.
+    """
+
+    def __init__(self, rate):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return True
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.rate / 2, self.max_rate * 0.1)
+        return True
+
+
+def get_rate_limiter(config):
+    """
+    Return the token bucket of the instance, or None when no rate limit is configured.
+    :param config: dict from get_api_config()
+    :return: TokenBucket() or None
+    """
+    rate = config.get('rate_limit')
+    if not rate or rate <= 0:
+        return None
+    key = config.get('key')
+    with _session_pool_lock:
+        bucket = _rate_limiters.get(key)
+        if not bucket or bucket.max_rate != rate:
+            bucket = TokenBucket(rate)
+            _rate_limiters[key] = bucket
+    return bucket
+
+
+class CircuitBreaker:
+    """
+    Thread safe circuit breaker of an endpoint family of an instance. After the configured number
+    of consecutive network errors or 5xx answers the circuit opens and the calls fail at once.
+    When the cool-down is over a single probe call is let through, its success closes the circuit
+    and its failure opens it again.
+    """
+
+    def __init__(self, family, threshold, cooldown):
+        self.family = family
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            # Cool-down over, this call is the probe. The others wait for its result, or for
+            # another cool-down if the probe never reports.
+            self.state = 'half_open'
+            self.opened_at = time.monotonic()
+            return True
+
+    def is_open(self):
+        with self.lock:
+            return self.state != 'closed' and time.monotonic() - self.opened_at < self.cooldown
+
+    def remaining(self):
+        return max(self.cooldown - (time.monotonic() - self.opened_at), 0)
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+        return True
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state == 'closed':
+                    _logger.warning("Magento API %s failed %s times in a row, pausing calls for %s "
+                                    "seconds.", self.family, self.failures, self.cooldown)
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+        return True
+
+    def release(self):
+        """
+        Forget a call ended by a local error, which tells nothing about the health of Magento.
+        """
+        with self.lock:
+            if self.state == 'half_open':
+                self.state = 'open'
+                self.opened_at = time.monotonic() - self.cooldown
+        return True
+
+
+def get_endpoint_family(path):
+    """
+    Return the endpoint family of an API path, the first route segment after the version.
+    Like /all/V1/products/sku to products or /V1/order/12/ship to order.
+    """
+    route = path.split('?', 1)[0].partition('/V1/')[2]
+    return route.split('/', 1)[0] or 'default'
+
+
+def get_circuit_breaker(config, path):
+    """
+    Return the circuit breaker of the endpoint family of the path, or None when disabled.
+    :param config: dict from get_api_config()
+    :param path: API path
+    :return: CircuitBreaker() or None
+    """
+    threshold = config.get('breaker_threshold')
+    if not threshold or threshold <= 0:
+        return None
+    family = get_endpoint_family(path)
+    key = config.get('key') + (family,)
+    with _session_pool_lock:
+        breaker = _circuit_breakers.get(key)
+        if not breaker:
+            breaker = CircuitBreaker(family, threshold, config.get('breaker_cooldown'))
+            _circuit_breakers[key] = breaker
+        breaker.threshold = threshold
+        breaker.cooldown = config.get('breaker_cooldown')
+    return breaker
+
+
+def is_circuit_open(instance, path):
+    """
+    Return True while the endpoint family of the path is paused for the instance, so the queue
+    processors can leave their lines for a later run instead of failing them one by one.
+    :param instance: magento.instance()
+    :param path: API path used by the caller
+    """
+    breaker = _circuit_breakers.get((instance.env.cr.dbname, instance.id, get_endpoint_family(path)))
+    return bool(breaker and breaker.is_open())
+
+
+def get_endpoint_template(path):
+    """
+    Return the path without query string, store code and ids, like /{store}/V1/orders/{id}.
+    """
+    prefix, sep, route = path.split('?', 1)[0].partition('/V1/')
+    if not sep:
+        return prefix
+    prefix = '/'.join('{store}' if segment not in ('', 'async', 'bulk') else segment
+                      for segment in prefix.split('/'))
+    segments = route.split('/')
+    for index, segment in enumerate(segments):
+        if segment.isdigit():
+            segments[index] = '{id}'
+        elif UUID_PATTERN.match(segment):
+            segments[index] = '{uuid}'
+        elif index and segments[index - 1] == 'products' and segment not in PRODUCT_ROUTES:
+            segments[index] = '{sku}'
+    return '{}/V1/{}'.format(prefix, '/'.join(segments))
+
+
+def record_api_call(config, path, method, status_code, sent, received, duration):
+    """
+    Add a call to the statistics buffered by this worker, see flush_api_stats().
+    :param config: dict from get_api_config()
+    :param status_code: HTTP status, 0 for a network error
+    :param sent: Bytes of the request body
+    :param received: Bytes of the response body
+    :param duration: Seconds
+    """
+    if not config.get('collect_stats'):
+        return False
+    bucket = int(time.time() // STATS_BUCKET_SECONDS * STATS_BUCKET_SECONDS)
+    key = config.get('key') + (bucket, get_endpoint_template(path), method.upper())
+    latency = duration * 1000
+    slot = next((index for index, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+    with _api_stats_lock:
+        stats = _api_stats.get(key)
+        if not stats:
+            stats = {'count': 0, 'error_count': 0, 'status': Counter(), 'sent': 0, 'received': 0,
+                     'duration': 0.0, 'max': 0.0, 'histogram': [0] * (len(LATENCY_BUCKETS) + 1)}
+            _api_stats[key] = stats
+        stats['count'] += 1
+        stats['error_count'] += 1 if not status_code or status_code >= 400 else 0
+        stats['status'][str(status_code)] += 1
+        stats['sent'] += sent
+        stats['received'] += received
+        stats['duration'] += duration
+        stats['max'] = max(stats['max'], latency)
+        stats['histogram'][slot] += 1
+    return True
+
+
+def take_api_stats(dbname):
+    """
+    Remove and return the statistics buffered for the database.
+    :return: dict of {(instance id, bucket, endpoint, method): stats}
+    """
+    with _api_stats_lock:
+        keys = [key for key in _api_stats if key[0] == dbname]
+        return {key[1:]: _api_stats.pop(key) for key in keys}
+
+
+def restore_api_stats(dbname, entries):
+    """
+    Put back statistics which could not be stored, they are merged in the next flush.
+    """
+    with _api_stats_lock:
+        for key, stats in entries.items():
+            current = _api_stats.get((dbname,) + key)
+            if current:
+                stats = merge_api_stats(current, stats)
+            _api_stats[(dbname,) + key] = stats
+    return True
+
+
+def merge_api_stats(stats, other):
+    return {
+        'count': stats['count'] + other['count'],
+        'error_count': stats['error_count'] + other['error_count'],
+        'status': Counter(stats['status']) + Counter(other['status']),
+        'sent': stats['sent'] + other['sent'],
+        'received': stats['received'] + other['received'],
+        'duration': stats['duration'] + other['duration'],
+        'max': max(stats['max'], other['max']),
+        'histogram': [first + second for first, second in zip(stats['histogram'], other['histogram'])],
+    }
+
+
+def get_latency_percentile(histogram, percentile, max_latency=0.0):
+    """
+    Return the upper bound in milliseconds of the histogram bucket holding the percentile.
+    The slowest bucket has no bound, the highest latency seen is used instead.
+    """
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    rank = total * percentile / 100.0
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank and count:
+            return float(min(LATENCY_BUCKETS[index], max_latency)) if index < len(LATENCY_BUCKETS) \
+                else float(max_latency)
+    return float(max_latency)
+
+
+def get_session(config):
+    """
+    Return the pooled keep-alive session of the instance. The session is rebuilt when the
+    credentials or the pool size of the instance change, or when the worker process is forked.
+    :param config: dict from get_api_config()
+    :return: requests.Session()
+    """
+    key = config.get('key')
+    pool_size = config.get('pool_size')
+    signature = (os.getpid(), config.get('url'), config.get('token'), pool_size)
+    with _session_pool_lock:
+        pooled = _session_pool.get(key)
+        if pooled and pooled[0] == signature:
+            return pooled[1]
+        if pooled and pooled[0][0] == signature[0]:
+            # Sockets of a forked parent are left alone, only our own pool is closed.
+            pooled[1].close()
+        session = _prepare_session(config.get('token'), pool_size)
+        _session_pool[key] = (signature, session)
+    return session
+
+
+def _prepare_session(token, pool_size):
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(get_headers(token))
+    return session
+
+
+def close_session(instance):
+    """
+    Close and forget the pooled session of the instance.
+    :param instance: magento.instance()
+    """
+    with _session_pool_lock:
+        for record in instance:
+            pooled = _session_pool.pop((record.env.cr.dbname, record.id), None)
+            _rate_limiters.pop((record.env.cr.dbname, record.id), None)
+            for key in [key for key in _circuit_breakers if key[:2] == (record.env.cr.dbname, record.id)]:
+                _circuit_breakers.pop(key)
+            if pooled and pooled[0][0] == os.getpid():
+                pooled[1].close()
+    return True
+
+
 def check_location_url(location_url):
     """
     Set Magento rest API URL
@@ -72,6 +616,7 @@ def check_location_url(location_url):
 def get_headers(token):
     return {
         'Accept': '*/*',
+        'Accept-Encoding': 'gzip, deflate',
         'Content-Type': 'application/json',
         'User-Agent': 'My User Agent 1.0',
         'Authorization': 'Bearer {}'.format(token)
@@ -81,12 +626,17 @@ def get_headers(token):
 def handle_response(response, is_raise=False):
     if response.status_code in (200, 500):
         try:
-            return response.json()
+            return loads(response.content)
         except Exception as error:
             _logger.error(error)
     if response.status_code == 401:
         _logger.error(response)
         raise UserError('Given Credentials are incorrect, Kindly use correct Credentials.')
+    elif response.status_code in RETRY_STATUS_CODES:
+        _logger.error(response)
+        raise UserError(_("Magento is too busy to answer the request (HTTP %s). "
+                          "Kindly lower the API rate limit of the instance or try again later.",
+                          response.status_code))
     elif response.status_code == 500:
         _logger.error(response)
         message = get_500_error_message()
@@ -160,10 +710,15 @@ def create_search_criteria(filters, **kwargs):
         then searchCriteria = {'searchCriteria': {'filterGroups': [{'filters': [{'field':
         'updated_at', 'condition_type': 'to', 'value': '2016-12-22 10:42:44'}]},{'filters':
         [{'field': 'updated_at', 'condition_type': 'from', 'value': '2016-12-16 10:42:18'}]}]}}
+        With cursor_field the records after the cursor are requested in ascending order of that
+        field (keyset pagination), instead of using deep page offsets.
     """
     searchcriteria = {}
     if filters is None:
         filters = {}
+    cursor_field = kwargs.get('cursor_field')
+    if cursor_field:
+        filters = dict(filters, **{cursor_field: {'gt': kwargs.get('cursor') or 0}})
 
     if not filters:
         searchcriteria = {
@@ -194,6 +749,9 @@ def create_search_criteria(filters, **kwargs):
             searchcriteria.get('searchCriteria', dict()).update({'pageSize': kwargs.get('page_size')})
         if kwargs.get('page', 0):
             searchcriteria.get('searchCriteria', dict()).update({'currentPage': kwargs.get('page')})
+        if cursor_field:
+            searchcriteria.get('searchCriteria', dict()).update({
+                'sortOrders': [{'field': cursor_field, 'direction': 'ASC'}]})
         if kwargs.get('fields'):
             searchcriteria.update({'fields': ",".join(kwargs.get('fields'))})
     return searchcriteria
@@ -4,9 +4,12 @@
 Describes methods for Magento import customer data queue.
 """
 import math
+import time
 from datetime import datetime
 from odoo import models, fields, api
-from .api_request import req, create_search_criteria
+from .api_request import req, create_search_criteria, fetch_pages
+from .api_fields import get_import_fields
+from .queue_payload import CLEAR_PAYLOAD
 from ..python_library.php import Php
 
 MAGENTO_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
@@ -111,8 +114,9 @@ class MagentoCustomerQueueEpt(models.Model):
         :param instance: Instance of Magento
         :return: Magento Customer Data queue object
         """
+        queue_size = self.env['magento.queue.sizing'].get_sizing(instance, 'customer').queue_size
         queue = self.search([('instance_id', '=', instance.id), ('state', '=', 'draft')])
-        queue = queue.filtered(lambda q: len(q.line_ids) < 50)
+        queue = queue.filtered(lambda q: len(q.line_ids) < queue_size)
         if not queue:
             queue = self.create({'instance_id': instance.id})
             message = f"Customer Queue #{queue.name} Created!!"
@@ -121,33 +125,30 @@ class MagentoCustomerQueueEpt(models.Model):
 
     def create_customer_queues(self, **kwargs):
         """
-        Import magento customers and stores them as a bunch of 50 orders queue
+        Import magento customers and stores them in queues of the queue size of the instance
         :param instance: Instance of Magento
         """
         instance = kwargs.get('instance')
-        page_size = 200
+        sizing = self.env['magento.queue.sizing'].get_sizing(instance, 'customer')
+        page_size = sizing.get_page_size()
+        queue_size = sizing.queue_size
         queue_ids = []
         for website in instance.magento_website_ids:
             kwargs.update({'website': website, 'fields': ['total_count']})
-            filters = self._prepare_customer_filter(**kwargs)
-            query_string = Php.http_build_query(filters)
-            req_path = f'/V1/customers/search?{query_string}'
-            customers = req(instance=instance, path=req_path, is_raise=True)
-            page = math.ceil(customers.get('total_count', 0) / page_size)
+            customers = req(instance=instance, path=self._get_customer_path(kwargs), is_raise=True)
+            total_page = math.ceil(customers.get('total_count', 0) / page_size)
             kwargs.pop('fields')
-            for page in range(1, page + 1):
-                kwargs.update({'page': page, 'page_size': page_size})
-                filters = self._prepare_customer_filter(**kwargs)
-                query_string = Php.http_build_query(filters)
-                req_path = f'/V1/customers/search?{query_string}'
-                customers = req(instance=instance, path=req_path, is_raise=True)
+            kwargs.update({'page_size': page_size, 'fields': get_import_fields(instance, 'customer')})
+            pages = fetch_pages(instance, lambda page: self._get_customer_path(dict(kwargs, page=page)),
+                                range(1, total_page + 1), is_raise=True, on_page=sizing.record_page)
+            for page, customers in pages:
                 queue = self._create_customer_queue(instance)
                 if queue.id not in queue_ids:
                     # Ids are prepared for return the customer to queue line tree view with created
                     # queue filters.
                     queue_ids.append(queue.id)
                 for customer in customers.get('items'):
-                    if len(queue.line_ids) == 50:
+                    if len(queue.line_ids) >= queue_size:
                         self.env.cr.commit()
                         queue = self._create_customer_queue(instance)
                     self.line_ids.create_queue_line(instance, customer, queue)
@@ -156,6 +157,10 @@ class MagentoCustomerQueueEpt(models.Model):
             kwargs.pop('page_size', False)
         return queue_ids
 
+    def _get_customer_path(self, kwargs):
+        filters = self._prepare_customer_filter(**kwargs)
+        query_string = Php.http_build_query(filters)
+        return f'/V1/customers/search?{query_string}'
 
     @staticmethod
     def _prepare_customer_filter(**kwargs):
@@ -198,9 +203,12 @@ class MagentoCustomerQueueEpt(models.Model):
                 queue.instance_id.enable_action_required_message(queue=queue)
                 queue.instance_id.create_schedule_activity(queue=queue, note=note)
                 queue.write({'is_process_queue': False})
+            queue_start = time.time()
             for line in lines:
                 line.process_queue_line()
-                line.write({'state': 'done', 'data': False})
+                line.write({'state': 'done', **CLEAR_PAYLOAD})
+            sizing = self.env['magento.queue.sizing'].get_sizing(queue.instance_id, 'customer')
+            sizing.record_processing(len(lines), time.time() - queue_start)
             message = "Customer Queue #{} Processed!!".format(queue.name)
             queue.instance_id.show_popup_notification(message)
             # To maintain that current queue process are completed and new queue will be executed.
@@ -3,7 +3,6 @@
 """
 Describes methods to store Customer Data queue line
 """
-import json
 from odoo import models, fields
 
 
@@ -12,6 +11,7 @@ class MagentoCustomerQueueLineEpt(models.Model):
     Describes Customer Data Queue Line
     """
     _name = "magento.customer.data.queue.line.ept"
+    _inherit = ['magento.queue.payload']
     _description = "Magento Customer Data Queue Line EPT"
     _rec_name = "magento_id"
 
@@ -36,9 +36,9 @@ class MagentoCustomerQueueLineEpt(models.Model):
         self.create({
             'magento_id': customer.get('id'),
             'instance_id': instance.id,
-            'data': json.dumps(customer),
             'queue_id': queue.id,
             'state': 'draft',
+            **self._prepare_payload_vals(customer),
         })
         return True
 
@@ -4,13 +4,14 @@ Describes methods and fields for Magento's Delivery Carriers
 """
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from .order_reference_cache import get_reference_cache
 
 
 class DeliveryCarrier(models.Model):
     """
     Inherited for Magento's carriers.
     """
-    _inherit = "delivery.carrier"
+    _inherit = ["delivery.carrier", "magento.reference.data.mixin"]
 
     magento_carrier = fields.Many2one(comodel_name='magento.delivery.carrier',
                                       help="This field relocates Magento Delivery Carrier",
@@ -54,16 +55,19 @@ class DeliveryCarrier(models.Model):
                                                     magento_instance_id=instance.id)
                 return False
             if magento_carrier:
-                carrier = carrier.search([('magento_carrier', '=', magento_carrier.id)], limit=1)
+                cache = get_reference_cache(self.env)
+                carrier = cache.get(('delivery_carrier', magento_carrier.id),
+                                    lambda: carrier.search([('magento_carrier', '=', magento_carrier.id)], limit=1))
                 if not carrier:
                     shipping_product = self.env.ref('odoo_magento2_ept.product_product_shipping')
                     product = instance.shipping_product_id or shipping_product
                     carrier_label = magento_carrier.carrier_label or magento_carrier.carrier_code
-                    carrier.create({
+                    carrier = carrier.create({
                         'name': carrier_label,
                         'product_id': product.id,
                         'magento_carrier': magento_carrier.id
                     })
+                    cache.set(('delivery_carrier', magento_carrier.id), carrier)
                 item.update({
                     'magento_carrier_id': magento_carrier.id,
                     'delivery_carrier_id': carrier.id
@@ -71,6 +75,10 @@ class DeliveryCarrier(models.Model):
         return True
 
     def __find_magento_carriers(self, instance, shipping_method):
+        return get_reference_cache(self.env).get(('magento_carrier', instance.id, shipping_method),
+                                                 lambda: self.__search_magento_carriers(instance, shipping_method))
+
+    def __search_magento_carriers(self, instance, shipping_method):
         carrier = self.env['magento.delivery.carrier']
         carrier = carrier.search([('carrier_code', '=', shipping_method),
                                   ('magento_instance_id', '=', instance.id)], limit=1)
@@ -1,4 +1,6 @@
+import time
 from odoo import models, fields, api
+from .api_request import is_circuit_open
 
 
 class MagentoExportStockQueueEpt(models.Model):
@@ -46,8 +48,9 @@ class MagentoExportStockQueueEpt(models.Model):
                                    help="It is used know queue how many time processed")
 
     def create_export_stock_queues(self, instance, data):
+        queue_size = self.env['magento.queue.sizing'].get_sizing(instance, 'export_stock').queue_size
         queue = self._create_export_stock_queue(instance)
-        if len(queue.line_ids) == 50:
+        if len(queue.line_ids) >= queue_size:
             self.env.cr.commit()
             queue = self._create_export_stock_queue(instance)
         self.line_ids.create_export_stock_queue_line(instance, data, queue)
@@ -58,8 +61,9 @@ class MagentoExportStockQueueEpt(models.Model):
         :param instance: Instance of Magento
         :return: Magento Export Stock Data queue object
         """
+        queue_size = self.env['magento.queue.sizing'].get_sizing(instance, 'export_stock').queue_size
         queue = self.search([('instance_id', '=', instance.id), ('state', '=', 'draft')])
-        queue = queue.filtered(lambda q: len(q.line_ids) < 50)
+        queue = queue.filtered(lambda q: len(q.line_ids) < queue_size)
         if not queue:
             queue = self.create({'instance_id': instance.id})
             message = f"Export Stock Queue #{queue.name} Created!!"
@@ -68,11 +72,20 @@ class MagentoExportStockQueueEpt(models.Model):
 
     def process_export_stock_queues(self, is_manual=False):
         for queue in self.filtered(lambda q: q.state not in ['completed', 'failed','partially_completed']):
+            api_url = queue.get_export_stock_api_url()
+            if is_circuit_open(queue.instance_id, api_url):
+                # Magento is failing, the queue is left as it is for the next run.
+                continue
+            cron_name = "odoo_magento2_ept.magento_ir_cron_to_process_export_stock_queue_data"
+            process_cron_time = queue.instance_id.get_magento_cron_execution_time(cron_name)
+            # Only the lines claimed by this worker are processed, another worker may process the queue.
+            lines = queue.line_ids.filtered(lambda l: l.state == 'draft').claim_lines(process_cron_time, ['draft'])
+            if not lines:
+                continue
             # To maintain that current queue has started to process.
             self.env.cr.commit()
             log_line = self.env['common.log.lines.ept']
             queue.write({'is_process_queue': True})
-            lines = queue.line_ids.filtered(lambda l: l.state == 'draft')
             queue.write({'process_count': queue.process_count + 1})
             if not is_manual and queue.process_count >= 3:
                 note = f"Attention {queue.name} Customer Queue are processed 3 times and it failed. \n" \
@@ -80,24 +93,31 @@ class MagentoExportStockQueueEpt(models.Model):
                 queue.instance_id.enable_action_required_message(queue=queue)
                 queue.instance_id.create_schedule_activity(queue=queue, note=note)
                 queue.write({'is_process_queue': False})
-            if queue.instance_id.magento_version in ['2.1',
-                                                     '2.2'] or not queue.instance_id.is_multi_warehouse_in_magento:
-                # This condition is checked for verify the Magento version.
-                # We only call this method for NON MSI magento versions. If customer using
-                # Magento version 2.3+ and not using the MSI functionality then also this method
-                # will be called.
-                api_url = "/V1/product/updatestock"
-            else:
-                api_url = "/V1/inventory/source-items"
-
-            lines.process_export_stock_queue_line(api_url, log_line)
+            queue_start = time.time()
+            # The payload of a line is decoded once, to check it and to export it.
+            lines.with_payload_cache().process_export_stock_queue_line(api_url, log_line)
+            sizing = self.env['magento.queue.sizing'].get_sizing(queue.instance_id, 'export_stock')
+            sizing.record_processing(len(lines), time.time() - queue_start)
             message = "Export Stock Queue #{} Processed!!".format(queue.name)
             queue.instance_id.show_popup_notification(message)
             # To maintain that current queue process are completed and new queue will be executed.
             queue.write({'is_process_queue': False})
+            lines.release_lines()
             self.env.cr.commit()
         return True
 
+    def get_export_stock_api_url(self):
+        """
+        Return the export stock API URL of the instance of the queue.
+        """
+        if self.instance_id.magento_version in ['2.1', '2.2'] or not self.instance_id.is_multi_warehouse_in_magento:
+            # This condition is checked for verify the Magento version.
+            # We only call this method for NON MSI magento versions. If customer using
+            # Magento version 2.3+ and not using the MSI functionality then also this method
+            # will be called.
+            return "/V1/product/updatestock"
+        return "/V1/inventory/source-items"
+
     @api.model
     def retrieve_dashboard(self, *args, **kwargs):
         dashboard = self.env['queue.line.dashboard']
@@ -1,6 +1,8 @@
-import json
 from datetime import datetime
 from odoo import models, fields
+from .api_request import is_circuit_open
+from .group_commit import GroupCommit
+from .queue_payload import CLEAR_PAYLOAD
 
 
 class MagentoExportStockLineEpt(models.Model):
@@ -8,15 +10,17 @@ class MagentoExportStockLineEpt(models.Model):
     Describes Export Stock Data Queue Line
     """
     _name = "magento.export.stock.queue.line.ept"
+    _inherit = ['magento.queue.line.claim', 'magento.queue.payload']
     _description = "Magento Export Stock Queue Line"
 
     queue_id = fields.Many2one(comodel_name='magento.export.stock.queue.ept', ondelete="cascade")
     instance_id = fields.Many2one(comodel_name='magento.instance',
                                   string='Magento Instance',
                                   help="Export Stock from this Magento Instance.")
-    state = fields.Selection([("draft", "Draft"), ("failed", "Failed"),
+    state = fields.Selection([("draft", "Draft"), ("submitted", "Submitted"), ("failed", "Failed"),
                               ("done", "Done"), ("cancel", "Cancelled")], default="draft",
-                             copy=False)
+                             copy=False, help="Submitted: sent to the Magento bulk API, done or failed once "
+                                              "the bulk request is checked.")
     data = fields.Text(string="Data", copy=False,
                        help="Data imported from Magento of current customer.")
     processed_at = fields.Datetime(string="Process Time", copy=False,
@@ -32,9 +36,9 @@ class MagentoExportStockLineEpt(models.Model):
         """
         self.create({
             'instance_id': instance.id,
-            'data': json.dumps(data),
             'queue_id': queue.id,
             'state': 'draft',
+            **self._prepare_payload_vals(data),
         })
         return True
 
@@ -43,7 +47,9 @@ class MagentoExportStockLineEpt(models.Model):
         Cron execute time run this method.
         :return: True
         """
+        # Lines claimed by another worker are left to it.
         query = """ SELECT queue_id FROM magento_export_stock_queue_line_ept WHERE state = 'draft'
+                    AND (claim_expires_at IS NULL OR claim_expires_at < (now() at time zone 'UTC'))
                     GROUP BY queue_id, create_date
                     ORDER BY create_date ASC
                 """
@@ -60,16 +66,58 @@ class MagentoExportStockLineEpt(models.Model):
         :param log_line: Log line object
         :return: True
         """
-        magento_product = self.env['magento.product.product']
+        if self and self[0].instance_id.magento_api_transport == 'async':
+            return self._process_export_stock_queue_line_async(api_url)
+        group_commit = GroupCommit(self.env, self[:1].instance_id)
+        magento_product = group_commit.get_env(self.env['magento.product.product'])
         for line in self:
-            input_data = json.loads(line.data)
+            if is_circuit_open(line.instance_id, api_url):
+                break
+            input_data = line.get_payload()
             if not input_data.get('sourceItems') == []:
-                is_processed = magento_product.export_magento_stock(line, api_url, log_line)
+                is_done, is_processed = group_commit.run(magento_product.export_magento_stock, line, api_url,
+                                                         log_line)
+                if not is_done:
+                    log_line.create_common_log_line_ept(
+                        message="Stock could not be exported: {}".format(is_processed), module='magento_ept',
+                        model_name=line._name, res_id=line.id, magento_instance_id=line.instance_id.id)
+                    is_processed = False
                 if is_processed:
-                    line.write({'state': 'done', 'processed_at': datetime.now(), 'data': False})
+                    line.write({'state': 'done', 'processed_at': datetime.now(), **CLEAR_PAYLOAD})
                 else:
                     line.write({'state': 'failed', 'processed_at': datetime.now()})
+                    line.forget_payload()
             else:
-                line.write({'state': 'done', 'processed_at': datetime.now(), 'data': False})
-            self.env.cr.commit()
+                line.write({'state': 'done', 'processed_at': datetime.now(), **CLEAR_PAYLOAD})
+            group_commit.line_done()
+        group_commit.commit()
         return True
+
+    def _process_export_stock_queue_line_async(self, api_url):
+        """
+        Send the lines in one request of the asynchronous bulk API of Magento, one operation per
+        line. The lines are submitted and keep their data until the bulk request is checked.
+        :param api_url: Export stock url MSI or Non MSI
+        :return: True
+        """
+        instance = self[0].instance_id
+        method = 'POST' if instance.is_multi_warehouse_in_magento else 'PUT'
+        lines = self.sorted('id').filtered(lambda l: l.get_payload().get('sourceItems') != [])
+        (self - lines).write({'state': 'done', 'processed_at': datetime.now(), **CLEAR_PAYLOAD})
+        if lines:
+            payloads = [line.get_payload() for line in lines]
+            self.env['magento.bulk.request'].submit_bulk_request(instance, api_url, method, payloads,
+                                                                 'stock', stock_lines=lines)
+            # The lines rejected by Magento are already failed.
+            lines.filtered(lambda l: l.state == 'draft').write({'state': 'submitted',
+                                                                'processed_at': datetime.now()})
+        self.env.cr.commit()
+        return True
+
+    def get_payload_skus(self):
+        """
+        Return the SKUs of the stock items of the line.
+        """
+        self.ensure_one()
+        return {str(item.get('sku')) for items in self.get_payload().values() if isinstance(items, list)
+                for item in items if isinstance(item, dict) and item.get('sku')}
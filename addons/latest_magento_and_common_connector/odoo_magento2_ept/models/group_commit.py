@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the group commit of the queue processors.
+"""
+import logging
+import time
+
+_logger = logging.getLogger("Magento EPT")
+
+
+class GroupCommit:
+    """
+    Commits the processed queue lines every few lines or seconds, as set in the instance, instead
+    of after each line. Each line is then processed in a savepoint: an error rolls back only the
+    changes of that line, which the caller marks as failed. With one line per commit, the lines
+    are processed and committed one by one as before, unless a savepoint is asked for each line.
+    """
+
+    def __init__(self, env, instance, savepoint=False):
+        self.env = env
+        self.commit_lines = max(instance.magento_commit_lines, 1)
+        self.commit_seconds = max(instance.magento_commit_seconds, 0)
+        self.savepoint = savepoint
+        self.pending = 0
+        self.committed_at = time.monotonic()
+
+    @property
+    def is_grouped(self):
+        return self.commit_lines > 1 or self.savepoint
+
+    def get_env(self, records):
+        """
+        Return the records with the context telling the processing methods not to commit.
+        """
+        return records.with_context(magento_group_commit=True) if self.is_grouped else records
+
+    def run(self, function, *args, **kwargs):
+        """
+        Call the function processing a line.
+        :return: (True, result of the function) or (False, error) when the line is rolled back
+        """
+        if not self.is_grouped:
+            return True, function(*args, **kwargs)
+        try:
+            with self.env.cr.savepoint():
+                return True, function(*args, **kwargs)
+        except Exception as error:
+            _logger.exception("Magento queue line rolled back")
+            self.env.invalidate_all()
+            return False, error
+
+    def line_done(self):
+        """
+        Count a processed line and commit when the lines or seconds of a group are reached.
+        """
+        self.pending += 1
+        if self.pending >= self.commit_lines or time.monotonic() - self.committed_at >= self.commit_seconds:
+            self.commit()
+        return True
+
+    def commit(self):
+        if self.pending:
+            self.env.cr.commit()
+        self.pending = 0
+        self.committed_at = time.monotonic()
+        return True
+
+
+def commit_line(env):
+    """
+    Commit the current line, unless the lines are committed by group.
+    """
+    if not env.context.get('magento_group_commit'):
+        env.cr.commit()
+    return True
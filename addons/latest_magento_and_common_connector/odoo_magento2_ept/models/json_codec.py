@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the JSON codec of the connector and the compression of the queue payloads. It only
+uses the Python standard library, and orjson, ujson or zstandard when they are installed, so
+the benchmarks can load it without Odoo.
+"""
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+
+def _stdlib_dumps(value, sort_keys=False, indent=None, default=None):
+    separators = None if indent else (',', ':')
+    return json.dumps(value, sort_keys=sort_keys, indent=indent, default=default, separators=separators)
+
+
+def _orjson_loads(data):
+    try:
+        return orjson.loads(data)
+    except ValueError:
+        # orjson refuses the documents accepted by json, like NaN numbers.
+        return json.loads(data)
+
+
+def _orjson_dumps(value, sort_keys=False, indent=None, default=None):
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    try:
+        return orjson.dumps(value, default=default, option=option).decode('utf-8')
+    except TypeError:
+        # Integers of more than 64 bits and the types unknown to orjson.
+        return _stdlib_dumps(value, sort_keys, indent, default)
+
+
+def _ujson_loads(data):
+    try:
+        return ujson.loads(data)
+    except ValueError:
+        return json.loads(data)
+
+
+def _ujson_dumps(value, sort_keys=False, indent=None, default=None):
+    if default:
+        return _stdlib_dumps(value, sort_keys, indent, default)
+    try:
+        return ujson.dumps(value, sort_keys=sort_keys, indent=indent or 0, escape_forward_slashes=False)
+    except (TypeError, OverflowError):
+        return _stdlib_dumps(value, sort_keys, indent, default)
+
+
+# Codecs by name, the first installed one is used.
+CODECS = {
+    'orjson': (_orjson_loads, _orjson_dumps),
+    'ujson': (_ujson_loads, _ujson_dumps),
+    'json': (_stdlib_loads, _stdlib_dumps),
+}
+_codec = {'name': 'orjson' if orjson else 'ujson' if ujson else 'json'}
+
+
+def get_codec():
+    return _codec['name']
+
+
+def set_codec(name):
+    """
+    Use the codec of the given name, like json to compare with the standard library.
+    """
+    if name not in CODECS or (name == 'orjson' and not orjson) or (name == 'ujson' and not ujson):
+        raise ValueError("The JSON codec {} is not installed.".format(name))
+    _codec['name'] = name
+    return name
+
+
+def loads(data):
+    """
+    Return the value of a JSON document given as str or bytes.
+    """
+    return CODECS[_codec['name']][0](data)
+
+
+def dumps(value, sort_keys=False, indent=None, default=None):
+    """
+    Return the JSON document of the value, without spaces unless it is indented.
+    """
+    return CODECS[_codec['name']][1](value, sort_keys=sort_keys, indent=indent, default=default)
+
+
+def get_compression():
+    """
+    Return the name of the compression used for the new payloads.
+    """
+    return 'zstd' if zstandard else 'zlib'
+
+
+def compress_payload(payload, compression=None):
+    """
+    Return the payload as compressed JSON, with zstd when zstandard is installed, else zlib.
+    :param payload: JSON serializable value
+    :param compression: 'zstd' or 'zlib', the default one when not given
+    """
+    raw = dumps(payload).encode('utf-8')
+    if (compression or get_compression()) == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress_payload(blob):
+    """
+    Return the payload of compressed JSON. The compression is found from the header of the data,
+    so the payloads compressed with zlib are still read once zstandard is installed.
+    """
+    blob = bytes(blob)
+    if blob[:4] == ZSTD_MAGIC:
+        if not zstandard:
+            raise ValueError("The payload is compressed with zstd, the zstandard library is not installed.")
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    else:
+        raw = zlib.decompress(blob)
+    return loads(raw)
@@ -0,0 +1,123 @@
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the statistics of the calls sent to the Magento API.
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from odoo import models, fields, api
+from .api_request import flush_api_stats, restore_api_stats, merge_api_stats, get_latency_percentile
+from .json_codec import dumps, loads
+
+_logger = logging.getLogger("MagentoEPT")
+
+STATS_RETENTION_DAYS = 30
+
+
+class MagentoApiStats(models.Model):
+    """
+    Calls of an endpoint of an instance aggregated per time bucket. The calls are counted in the
+    memory of each worker by req() and written here in one transaction at most once a minute.
+    """
+    _name = "magento.api.stats"
+    _description = "Magento API Statistics"
+    _rec_name = 'endpoint'
+    _order = 'bucket_start desc, endpoint'
+
+    magento_instance_id = fields.Many2one(comodel_name='magento.instance', string='Magento Instance',
+                                          required=True, ondelete='cascade', index=True)
+    bucket_start = fields.Datetime(string="Period Start", required=True, index=True)
+    endpoint = fields.Char(required=True, help="Path of the API, with the ids replaced by placeholders.")
+    method = fields.Char(required=True)
+    call_count = fields.Integer(string="Calls", aggregator='sum')
+    error_count = fields.Integer(string="Errors", aggregator='sum',
+                                 help="Calls failed on the network or answered with HTTP 4xx or 5xx.")
+    status_codes = fields.Text(string="Status Codes", help="Number of calls per HTTP status, 0 for "
+                                                           "network errors.")
+    bytes_sent = fields.Float(string="Bytes Sent", aggregator='sum', digits=(16, 0))
+    bytes_received = fields.Float(string="Bytes Received", aggregator='sum', digits=(16, 0))
+    total_duration = fields.Float(string="Total Duration (s)", aggregator='sum', digits=(16, 3))
+    avg_latency = fields.Float(string="Average Latency (ms)", aggregator='avg', digits=(16, 1))
+    max_latency = fields.Float(string="Max Latency (ms)", aggregator='max', digits=(16, 1))
+    p50_latency = fields.Float(string="P50 Latency (ms)", aggregator='avg', digits=(16, 1))
+    p95_latency = fields.Float(string="P95 Latency (ms)", aggregator='max', digits=(16, 1))
+    p99_latency = fields.Float(string="P99 Latency (ms)", aggregator='max', digits=(16, 1))
+    latency_histogram = fields.Text(string="Latency Histogram",
+                                    help="Number of calls per latency bucket, see LATENCY_BUCKETS.")
+
+    _magento_api_stats_unique_constraint = models.Constraint(
+        'unique(magento_instance_id,bucket_start,endpoint,method)',
+        "API statistics must be unique per instance, period, endpoint and method")
+
+    @api.model
+    def store_api_stats(self, entries):
+        """
+        Merge the statistics taken from the buffer of the worker into the stored buckets.
+        A separate cursor is used, so the caller's transaction is neither committed nor blocked.
+        When the write fails, the statistics are put back in the buffer for the next flush.
+        :param entries: dict of {(instance id, bucket, endpoint, method): stats}
+        """
+        dbname = self.env.cr.dbname
+        try:
+            with self.env.registry.cursor() as cr:
+                stats_obj = self.with_env(self.env(cr=cr))
+                for (instance_id, bucket, endpoint, method), stats in entries.items():
+                    stats_obj._merge_api_stats(instance_id, bucket, endpoint, method, stats)
+        except Exception as error:
+            _logger.warning("Unable to store the Magento API statistics: %s", error)
+            restore_api_stats(dbname, entries)
+        return True
+
+    def _merge_api_stats(self, instance_id, bucket, endpoint, method, stats):
+        bucket_start = datetime.fromtimestamp(bucket, timezone.utc).replace(tzinfo=None)
+        record = self.search([('magento_instance_id', '=', instance_id), ('bucket_start', '=', bucket_start),
+                              ('endpoint', '=', endpoint), ('method', '=', method)], limit=1)
+        if record:
+            stats = merge_api_stats(record._get_api_stats(), stats)
+        histogram = stats.get('histogram')
+        values = {
+            'call_count': stats.get('count'),
+            'error_count': stats.get('error_count'),
+            'status_codes': dumps(dict(stats.get('status')), sort_keys=True),
+            'bytes_sent': stats.get('sent'),
+            'bytes_received': stats.get('received'),
+            'total_duration': stats.get('duration'),
+            'avg_latency': stats.get('duration') * 1000 / stats.get('count') if stats.get('count') else 0.0,
+            'max_latency': stats.get('max'),
+            'p50_latency': get_latency_percentile(histogram, 50, stats.get('max')),
+            'p95_latency': get_latency_percentile(histogram, 95, stats.get('max')),
+            'p99_latency': get_latency_percentile(histogram, 99, stats.get('max')),
+            'latency_histogram': dumps(histogram),
+        }
+        if record:
+            record.write(values)
+        else:
+            values.update({'magento_instance_id': instance_id, 'bucket_start': bucket_start,
+                           'endpoint': endpoint, 'method': method})
+            record = self.create(values)
+        return record
+
+    def _get_api_stats(self):
+        """
+        Return the stored bucket in the format of the worker buffer.
+        """
+        self.ensure_one()
+        return {
+            'count': self.call_count,
+            'error_count': self.error_count,
+            'status': Counter(loads(self.status_codes or '{}')),
+            'sent': self.bytes_sent,
+            'received': self.bytes_received,
+            'duration': self.total_duration,
+            'max': self.max_latency,
+            'histogram': loads(self.latency_histogram or '[]'),
+        }
+
+    @api.model
+    def _cron_flush_api_stats(self):
+        """
+        Store the statistics of the cron worker and remove the buckets older than the retention.
+        """
+        flush_api_stats(self.env, force=True)
+        self.search([('bucket_start', '<', datetime.now() - timedelta(days=STATS_RETENTION_DAYS))]).unlink()
+        return True
@@ -0,0 +1,247 @@
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the requests sent to the asynchronous bulk API of Magento.
+"""
+import logging
+from datetime import datetime, timedelta
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from .api_request import req
+from .json_codec import dumps, loads
+from .queue_payload import CLEAR_PAYLOAD
+
+_logger = logging.getLogger("MagentoEPT")
+
+# Status of the bulk operations returned by /V1/bulk/{uuid}/detailed-status.
+OPERATION_COMPLETE = 1
+OPERATION_OPEN = 4
+BULK_OPERATIONS = [('stock', 'Export Stock'), ('price', 'Export Price'), ('product', 'Update Product')]
+# Requests without a result after this delay are failed, like the unknown or expired UUIDs.
+BULK_TIMEOUT = timedelta(hours=24)
+
+
+class MagentoBulkRequest(models.Model):
+    """
+    Describes a request accepted by the asynchronous bulk API of Magento. Magento processes the
+    operations of the request with its message queue consumers, the result of each operation is
+    checked later with the bulk UUID and reported in the queue lines and the log lines.
+    """
+    _name = "magento.bulk.request"
+    _description = "Magento Bulk Request"
+    _rec_name = 'bulk_uuid'
+    _order = 'id desc'
+
+    bulk_uuid = fields.Char(string="Bulk UUID", readonly=True, help="UUID given by Magento to the request.")
+    magento_instance_id = fields.Many2one(comodel_name='magento.instance', string='Magento Instance',
+                                          ondelete='cascade', readonly=True)
+    operation = fields.Selection(BULK_OPERATIONS, readonly=True)
+    api_url = fields.Char(string="API URL", readonly=True)
+    state = fields.Selection([('open', 'Open'), ('done', 'Done'), ('failed', 'Failed')], default='open',
+                             readonly=True)
+    operation_count = fields.Integer(readonly=True, help="Number of operations of the request.")
+    failed_count = fields.Integer(readonly=True, help="Number of operations rejected or failed in Magento.")
+    last_checked_at = fields.Datetime(string="Last Checked At", readonly=True)
+    export_stock_line_ids = fields.Many2many('magento.export.stock.queue.line.ept',
+                                             string="Export Stock Queue Lines", readonly=True,
+                                             help="Queue lines sent in the request, one operation each.")
+    request_items = fields.Text(string="Request Items", readonly=True,
+                                help="Queue line of each request item id given by Magento.")
+
+    @api.model
+    def submit_bulk_request(self, instance, api_url, method, payloads, operation, stock_lines=False):
+        """
+        Send the payloads to the asynchronous bulk endpoint of the API URL, one operation each.
+        :param instance: magento.instance()
+        :param api_url: Synchronous API URL, like /V1/inventory/source-items or /all/V1/products/sku
+        :param method: API method
+        :param payloads: list of request bodies
+        :param operation: Key of BULK_OPERATIONS
+        :param stock_lines: Export stock queue lines of the payloads, in the same order
+        :return: magento.bulk.request()
+        """
+        bulk_url = get_async_path(api_url, is_bulk=True)
+        response = req(instance, bulk_url, method, payloads, is_raise=True)
+        if not isinstance(response, dict) or not response.get('bulk_uuid'):
+            raise UserError(_("Magento did not accept the bulk request %s: %s", bulk_url, response))
+        request_items = response.get('request_items', [])
+        rejected = [item for item in request_items if item.get('status') == 'rejected']
+        # The request items are numbered as the payloads of the request.
+        item_lines = {}
+        if stock_lines:
+            item_lines = {str(item.get('id')): stock_lines[int(item.get('id'))].id for item in request_items
+                          if str(item.get('id')).isdigit() and int(item.get('id')) < len(stock_lines)}
+            rejected_lines = stock_lines.browse([item_lines[str(item.get('id'))] for item in rejected
+                                                 if str(item.get('id')) in item_lines])
+            rejected_lines.write({'state': 'failed', 'processed_at': datetime.now()})
+            for line in rejected_lines:
+                self.env['common.log.lines.ept'].create_common_log_line_ept(
+                    message=_("Magento rejected the stock of the bulk request %s.", response.get('bulk_uuid')),
+                    module='magento_ept', operation_type='export', model_name=self._name,
+                    magento_export_stock_queue_line_id=line.id, magento_instance_id=instance.id)
+        return self.create({
+            'bulk_uuid': response.get('bulk_uuid'),
+            'magento_instance_id': instance.id,
+            'operation': operation,
+            'api_url': bulk_url,
+            'operation_count': len(payloads),
+            'failed_count': len(rejected),
+            'export_stock_line_ids': [(6, 0, stock_lines.ids)] if stock_lines else False,
+            'request_items': dumps(item_lines) if item_lines else False,
+        })
+
+    @api.model
+    def submit_async_request(self, instance, api_url, method, payload, operation):
+        """
+        Send a single payload to the asynchronous endpoint of the API URL.
+        """
+        async_url = get_async_path(api_url)
+        response = req(instance, async_url, method, payload, is_raise=True)
+        if not isinstance(response, dict) or not response.get('bulk_uuid'):
+            raise UserError(_("Magento did not accept the bulk request %s: %s", async_url, response))
+        return self.create({
+            'bulk_uuid': response.get('bulk_uuid'),
+            'magento_instance_id': instance.id,
+            'operation': operation,
+            'api_url': async_url,
+            'operation_count': 1,
+        })
+
+    @api.model
+    def _cron_check_bulk_requests(self):
+        """
+        Check the result of the open bulk requests, called from cron job.
+        """
+        self.search([('state', '=', 'open')], order='id').check_bulk_status()
+        return True
+
+    def check_bulk_status(self):
+        """
+        Read the detailed status of the requests in Magento. The queue lines of failed operations
+        are set to failed with a log line, the others are done. Requests with open operations
+        are checked again later, until BULK_TIMEOUT. Each operation is matched to its line by the
+        SKUs echoed in the operation, else by its id, never by its position. The submitted lines
+        without a result are set to failed.
+        """
+        log_line = self.env['common.log.lines.ept']
+        for bulk in self:
+            instance = bulk.magento_instance_id
+            is_expired = bulk.create_date < fields.Datetime.now() - BULK_TIMEOUT
+            try:
+                status = req(instance, '/V1/bulk/%s/detailed-status' % bulk.bulk_uuid, is_raise=True)
+            except Exception as error:
+                _logger.error("Unable to check bulk request %s: %s", bulk.bulk_uuid, error)
+                if is_expired:
+                    bulk._fail_expired_request()
+                continue
+            operations = status.get('operations_list', []) if isinstance(status, dict) else []
+            if not operations or any(op.get('status') == OPERATION_OPEN for op in operations):
+                if is_expired:
+                    bulk._fail_expired_request()
+                else:
+                    bulk.write({'last_checked_at': datetime.now()})
+                continue
+            lines = bulk.export_stock_line_ids.filtered(lambda l: l.state == 'submitted')
+            find_line = bulk._get_operation_line_finder(lines)
+            failed_count = 0
+            for op in operations:
+                line = find_line(op)
+                lines -= line
+                if op.get('status') == OPERATION_COMPLETE:
+                    if line:
+                        line.write({'state': 'done', 'processed_at': datetime.now(), **CLEAR_PAYLOAD})
+                    continue
+                failed_count += 1
+                message = _("Magento bulk request %s, operation %s failed: %s",
+                            bulk.bulk_uuid, op.get('id'), op.get('result_message') or op.get('error_code'))
+                log_line.create_common_log_line_ept(message=message, module='magento_ept',
+                                                    operation_type='export', model_name=self._name,
+                                                    magento_export_stock_queue_line_id=line.id,
+                                                    magento_instance_id=instance.id)
+                if line:
+                    line.write({'state': 'failed', 'processed_at': datetime.now()})
+            for line in lines:
+                failed_count += 1
+                log_line.create_common_log_line_ept(
+                    message=_("Magento bulk request %s has no result for this stock.", bulk.bulk_uuid),
+                    module='magento_ept', operation_type='export', model_name=self._name,
+                    magento_export_stock_queue_line_id=line.id, magento_instance_id=instance.id)
+            lines.write({'state': 'failed', 'processed_at': datetime.now()})
+            bulk.write({
+                'state': 'failed' if failed_count else 'done',
+                'failed_count': failed_count,
+                'last_checked_at': datetime.now()
+            })
+            self.env.cr.commit()
+        return True
+
+    def _fail_expired_request(self):
+        """
+        Fail the request and its submitted lines when Magento gave no result in time.
+        """
+        self.ensure_one()
+        lines = self.export_stock_line_ids.filtered(lambda l: l.state == 'submitted')
+        for line in lines:
+            self.env['common.log.lines.ept'].create_common_log_line_ept(
+                message=_("Magento bulk request %s has no result after %s hours.", self.bulk_uuid,
+                          int(BULK_TIMEOUT.total_seconds() // 3600)),
+                module='magento_ept', operation_type='export', model_name=self._name,
+                magento_export_stock_queue_line_id=line.id, magento_instance_id=self.magento_instance_id.id)
+        lines.write({'state': 'failed', 'processed_at': datetime.now()})
+        self.write({'state': 'failed', 'failed_count': self.operation_count, 'last_checked_at': datetime.now()})
+        self.env.cr.commit()
+        return True
+
+    def _get_operation_line_finder(self, lines):
+        """
+        Return a function giving the queue line of an operation of the detailed status.
+        :param lines: Submitted queue lines of the request
+        """
+        self.ensure_one()
+        sku_lines = {}
+        for line in lines:
+            for sku in line.get_payload_skus():
+                sku_lines[sku] = line
+        item_lines = {key: lines.browse(line_id) & lines for key, line_id in
+                      loads(self.request_items or '{}').items()}
+
+        def find_line(op):
+            found = lines.browse({sku_lines[sku].id for sku in get_operation_skus(op) if sku in sku_lines})
+            if len(found) == 1:
+                return found
+            # Recent Magento versions number the operations as the request items.
+            return item_lines.get(str(op.get('id')), lines.browse()) if not found else lines.browse()
+        return find_line
+
+
+def get_operation_skus(op):
+    """
+    Return the SKUs found in the data of a bulk operation. The request body is kept by Magento as
+    JSON in the meta information of the serialized data.
+    """
+    skus = set()
+    pending = [op.get('serialized_data'), op.get('result_serialized_data')]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, str) and value[:1] in ('{', '['):
+            try:
+                value = loads(value)
+            except ValueError:
+                continue
+        if isinstance(value, dict):
+            if value.get('sku') and not isinstance(value.get('sku'), (dict, list)):
+                skus.add(str(value.get('sku')))
+            pending += list(value.values())
+        elif isinstance(value, list):
+            pending += value
+    return skus
+
+
+def get_async_path(api_url, is_bulk=False):
+    """
+    Return the asynchronous endpoint of the API URL, keeping the store code prefix.
+    Like /all/V1/products/sku to /all/async/V1/products/sku
+    or /V1/inventory/source-items to /async/bulk/V1/inventory/source-items
+    """
+    prefix, _sep, route = api_url.partition('/V1/')
+    async_prefix = '/async/bulk' if is_bulk else '/async'
+    return '{}{}/V1/{}'.format(prefix, async_prefix, route)
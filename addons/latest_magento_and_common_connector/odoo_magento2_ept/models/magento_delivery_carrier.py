@@ -11,6 +11,7 @@ class MagentoDeliveryCarrier(models.Model):
     Model for Magento's carriers.
     """
     _name = 'magento.delivery.carrier'
+    _inherit = ['magento.reference.data.mixin']
     _rec_name = 'carrier_code'
     _description = 'Magento Delivery Carrier'
 
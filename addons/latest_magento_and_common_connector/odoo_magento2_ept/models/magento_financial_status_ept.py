@@ -2,10 +2,12 @@
 # See LICENSE file for full copyright and licensing details.
 
 from odoo import models, fields
+from .order_reference_cache import get_reference_cache
 
 
 class MagentoFinancialStatusEpt(models.Model):
     _name = "magento.financial.status.ept"
+    _inherit = ['magento.reference.data.mixin']
     _description = 'Magento Financial Status'
 
     def _default_payment_term(self):
@@ -115,16 +117,21 @@ class MagentoFinancialStatusEpt(models.Model):
         :param payment_option: Magento Order Payment Method
         :return: Financial Status object, Financial Status Name
         """
+        cache = get_reference_cache(self.env)
         order_status_ojb = self.env['magento.order.status.ept']
-        mapped_order_status = order_status_ojb.search([('magento_instance_id', '=', magento_instance.id),
-                  ('m_order_status_code', '=', order_response.get('status'))])
+        mapped_order_status = cache.get(
+            ('order_status', magento_instance.id, order_response.get('status')),
+            lambda: order_status_ojb.search([('magento_instance_id', '=', magento_instance.id),
+                                             ('m_order_status_code', '=', order_response.get('status'))]))
 
         is_invoice = order_response.get('extension_attributes').get('is_invoice')
         is_shipment = order_response.get('extension_attributes').get('is_shipment')
         status_name = self.__get_status_name(mapped_order_status.main_status, is_invoice, is_shipment)
         status_code = self.__get_status_code(mapped_order_status.main_status, is_invoice, is_shipment)
-        workflow_config = self.env['magento.financial.status.ept'].search(
-            [('magento_instance_id', '=', magento_instance.id),
-             ('payment_method_id', '=', payment_option.id),
-             ('financial_status', '=', status_code)])
+        workflow_config = cache.get(
+            ('financial_status', magento_instance.id, payment_option.id, status_code),
+            lambda: self.env['magento.financial.status.ept'].search(
+                [('magento_instance_id', '=', magento_instance.id),
+                 ('payment_method_id', '=', payment_option.id),
+                 ('financial_status', '=', status_code)]))
         return {'workflow': workflow_config, 'status_name': status_name}
@@ -3,14 +3,15 @@
 """
 Describes methods for Magento Instance
 """
-import json
 import logging
 from calendar import monthrange
 from datetime import date, datetime, timedelta
-from odoo import models, fields, api, _
+from odoo import models, fields, api, _, Command
 from odoo.exceptions import UserError
 from odoo.tools import ustr
-from .api_request import req
+from .api_request import req, close_session
+from .json_codec import dumps
+from .magento_queue_sizing import QUEUE_STREAMS
 
 _secondsConverter = {
     'days': lambda interval: interval * 24 * 60 * 60,
@@ -28,6 +29,14 @@ class MagentoInstance(models.Model):
     _name = 'magento.instance'
     _description = 'Magento Instance'
 
+    @api.model
+    def _default_queue_sizings(self):
+        """
+        The sizing of each stream is created with the instance, the workers never create it.
+        """
+        return [Command.create({'stream': stream, 'queue_size': queue_size, 'page_size': page_size})
+                for stream, (_cron, queue_size, page_size) in QUEUE_STREAMS.items()]
+
     @api.model
     def _default_set_import_product_category(self):
         return self.env.ref('product.product_category_services').id \
@@ -257,6 +266,83 @@ class MagentoInstance(models.Model):
     # Export Product
     batch_size = fields.Integer(string="Export Stock Batch Size", default=200,
                                 help="Export product batch size.")
+    # API Connection
+    magento_api_pool_size = fields.Integer(string="API Connection Pool Size", default=10,
+                                           help="Maximum number of keep-alive connections kept open "
+                                                "to Magento for this instance.")
+    magento_api_connect_timeout = fields.Integer(string="API Connect Timeout", default=10,
+                                                 help="Seconds to wait while opening a connection to "
+                                                      "Magento.")
+    magento_api_read_timeout = fields.Integer(string="API Read Timeout", default=120,
+                                              help="Seconds to wait for Magento to answer a request.")
+    magento_api_rate_limit = fields.Float(string="API Requests Per Second", default=0.0,
+                                          help="Maximum requests per second sent to Magento for this "
+                                               "instance. Set 0 to disable the limit.")
+    magento_api_max_retries = fields.Integer(string="API Retries", default=3,
+                                             help="Number of times a GET request is retried when "
+                                                  "Magento is busy (HTTP 429, 502, 503, 504) or the "
+                                                  "network fails.")
+    magento_api_breaker_threshold = fields.Integer(string="API Failures Before Pause", default=5,
+                                                   help="Consecutive network errors or server errors (HTTP "
+                                                        "5xx) of an API endpoint after which the calls to "
+                                                        "it are paused. Set 0 to never pause.")
+    magento_api_breaker_cooldown = fields.Integer(string="API Pause Duration", default=300,
+                                                  help="Seconds during which the calls to a failing API "
+                                                       "endpoint are paused. A single call is then sent "
+                                                       "to check if Magento is back.")
+    magento_api_stats = fields.Boolean(string="Collect API Statistics", default=True,
+                                       help="Count the calls, errors, bytes and latency of each Magento API "
+                                            "endpoint per 15 minutes.")
+    magento_sync_skew_margin = fields.Integer(string="Sync Clock Skew Margin", default=300,
+                                              help="Seconds subtracted from the last imported change "
+                                                   "date by the scheduled imports, to catch the records "
+                                                   "saved late by Magento. The imports by pages read "
+                                                   "the last 10 hours again. Records already imported "
+                                                   "are skipped.")
+    magento_api_field_projection = fields.Boolean(string="Download Only Used Fields", default=True,
+                                                  help="Orders, products and customers are downloaded "
+                                                       "with only the fields read by the connector. "
+                                                       "Disable it to download and store the full "
+                                                       "Magento records.")
+    magento_api_pagination = fields.Selection([('page', 'Page Number'), ('cursor', 'Entity ID Cursor')],
+                                              string="API Pagination", default='page',
+                                              help="Page Number: orders and products are downloaded by page "
+                                                   "number, several pages at the same time.\n"
+                                                   "Entity ID Cursor: each page asks for the records after "
+                                                   "the last imported id. Slower Magento queries on deep "
+                                                   "pages and records updated during the import are "
+                                                   "avoided.")
+    magento_api_transport = fields.Selection([('sync', 'Synchronous'), ('async', 'Magento Bulk API')],
+                                             string="Export Transport", default='sync',
+                                             help="Synchronous: stock, prices and products are exported "
+                                                  "one request at a time and the result is known at once.\n"
+                                                  "Magento Bulk API: the exports are queued in Magento with "
+                                                  "the asynchronous bulk API and the results are checked "
+                                                  "later by the scheduler. Magento message queue consumers "
+                                                  "must be running.")
+    magento_api_page_workers = fields.Integer(string="Parallel Page Downloads", default=4,
+                                              help="Number of result pages downloaded at the same time "
+                                                   "while importing orders, products, customers and "
+                                                   "attributes.")
+    magento_commit_lines = fields.Integer(string="Queue Lines Per Commit", default=1,
+                                          help="Processed order, product and export stock queue lines are "
+                                               "saved together every this many lines. Each line is processed "
+                                               "in a savepoint, a failing line alone is rolled back and marked "
+                                               "failed. Set 1 to save each line at once.")
+    magento_commit_seconds = fields.Integer(string="Seconds Between Commits", default=10,
+                                            help="Processed queue lines are also saved after this many "
+                                                 "seconds, when less lines than the lines per commit are "
+                                                 "processed.")
+    magento_bulk_order_create = fields.Boolean(string="Create Orders In Bulk", default=False,
+                                               help="Order queue lines are first checked one by one, with their "
+                                                    "customers, carriers, taxes and products, then the orders of "
+                                                    "the valid lines are created together. A line failing its "
+                                                    "check is marked failed, the others are still imported.")
+    magento_queue_sizing_ids = fields.One2many(comodel_name="magento.queue.sizing",
+                                               inverse_name="magento_instance_id", string="Queue Sizing",
+                                               default=_default_queue_sizings,
+                                               help="Queue size and page size of the imports and exports. "
+                                                    "A stream without a line uses the default sizes.")
     magento_analytic_account_id = fields.Many2one('account.analytic.account',
                                                   string='Analytic Account')
     is_magento_digest = fields.Boolean(string="Set Magento Digest?")
@@ -291,6 +377,22 @@ class MagentoInstance(models.Model):
         if self.batch_size < 0 or self.batch_size > 300:
             raise UserError("Export stock batch size will only allow the 0-300 batch size value.")
 
+    @api.onchange('magento_api_pool_size', 'magento_api_connect_timeout', 'magento_api_read_timeout',
+                  'magento_api_rate_limit', 'magento_api_max_retries', 'magento_api_page_workers',
+                  'magento_sync_skew_margin', 'magento_api_breaker_threshold', 'magento_api_breaker_cooldown',
+                  'magento_commit_lines', 'magento_commit_seconds')
+    def _onchange_magento_api_connection(self):
+        if self.magento_api_pool_size < 1 or self.magento_api_connect_timeout < 1 or \
+                self.magento_api_read_timeout < 1 or self.magento_api_page_workers < 1 or \
+                self.magento_api_breaker_cooldown < 1 or self.magento_commit_lines < 1:
+            raise UserError("API pool size, timeouts, parallel page downloads, pause duration and queue "
+                            "lines per commit must be greater than zero.")
+        if self.magento_api_rate_limit < 0 or self.magento_api_max_retries < 0 or \
+                self.magento_sync_skew_margin < 0 or self.magento_api_breaker_threshold < 0 or \
+                self.magento_commit_seconds < 0:
+            raise UserError("API rate limit, retries, failures before pause, sync clock skew margin and "
+                            "seconds between commits can not be negative.")
+
     def check_dashboard_view(self):
         """
         It will display dashboard based on configuration either by instance wise or website wise.
@@ -337,6 +439,18 @@ class MagentoInstance(models.Model):
         }
         return action
 
+    def action_magento_api_stats(self):
+        """
+        Opens the API statistics of the instance
+        :return:
+        """
+        action = self.env['ir.actions.act_window']._for_xml_id('odoo_magento2_ept.action_magento_api_stats')
+        action.update({
+            'domain': [('magento_instance_id', '=', self.id)],
+            'context': {'search_default_last_week': 1},
+        })
+        return action
+
     def list_of_instance_cron(self):
         """
         Opens view for cron scheduler of instance
@@ -481,6 +595,7 @@ class MagentoInstance(models.Model):
             'is_create_magento_more_instance': False
         })
         self.write({'is_onboarding_configurations_done': True})
+        close_session(self)
         res = super(MagentoInstance, self).unlink()
         return res
 
@@ -814,21 +929,21 @@ class MagentoInstance(models.Model):
         magento_instance_id = args.get('magento_instance_id')
         if magento_instance_id:
             instance = magento_instance.browse(magento_instance_id)
-            last_order_import_date = instance.last_order_import_date
-            if last_order_import_date:
-                last_order_import_date = last_order_import_date - timedelta(hours=10)
-            if not last_order_import_date:
-                last_order_import_date = ''
-            from_date = last_order_import_date
-            to_date = datetime.now()
+            watermark = self.env['magento.sync.watermark'].get_watermark(instance, 'shipped_order')
+            from_date, to_date = watermark.get_import_window(
+                watermark.get_from_date(instance.last_order_import_date), datetime.now())
+            tracker = watermark.start_tracking(instance.import_order_on)
             magento_order_data_queue_obj.create_order_queues(
                 instance=instance,
                 from_date=from_date,
                 to_date=to_date,
                 status='complete',
                 import_order_on=instance.import_order_on,
+                tracker=tracker,
+                watermark=watermark,
             )
-            instance.last_order_import_date = datetime.now()
+            if watermark.save_tracking(tracker):
+                instance.last_order_import_date = to_date
 
     @api.model
     def _scheduler_import_unshipped_sale_orders(self, args=None):
@@ -845,21 +960,21 @@ class MagentoInstance(models.Model):
         if magento_instance_id:
             instance = magento_instance.browse(magento_instance_id)
             order_status = instance.import_magento_order_status_ids.mapped('status')
-            last_unshipped_order_import_date = instance.last_unshipped_order_import_date
-            if last_unshipped_order_import_date:
-                last_unshipped_order_import_date = last_unshipped_order_import_date - timedelta(hours=10)
-            if not last_unshipped_order_import_date:
-                last_unshipped_order_import_date = ''
-            from_date = last_unshipped_order_import_date
-            to_date = datetime.now()
+            watermark = self.env['magento.sync.watermark'].get_watermark(instance, 'unshipped_order')
+            from_date, to_date = watermark.get_import_window(
+                watermark.get_from_date(instance.last_unshipped_order_import_date), datetime.now())
+            tracker = watermark.start_tracking(instance.import_order_on)
             magento_order_data_queue_obj.create_order_queues(
                 instance=instance,
                 from_date=from_date,
                 to_date=to_date,
                 status=order_status,
                 import_order_on=instance.import_order_on,
+                tracker=tracker,
+                watermark=watermark,
             )
-            instance.last_unshipped_order_import_date = datetime.now()
+            if watermark.save_tracking(tracker):
+                instance.last_unshipped_order_import_date = to_date
 
     @api.model
     def _scheduler_import_cancel_sale_orders(self, args=None):
@@ -875,21 +990,20 @@ class MagentoInstance(models.Model):
         magento_instance_id = args.get('magento_instance_id')
         if magento_instance_id:
             instance = magento_instance.browse(magento_instance_id)
-            last_cancel_order_import_date = instance.last_cancel_order_import_date
-            if last_cancel_order_import_date:
-                last_cancel_order_import_date = last_cancel_order_import_date - timedelta(hours=10)
-            if not last_cancel_order_import_date:
-                last_cancel_order_import_date = ''
-            from_date = last_cancel_order_import_date
+            watermark = self.env['magento.sync.watermark'].get_watermark(instance, 'cancel_order')
+            from_date = watermark.get_from_date(instance.last_cancel_order_import_date)
             to_date = datetime.now()
+            tracker = watermark.start_tracking(instance.import_order_on)
             sale_order.import_cancel_order(
                 instance=instance,
                 from_date=from_date,
                 to_date=to_date,
                 status='canceled',
-                import_order_on=instance.import_order_on
+                import_order_on=instance.import_order_on,
+                tracker=tracker
             )
-            instance.last_cancel_order_import_date = datetime.now()
+            if watermark.save_tracking(tracker):
+                instance.last_cancel_order_import_date = to_date
 
     @api.model
     def _scheduler_import_product(self, args=None):
@@ -906,16 +1020,18 @@ class MagentoInstance(models.Model):
         is_update = args.get('do_not_update_Existing_product', False)
         if instance_id:
             instance = instance.browse(instance_id)
-            from_date = ''
-            if instance.last_product_import_date:
-                from_date = instance.last_product_import_date - timedelta(hours=10)
-            to_date = datetime.now()
+            watermark = self.env['magento.sync.watermark'].get_watermark(instance, 'product')
+            from_date, to_date = watermark.get_import_window(
+                watermark.get_from_date(instance.last_product_import_date), datetime.now())
+            tracker = watermark.start_tracking(instance.import_product_on, id_field='id')
             p_types = ['configurable', 'simple']
             for p_type in p_types:
-                product_queue.create_product_queues(instance, from_date, to_date, p_type, is_update)
-            instance.write({
-                'last_product_import_date': datetime.now()
-            })
+                product_queue.create_product_queues(instance, from_date, to_date, p_type, is_update,
+                                                    tracker=tracker, watermark=watermark)
+            if watermark.save_tracking(tracker):
+                instance.write({
+                    'last_product_import_date': to_date
+                })
         return True
 
     @api.model
@@ -1027,7 +1143,7 @@ class MagentoInstance(models.Model):
             order_shipped = record.get_shipped_orders(record)
             # # refund count query
             refund_data = record.get_refund(record)
-            record.magento_order_data = json.dumps({
+            record.magento_order_data = dumps({
                 "values": values,
                 "title": "",
                 "key": "Order: Untaxed amount",
@@ -6,6 +6,7 @@ from .api_request import req
 
 class MagentoOrderStatusEpt(models.Model):
     _name = "magento.order.status.ept"
+    _inherit = ['magento.reference.data.mixin']
     _description = 'Magento Order Status'
 
     main_status = fields.Selection([('pending', 'Pending'),
@@ -11,6 +11,7 @@ class MagentoPaymentMethod(models.Model):
     Describes Magento Payment Methods
     """
     _name = 'magento.payment.method'
+    _inherit = ['magento.reference.data.mixin']
     _description = 'Magento Payment Method'
     _rec_name = 'payment_method_name'
 
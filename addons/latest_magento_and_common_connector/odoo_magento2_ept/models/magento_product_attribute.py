@@ -7,7 +7,7 @@ import math
 import logging
 from odoo import models, fields
 from ..python_library.php import Php
-from .api_request import req, create_search_criteria
+from .api_request import req, create_search_criteria, fetch_pages
 
 _logger = logging.getLogger("MagentoEPT")
 attr_types = ['textarea', 'text', 'date', 'boolean', 'multiselect', 'price', 'weee', 'weight',
@@ -54,6 +54,12 @@ class MagentoProductAttribute(models.Model):
         :param is_raise: To raise the error message while importing attribute sets, default False
         :return:
         """
+        url = MagentoProductAttribute._get_magento_attribute_path(page, get_pages)
+        attributes = req(instance, url, method='GET', is_raise=is_raise)
+        return attributes
+
+    @staticmethod
+    def _get_magento_attribute_path(page=1, get_pages=False):
         s_fields = []
         if get_pages:
             page = 1
@@ -61,9 +67,7 @@ class MagentoProductAttribute(models.Model):
         filters = {'attribute_id': {'gteq': 1}}
         search_criteria = create_search_criteria(filters, page_size=100, page=page, fields=s_fields)
         query_str = Php.http_build_query(search_criteria)
-        url = "/V1/products/attributes?{}".format(query_str)
-        attributes = req(instance, url, method='GET', is_raise=is_raise)
-        return attributes
+        return "/V1/products/attributes?{}".format(query_str)
 
     def import_magento_attributes(self, instance, attr_sets, is_raise=False, current=0):
         """
@@ -81,8 +85,9 @@ class MagentoProductAttribute(models.Model):
         total_page = math.ceil(int(attributes.get('total_count')) / 100)
         if current:
             current_page = current
-        for page in range(current_page, total_page + 1):
-            attributes = self._get_magento_attribute_response(instance, page=page, is_raise=is_raise)
+        pages = fetch_pages(instance, self._get_magento_attribute_path, range(current_page, total_page + 1),
+                            is_raise=is_raise)
+        for page, attributes in pages:
             try:
                 for attribute in attributes.get('items', []):
                     if attribute.get('options', []):
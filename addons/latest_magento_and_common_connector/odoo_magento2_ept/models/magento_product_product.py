@@ -3,17 +3,97 @@
 """
 Describes fields and methods for Magento products
 """
+import copy
 import logging
 import math
-import json
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from urllib.parse import quote
 from odoo import fields, models, _
 from odoo.exceptions import UserError
-from .api_request import req, create_search_criteria
+from .api_request import req, create_search_criteria, fetch_pages
+from .api_fields import get_import_fields
+from .group_commit import commit_line
+from .json_codec import loads
 from ..python_library.php import Php
 
 _logger = logging.getLogger('MagentoEPT')
 
+# Product responses of get_products() are kept this many seconds, for this many products.
+PRODUCT_CACHE_TTL = 600
+PRODUCT_CACHE_SIZE = 5000
+# Product ids requested by call to /V1/products.
+PRODUCT_BATCH_SIZE = 50
+
+
+class ProductResponseCache:
+    """
+    Thread safe cache of the product responses of Magento, bounded in age and size. The products
+    not found in Magento are cached as None. A product requested while another thread downloads
+    it is waited for instead of being requested again.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, keys, download):
+        """
+        Return the cached response of the keys, the missing ones are downloaded first.
+        :param keys: Cache keys
+        :param download: Function returning {key: response} of the given keys
+        :return: {key: response or None}
+        """
+        result, owned, waiting = {}, [], []
+        with self.lock:
+            now = time.monotonic()
+            for key in keys:
+                cached = self.items.get(key)
+                if cached and cached[0] > now:
+                    self.items.move_to_end(key)
+                    result[key] = cached[1]
+                elif key in self.pending:
+                    waiting.append((key, self.pending[key]))
+                else:
+                    self.pending[key] = threading.Event()
+                    owned.append(key)
+        try:
+            downloaded = download(owned) if owned else {}
+            with self.lock:
+                expire_at = time.monotonic() + self.ttl
+                for key in owned:
+                    result[key] = downloaded.get(key)
+                    self.items[key] = (expire_at, result[key])
+                    self.items.move_to_end(key)
+                while len(self.items) > self.max_size:
+                    self.items.popitem(last=False)
+        finally:
+            with self.lock:
+                for key in owned:
+                    self.pending.pop(key).set()
+        for key, event in waiting:
+            event.wait(PRODUCT_CACHE_TTL)
+            with self.lock:
+                cached = self.items.get(key)
+            if not cached:
+                raise UserError(_("Product %s could not be downloaded from Magento.", key[-1]))
+            result[key] = cached[1]
+        return result
+
+    def clear(self, prefix):
+        with self.lock:
+            for key in [key for key in self.items if key[:len(prefix)] == prefix]:
+                del self.items[key]
+        return True
+
+
+_product_cache = ProductResponseCache(PRODUCT_CACHE_TTL, PRODUCT_CACHE_SIZE)
+
 
 class MagentoProductProduct(models.Model):
     """
@@ -141,7 +221,7 @@ class MagentoProductProduct(models.Model):
             prices = []
             for price in extension.get('website_wise_product_price_data', []):
                 if isinstance(price, str):
-                    prices.append(json.loads(price))
+                    prices.append(loads(price))
             prices and extension.update({'website_wise_product_price_data': prices})
         return True
 
@@ -301,7 +381,7 @@ class MagentoProductProduct(models.Model):
         link = item.get('extension_attributes').get('configurable_product_link_data')
         magento_sku = ''
         if link:
-            link = json.loads(link[0])
+            link = loads(link[0])
             magento_sku = link.get('simple_product_sku')
         self.__update_child_response(item)
         m_template = m_template.search([('magento_product_template_id', '=', item.get('id')),
@@ -377,7 +457,7 @@ class MagentoProductProduct(models.Model):
                                                     magento_import_product_queue_line_id=line.id, model_name=self._name,
                                                     magento_instance_id=instance.id)
             line.queue_id.write({'is_process_queue': False})
-            self.env.cr.commit()
+            commit_line(self.env)
             return False
         return True
 
@@ -392,28 +472,78 @@ class MagentoProductProduct(models.Model):
             data = []
             if value in list(attributes.keys()):
                 for child in attributes.get(keys.get(key), []):
-                    data.append(json.loads(child))
+                    data.append(loads(child))
             item.get('extension_attributes', {}).update({key: data})
             item.get('extension_attributes', {}).pop(value)
         return True
 
     def get_products(self, instance, ids, line):
+        """
+        Return the Magento responses of the product ids. The responses are cached, so the
+        products shared by the orders of a queue are requested only once.
+        """
+        try:
+            products = self.fetch_products(instance, ids)
+        except Exception as error:
+            _logger.error(error)
+            return []
+        # The callers update the responses, the cached ones are kept unchanged.
+        response = [copy.deepcopy(product) for product in products.values() if product]
+        return self.__verify_product_response(response, ids, line)
+
+    def fetch_products(self, instance, ids):
+        """
+        Return the cached responses of the product ids, the missing ones are requested from
+        Magento by batches.
+        :param instance: magento.instance()
+        :param ids: Magento product ids
+        :return: {product id: response or None}, None if the product is not found in Magento
+        """
+        prefix = (self.env.cr.dbname, instance.id)
+        keys = list(dict.fromkeys(prefix + (int(product_id),) for product_id in ids))
+        products = _product_cache.fetch(keys, lambda missing: self.__download_products(instance, missing))
+        return {key[-1]: product for key, product in products.items()}
+
+    def prefetch_products(self, instance, ids):
+        """
+        Download at once the products used by a whole queue, before processing its lines.
+        """
+        try:
+            self.fetch_products(instance, ids)
+        except Exception as error:
+            _logger.error(error)
+        return True
+
+    def clear_product_cache(self, instances):
+        for instance in instances:
+            _product_cache.clear((self.env.cr.dbname, instance.id))
+        return True
+
+    def __download_products(self, instance, keys):
+        ids = [key[-1] for key in keys]
+        chunks = [ids[index:index + PRODUCT_BATCH_SIZE] for index in range(0, len(ids), PRODUCT_BATCH_SIZE)]
+        projection = get_import_fields(instance, 'product')
+        _logger.info("Sending request to get Configurable product of Child....")
+        products = {}
+        pages = fetch_pages(instance, lambda index: self.__get_products_path(chunks[index], projection),
+                            range(len(chunks)), is_raise=True)
+        for _index, response in pages:
+            for item in response.get('items', []):
+                products[keys[0][:-1] + (int(item.get('id')),)] = item
+        return products
+
+    @staticmethod
+    def __get_products_path(ids, projection):
         args = ''
         for id in ids:
             args += f"{id},"
         url = f"/V1/products?searchCriteria[filterGroups][0][filters][0][field]=entity_id" \
               f"&searchCriteria[filterGroups][0][filters][0][condition_type]=in" \
-              f"&searchCriteria[filterGroups][0][filters][0][value]={args}"
-        response = {}
-        try:
-            _logger.info("Sending request to get Configurable product of Child....")
-            response = req(instance, url, is_raise=True)
-        except Exception as error:
-            _logger.error(error)
-        if response:
-            response = response.get('items', [])
-            return self.__verify_product_response(response, ids, line)
-        return response
+              f"&searchCriteria[filterGroups][0][filters][0][value]={args}" \
+              f"&searchCriteria[pageSize]={len(ids)}"
+        if projection:
+            url += f"&fields={quote(projection[0])}"
+        return url
 
     def __verify_product_response(self, response, ids, line):
         log_line = self.env['common.log.lines.ept']
@@ -741,7 +871,7 @@ class MagentoProductProduct(models.Model):
 
     def export_magento_stock(self, line, api_url, log_line):
         instance = line.instance_id
-        data = json.loads(line.data)
+        data = line.get_payload()
         is_stock_exported = True
         if data:
             if instance.is_multi_warehouse_in_magento:
@@ -5,13 +5,13 @@ Describes fields and methods for Magento products templates
 """
 import os
 import logging
-import json
 import codecs
 import io
 from datetime import datetime
 from PIL import Image
 from odoo import models, fields, api
 from .api_request import req
+from .json_codec import loads
 from ..python_library.php import Php
 
 _logger = logging.getLogger("MagentoEPT")
@@ -592,7 +592,7 @@ class MagentoProductTemplate(models.Model):
         attribute_line_ids_data = False
         if configurable_options:
             for option in configurable_options:
-                attribute_data = json.loads(option)
+                attribute_data = loads(option)
                 if attribute_data.get('frontend_label'):
                     odoo_attribute = self.env['product.attribute'].get_attribute(
                         attribute_data.get('frontend_label'),
@@ -1293,6 +1293,9 @@ class MagentoProductTemplate(models.Model):
         :param common_log_id: log book record
         :return:
         """
+        if instance.magento_api_transport == 'async':
+            instance.env['magento.bulk.request'].submit_async_request(instance, api_url, 'PUT', data, 'product')
+            return True
         req(instance, api_url, 'PUT', data, is_raise=True)
         return True
 
@@ -1307,7 +1310,11 @@ class MagentoProductTemplate(models.Model):
         :return:
         """
         try:
-            req(instance, url, 'POST', price_payload, is_raise=True)
+            if instance.magento_api_transport == 'async':
+                instance.env['magento.bulk.request'].submit_async_request(instance, url, 'POST', price_payload,
+                                                                          'price')
+            else:
+                req(instance, url, 'POST', price_payload, is_raise=True)
         except Exception as error:
             message = f"Not able to update product price. Error : {error}"
             log_line.create_common_log_line_ept(message=message, module='magento_ept',
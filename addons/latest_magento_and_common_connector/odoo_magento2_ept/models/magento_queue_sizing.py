@@ -0,0 +1,150 @@
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the queue and page sizes of the imports and exports of an instance.
+"""
+import logging
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL
+
+_logger = logging.getLogger("Magento EPT")
+
+# Process cron, default queue size and default page size of each stream.
+QUEUE_STREAMS = {
+    'order': ('odoo_magento2_ept.magento_ir_cron_parent_to_process_order_queue_data', 50, 200),
+    'product': ('odoo_magento2_ept.ir_cron_parent_to_process_product_queue_data', 50, 50),
+    'customer': ('odoo_magento2_ept.magento_ir_cron_to_process_customer_queue_data', 50, 200),
+    'export_stock': ('odoo_magento2_ept.magento_ir_cron_to_process_export_stock_queue_data', 50, 0),
+}
+MIN_QUEUE_SIZE, MAX_QUEUE_SIZE = 20, 500
+MIN_PAGE_SIZE, MAX_PAGE_SIZE = 20, 500
+# Weight of the last measure in the moving averages.
+SMOOTHING = 0.3
+# Share of the cron time given to one queue, a run processes several queues before the time limit.
+QUEUE_TIME_SHARE = 0.25
+# Share of the API read timeout a page download may use.
+PAGE_TIMEOUT_SHARE = 0.25
+
+
+class MagentoQueueSizing(models.Model):
+    """
+    Stores the queue size and page size of an instance per stream. In adaptive mode they are
+    tuned from the measured processing time of a queue line and download time of a record:
+    a queue is filled with the lines processed in a quarter of the process cron time, and a
+    page with the records downloaded in a quarter of the API read timeout.
+    """
+    _name = "magento.queue.sizing"
+    _description = "Magento Queue Sizing"
+    _rec_name = 'stream'
+
+    magento_instance_id = fields.Many2one(comodel_name='magento.instance', string='Magento Instance',
+                                          required=True, ondelete='cascade')
+    stream = fields.Selection([('order', 'Orders'),
+                               ('product', 'Products'),
+                               ('customer', 'Customers'),
+                               ('export_stock', 'Export Stock')], required=True)
+    mode = fields.Selection([('fixed', 'Fixed'), ('adaptive', 'Adaptive')], default='fixed', required=True,
+                            help="Fixed: the queue and page sizes are used as they are set.\n"
+                                 "Adaptive: they are tuned from the measured processing and download "
+                                 "times, between {} and {}.".format(MIN_QUEUE_SIZE, MAX_QUEUE_SIZE))
+    queue_size = fields.Integer(string="Queue Size", default=50, help="Maximum number of lines of a queue.")
+    page_size = fields.Integer(string="Page Size", default=200,
+                               help="Number of records asked to Magento per request. Not used by the "
+                                    "export stock stream.")
+    line_seconds = fields.Float(string="Seconds Per Line", digits=(16, 4), readonly=True,
+                                help="Moving average of the processing time of a queue line.")
+    record_seconds = fields.Float(string="Seconds Per Record", digits=(16, 4), readonly=True,
+                                  help="Moving average of the download time of a record.")
+    last_tuned_at = fields.Datetime(string="Last Tuned", readonly=True)
+
+    _magento_queue_sizing_unique_constraint = models.Constraint(
+        'unique(magento_instance_id,stream)',
+        "Queue sizing must be unique per instance and stream")
+
+    @api.constrains('queue_size', 'page_size')
+    def _check_sizes(self):
+        for sizing in self:
+            if sizing.queue_size < 1 or (sizing.stream != 'export_stock' and sizing.page_size < 1):
+                raise UserError(_("Queue size and page size must be greater than 0."))
+
+    @api.model
+    def get_sizing(self, instance, stream):
+        """
+        Return the sizing of the stream. The sizings are created with the instance, a missing one
+        is inserted with the default sizes in SQL, without failing when another worker inserts
+        it at the same time.
+        """
+        domain = [('magento_instance_id', '=', instance.id), ('stream', '=', stream)]
+        sizing = self.search(domain, limit=1)
+        if not sizing:
+            _cron, queue_size, page_size = QUEUE_STREAMS[stream]
+            self.env.cr.execute(SQL("""
+                INSERT INTO magento_queue_sizing (magento_instance_id, stream, mode, queue_size, page_size,
+                                                  create_uid, create_date, write_uid, write_date)
+                VALUES (%(instance)s, %(stream)s, 'fixed', %(queue_size)s, %(page_size)s,
+                        %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC')
+                ON CONFLICT (magento_instance_id, stream) DO NOTHING
+            """, instance=instance.id, stream=stream, queue_size=queue_size, page_size=page_size, uid=self.env.uid))
+            sizing = self.search(domain, limit=1)
+        return sizing
+
+    def get_page_size(self, is_resume=False):
+        """
+        Return the page size of the import, tuned first in adaptive mode. A resumed page number
+        import keeps the page size of its first run, its page counter depends on it.
+        :param is_resume: True when the import starts again from a stored page counter
+        """
+        self.ensure_one()
+        if self.mode == 'adaptive' and not is_resume and self.record_seconds:
+            timeout = self.magento_instance_id.magento_api_read_timeout * PAGE_TIMEOUT_SHARE
+            page_size = self._clamp(timeout / self.record_seconds, MIN_PAGE_SIZE, MAX_PAGE_SIZE)
+            if page_size != self.page_size:
+                self.write({'page_size': page_size, 'last_tuned_at': fields.Datetime.now()})
+        return self.page_size
+
+    def record_page(self, response, seconds):
+        """
+        Measure the download time of a page. Given as on_page to fetch_pages().
+        :param response: Page received from Magento
+        :param seconds: Duration of the request
+        """
+        items = (response.get('items') or []) if isinstance(response, dict) else []
+        if items and seconds > 0:
+            self._update_average('record_seconds', seconds / len(items))
+        return True
+
+    def record_processing(self, line_count, seconds):
+        """
+        Measure the processing time of the queue lines and tune the queue size in adaptive mode.
+        :param line_count: Number of lines processed
+        :param seconds: Duration of the processing
+        """
+        self.ensure_one()
+        if not line_count or seconds <= 0:
+            return True
+        self._update_average('line_seconds', seconds / line_count)
+        if self.mode == 'adaptive':
+            cron_time = self.magento_instance_id.get_magento_cron_execution_time(QUEUE_STREAMS[self.stream][0])
+            queue_size = self._clamp((cron_time - 60) * QUEUE_TIME_SHARE / self.line_seconds,
+                                     MIN_QUEUE_SIZE, MAX_QUEUE_SIZE)
+            if queue_size != self.queue_size:
+                self.write({'queue_size': queue_size, 'last_tuned_at': fields.Datetime.now()})
+        return True
+
+    def _update_average(self, field_name, value):
+        average = self[field_name]
+        average = value if not average else average + SMOOTHING * (value - average)
+        try:
+            with self.env.cr.savepoint():
+                self.write({field_name: average})
+        except Exception as error:
+            # Another worker measures the same stream, this measure is dropped.
+            _logger.info("Magento queue sizing measure skipped: %s", error)
+        return True
+
+    @staticmethod
+    def _clamp(value, minimum, maximum):
+        """
+        Return the value rounded down to tens, between minimum and maximum.
+        """
+        return int(min(max(value // 10 * 10, minimum), maximum))
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-import json
 from odoo import models, fields
 
 key_list = ['name', 'street', 'street2', 'city', 'zip', 'phone', 'state_id', 'country_id',
@@ -25,7 +24,7 @@ class MagentoResPartnerEpt(models.Model):
             data = line
             instance = line.get('instance_id')
         else:
-            data = json.loads(line.data)
+            data = line.get_payload()
             instance = line.instance_id
         customer = False
         if data.get('id'):
@@ -11,6 +11,7 @@ class MagentoStoreview(models.Model):
     Describes Magento Store View
     """
     _name = 'magento.storeview'
+    _inherit = ['magento.reference.data.mixin']
     _description = "Magento Storeview"
     _order = 'sort_order ASC, id ASC'
 
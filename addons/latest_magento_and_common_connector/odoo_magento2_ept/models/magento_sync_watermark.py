@@ -0,0 +1,190 @@
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the high-watermark of the incremental imports from Magento.
+"""
+from datetime import datetime, timedelta
+from odoo import models, fields, api
+from .json_codec import dumps, loads
+
+MAGENTO_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Overlap of the imports read by offset pages, as before the watermarks.
+PAGE_OVERLAP_SECONDS = 10 * 60 * 60
+
+
+class MagentoSyncWatermark(models.Model):
+    """
+    Stores the last change imported from Magento per instance and stream. The next import asks
+    only for the records changed after it, minus the clock skew margin of the instance.
+    The records already imported inside that margin are remembered to skip them. An import
+    read by offset pages misses the records moving from a page to another during the run, it
+    keeps the overlap of 10 hours.
+    An import paginated by cursor also keeps here the last id of each of its listings with the
+    date window of the import, so an interrupted import resumes on the same window.
+    """
+    _name = "magento.sync.watermark"
+    _description = "Magento Sync Watermark"
+    _rec_name = 'stream'
+
+    magento_instance_id = fields.Many2one(comodel_name='magento.instance', string='Magento Instance',
+                                          required=True, ondelete='cascade')
+    stream = fields.Selection([('shipped_order', 'Shipped Orders'),
+                               ('unshipped_order', 'Unshipped Orders'),
+                               ('cancel_order', 'Cancelled Orders'),
+                               ('product', 'Products'),
+                               ('manual_order', 'Manual Order Imports'),
+                               ('manual_product', 'Manual Product Imports')], required=True)
+    last_updated_at = fields.Datetime(string="Last Change Date",
+                                      help="Highest date of the records imported in this stream.")
+    last_record_id = fields.Integer(string="Last Record ID",
+                                    help="Magento ID of the record changed at the last change date.")
+    boundary_record_ids = fields.Text(string="Boundary Records",
+                                      help="Magento IDs and dates of the records imported inside the "
+                                           "clock skew margin, used to skip them in the next import.")
+    resume_state = fields.Text(string="Interrupted Import",
+                               help="Date window and last imported id of each listing of an import "
+                                    "paginated by cursor which did not finish.")
+
+    _magento_watermark_unique_constraint = models.Constraint(
+        'unique(magento_instance_id,stream)',
+        "Sync watermark must be unique per instance and stream")
+
+    @api.model
+    def get_watermark(self, instance, stream):
+        watermark = self.search([('magento_instance_id', '=', instance.id), ('stream', '=', stream)], limit=1)
+        if not watermark:
+            watermark = self.create({'magento_instance_id': instance.id, 'stream': stream})
+        return watermark
+
+    def get_from_date(self, last_import_date=False):
+        """
+        Return the date from which the next import starts. The last import date of the instance
+        is used until the stream has seen a record.
+        :param last_import_date: Last import date stored in the instance
+        :return: datetime or ''
+        """
+        self.ensure_one()
+        from_date = self.last_updated_at or last_import_date
+        if not from_date:
+            return ''
+        return from_date - timedelta(seconds=self._get_overlap())
+
+    def _get_overlap(self):
+        """
+        Return the seconds read again by the next import: the clock skew margin of the instance,
+        or the overlap of the imports by offset pages.
+        """
+        margin = max(self.magento_instance_id.magento_sync_skew_margin, 0)
+        if self.stream == 'cancel_order' or self.magento_instance_id.magento_api_pagination == 'page':
+            return max(margin, PAGE_OVERLAP_SECONDS)
+        return margin
+
+    def get_import_window(self, from_date, to_date):
+        """
+        Return the date window of the import: the window of the interrupted import when one is
+        left, so it resumes on the same records, else the given one.
+        :return: (from_date, to_date)
+        """
+        self.ensure_one()
+        state = loads(self.resume_state or '{}')
+        if not state.get('cursors'):
+            return from_date, to_date
+        return tuple(datetime.strptime(value, MAGENTO_DATETIME_FORMAT) if value else ''
+                     for value in (state.get('from_date'), state.get('to_date')))
+
+    def get_cursor(self, key, from_date, to_date):
+        """
+        Return the last id imported by the interrupted import of the listing, or 0 when the
+        listing was completed or imported on another window.
+        :param key: Listing of the stream, like the order statuses or the product type
+        """
+        self.ensure_one()
+        state = loads(self.resume_state or '{}')
+        if (state.get('from_date'), state.get('to_date')) != _get_window(from_date, to_date):
+            return 0
+        return state.get('cursors', {}).get(key, 0)
+
+    def save_cursor(self, key, cursor, from_date, to_date):
+        """
+        Store the last id imported in the listing. The cursors of another window are dropped.
+        :param cursor: Last imported id, 0 when the listing is completed
+        """
+        self.ensure_one()
+        window = _get_window(from_date, to_date)
+        state = loads(self.resume_state or '{}')
+        cursors = state.get('cursors', {}) if (state.get('from_date'), state.get('to_date')) == window else {}
+        if cursor:
+            cursors[key] = cursor
+        else:
+            cursors.pop(key, None)
+        self.write({'resume_state': dumps({'from_date': window[0], 'to_date': window[1], 'cursors': cursors})
+                    if cursors else False})
+        return True
+
+    def start_tracking(self, date_field, id_field='entity_id'):
+        """
+        Return the tracker given to the queue builders to skip the records already imported and
+        collect the new ones. Nothing is stored until save_tracking() is called.
+        :param date_field: created_at or updated_at
+        :param id_field: Key of the Magento ID in the response items
+        :return: WatermarkTracker
+        """
+        self.ensure_one()
+        return WatermarkTracker(loads(self.boundary_record_ids or '{}'), date_field, id_field)
+
+    def save_tracking(self, tracker):
+        """
+        Move the watermark to the last record seen by a completed import. Nothing moves when a
+        page of the import failed, the next import reads the same records again.
+        :param tracker: WatermarkTracker returned by start_tracking()
+        :return: False if a page failed
+        """
+        self.ensure_one()
+        if tracker.failed:
+            return False
+        if not tracker.seen:
+            return True
+        seen = dict(tracker.boundary, **tracker.seen)
+        last_id, last_date = max(tracker.seen.items(), key=lambda item: (item[1], int(item[0])))
+        last_date = datetime.strptime(last_date, MAGENTO_DATETIME_FORMAT)
+        if self.last_updated_at and self.last_updated_at > last_date:
+            last_id, last_date = self.last_record_id, self.last_updated_at
+        margin_date = last_date - timedelta(seconds=self._get_overlap())
+        margin_date = margin_date.strftime(MAGENTO_DATETIME_FORMAT)
+        self.write({
+            'last_updated_at': last_date,
+            'last_record_id': int(last_id),
+            'boundary_record_ids': dumps({key: value for key, value in seen.items() if value >= margin_date})
+        })
+        return True
+
+
+def _get_window(from_date, to_date):
+    return tuple(value.strftime(MAGENTO_DATETIME_FORMAT) if isinstance(value, datetime) else str(value or '')
+                 for value in (from_date, to_date))
+
+
+class WatermarkTracker:
+    """
+    Skips the records imported by the previous run with the same change date, and collects the
+    Magento ID and change date of the new records. An import which could not read a page sets
+    failed, so the watermark is not moved past it.
+    """
+
+    def __init__(self, boundary, date_field, id_field):
+        self.boundary = boundary
+        self.date_field = date_field
+        self.id_field = id_field
+        self.seen = {}
+        self.failed = False
+
+    def filter_items(self, items):
+        new_items = []
+        for item in items or []:
+            record_id = str(item.get(self.id_field))
+            changed_at = item.get(self.date_field) or ''
+            if self.boundary.get(record_id) == changed_at:
+                continue
+            if changed_at:
+                self.seen[record_id] = changed_at
+            new_items.append(item)
+        return new_items
@@ -3,9 +3,9 @@
 """
 Describes Methods for Magento Website.
 """
-import json
 from datetime import date
 from odoo import models, fields, api, _
+from .json_codec import dumps
 
 RES_CURRENCY = "res.currency"
 
@@ -85,7 +85,7 @@ class MagentoWebsite(models.Model):
             order_shipped = record.get_shipped_orders(record)
             # refund count query
             refund_data = self.env['magento.instance'].get_refund(record)
-            record.magento_order_data = json.dumps({
+            record.magento_order_data = dumps({
                 "title": "",
                 "values": values,
                 "area": True,
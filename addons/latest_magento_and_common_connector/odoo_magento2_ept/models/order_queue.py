@@ -8,7 +8,13 @@ import time
 from datetime import datetime
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-from .api_request import req, create_search_criteria
+from odoo.tools import SQL
+from .api_request import req, create_search_criteria, fetch_pages, fetch_cursor_pages, \
+    is_circuit_open, PRODUCT_API_PATH
+from .api_fields import get_import_fields
+from .group_commit import GroupCommit
+from .order_reference_cache import OrderReferenceCache
+from .queue_payload import CLEAR_PAYLOAD
 from ..python_library.php import Php
 from dateutil.relativedelta import relativedelta
 
@@ -104,29 +110,16 @@ class MagentoOrderDataQueueEpt(models.Model):
         vals.update({'name': record_name or ''})
         return super(MagentoOrderDataQueueEpt, self).create(vals)
 
-    def _create_order_queue(self, instance):
-        """
-        Creates Imported Magento orders queue
-        :param instance: Instance of Magento
-        :return: Magento order Data queue object
-        """
-        queue = self.search([('instance_id', '=', instance.id), ('state', '=', 'draft')])
-        queue = queue.filtered(lambda q: len(q.line_ids) < 50)
-        if not queue:
-            queue = self.create({'instance_id': instance.id})
-            message = "Order Queue #{} Created!!".format(queue.name)
-            instance.show_popup_notification(message)
-        return queue[0]
-
     def create_order_queues(self, **kwargs):
-        queue_line = self.env['magento.order.data.queue.line.ept']
         instance = kwargs.get('instance')
-        page_size = 200
+        sizing = self.env['magento.queue.sizing'].get_sizing(instance, 'order')
+        is_resume = instance.magento_api_pagination == 'page' and instance.magento_import_order_page_count > 1
+        page_size = sizing.get_page_size(is_resume)
         queue_ids = list()
         orders = self._get_order_response(instance, kwargs, True)
-        page = math.ceil(orders.get('total_count', 1) / page_size)
+        total_page = math.ceil(orders.get('total_count', 1) / page_size)
         kwargs.pop('fields')
-        if page == 0:
+        if total_page == 0:
             if not kwargs.get('is_manual'):
                 instance.write({'magento_import_order_page_count': 1})
             else:
@@ -135,34 +128,102 @@ class MagentoOrderDataQueueEpt(models.Model):
                     datetime.strptime(kwargs.get('to_date', None), '%Y-%m-%d %H:%M:%S').date(),
                     instance.name)
                 instance.show_popup_notification(message)
+        kwargs.update({'page_size': page_size, 'fields': get_import_fields(instance, 'order')})
+        if instance.magento_api_pagination == 'cursor':
+            return self._create_order_queues_by_cursor(instance, kwargs, queue_ids)
         # page = page if kwargs.get('is_manual') else instance.magento_import_order_page_count
         current_page = instance.magento_import_order_page_count
         if current_page == 1:
             current_page = 0
-        for page in range(current_page + 1, page + 1):
-            kwargs.update({'page': page, 'page_size': page_size})
-            orders = self._get_order_response(instance, kwargs)
-            if orders.get('items'):
-                queue = self._create_order_queue(instance)
-                queue_ids.append(queue.id)
-                for order in orders.get('items'):
-                    if len(queue.line_ids) == 50:
-                        self.env.cr.commit()
-                        queue = self._create_order_queue(instance)
-                        queue_ids.append(queue.id)
-                    queue_line.create_order_queue_line(instance, order, queue)
+        pages = fetch_pages(instance, lambda page: self._get_order_path(dict(kwargs, page=page)),
+                            range(current_page + 1, total_page + 1), is_raise=True, on_page=sizing.record_page)
+        for page, orders in pages:
+            self._create_order_queue_lines(instance, orders.get('items'), queue_ids, kwargs.get('tracker'))
             instance.write({'magento_import_order_page_count': page})
         if not kwargs.get('is_manual'):
             instance.write({'magento_import_order_page_count': 1})
         return queue_ids
 
+    def _create_order_queues_by_cursor(self, instance, kwargs, queue_ids):
+        """
+        Creates the order queues with keyset pagination. The last imported order id is stored in
+        the watermark of the stream after each page, with the date window of the import, so an
+        interrupted import of the same window resumes right after it.
+        :param instance: magento.instance()
+        :param kwargs: Order filters, with the watermark of the scheduled imports
+        :param queue_ids: List of created queue ids
+        :return: List of created queue ids
+        """
+        sizing = self.env['magento.queue.sizing'].get_sizing(instance, 'order')
+        watermark = kwargs.get('watermark') or \
+            self.env['magento.sync.watermark'].get_watermark(instance, 'manual_order')
+        status = kwargs.get('status')
+        key = ','.join(sorted(status)) if isinstance(status, list) else str(status)
+        window = (kwargs.get('from_date'), kwargs.get('to_date'))
+        pages = fetch_cursor_pages(
+            instance, lambda cursor: self._get_order_path(dict(kwargs, cursor=cursor, cursor_field='entity_id')),
+            cursor=watermark.get_cursor(key, *window), page_size=kwargs.get('page_size'), is_raise=True,
+            on_page=sizing.record_page)
+        for cursor, orders in pages:
+            self._create_order_queue_lines(instance, orders.get('items'), queue_ids, kwargs.get('tracker'))
+            watermark.save_cursor(key, cursor, *window)
+            self.env.cr.commit()
+        watermark.save_cursor(key, 0, *window)
+        return queue_ids
+
+    def _create_order_queue_lines(self, instance, orders, queue_ids, tracker=None):
+        if tracker:
+            # Skip the orders already imported by the previous scheduled import.
+            orders = tracker.filter_items(orders)
+        if orders:
+            queue_line = self.env['magento.order.data.queue.line.ept']
+            queue_size = self.env['magento.queue.sizing'].get_sizing(instance, 'order').queue_size
+            for queue_id in queue_line.create_order_queue_lines(instance, orders, queue_size):
+                if queue_id not in queue_ids:
+                    queue_ids.append(queue_id)
+            self.env.cr.commit()
+        return queue_ids
+
+    def _get_order_queue_slots(self, instance, count, queue_size):
+        """
+        Return the queue id of each of the next count lines of the instance. The draft queues
+        with room are filled first, in creation order, then new queues are created.
+        :param instance: magento.instance()
+        :param count: Number of lines to place
+        :param queue_size: Maximum number of lines of a queue
+        :return: list of queue ids, one per line
+        """
+        self.env.cr.execute(SQL("""
+            SELECT queue.id, %(size)s - count(line.id)
+            FROM magento_order_data_queue_ept queue
+            LEFT JOIN magento_order_data_queue_line_ept line ON line.queue_id = queue.id
+            WHERE queue.instance_id = %(instance)s AND queue.state = 'draft'
+            GROUP BY queue.id
+            HAVING count(line.id) < %(size)s
+            ORDER BY queue.id
+        """, size=queue_size, instance=instance.id))
+        slots = []
+        for queue_id, room in self.env.cr.fetchall():
+            slots += [queue_id] * min(room, count - len(slots))
+            if len(slots) == count:
+                return slots
+        while len(slots) < count:
+            queue = self.create({'instance_id': instance.id})
+            instance.show_popup_notification("Order Queue #{} Created!!".format(queue.name))
+            slots += [queue.id] * min(queue_size, count - len(slots))
+        # The new queues must exist before their lines are inserted in SQL.
+        self.env.flush_all()
+        return slots
+
     def _get_order_response(self, instance, kwargs, get_pages=False):
         if get_pages:
             kwargs.update({'fields': ['total_count']})
+        return req(instance, self._get_order_path(kwargs), is_raise=True)
+
+    def _get_order_path(self, kwargs):
         filters = self._prepare_order_filter(**kwargs)
         query_string = Php.http_build_query(filters)
-        req_path = '/V1/orders?{}'.format(query_string)
-        return req(instance, req_path, is_raise=True)
+        return '/V1/orders?{}'.format(query_string)
 
     def _get_order_response_from_order_id(self, instance, magento_order_id):
         req_path = '/V1/orders/{}'.format(magento_order_id)
@@ -195,7 +256,7 @@ class MagentoOrderDataQueueEpt(models.Model):
         :return:
         """
         queue_ids = list()
-        queue_line = self.env['magento.order.data.queue.line.ept']
+        orders = list()
         for order_reference in order_reference_lists:
             filters = {'increment_id': order_reference}
             search_criteria = create_search_criteria(filters)
@@ -205,14 +266,8 @@ class MagentoOrderDataQueueEpt(models.Model):
                 order = req(instance, api_url)
             except Exception as error:
                 raise UserError(_("Error while requesting Orders - %s", str(error)))
-            for order in order.get('items'):
-                queue = self._create_order_queue(instance)
-                queue_ids.append(queue.id)
-                if len(queue.line_ids) == 50:
-                    self.env.cr.commit()
-                    queue = self._create_order_queue(instance)
-                    queue_ids.append(queue.id)
-                queue_line.create_order_queue_line(instance, order, queue)
+            orders += order.get('items', [])
+        self._create_order_queue_lines(instance, orders, queue_ids)
         self.env.cr.commit()
         return queue_ids
 
@@ -224,9 +279,21 @@ class MagentoOrderDataQueueEpt(models.Model):
     def process_order_queues(self, is_manual=False):
         start = time.time()
         domain = ['draft', 'cancel', 'failed']
+        m_product = self.env['magento.product.product']
+        # Products are cached for one run only, the next run sees the changes done in Magento.
+        m_product.clear_product_cache(self.instance_id)
+        # Payment methods, carriers, taxes... are looked up once per run.
+        reference_cache = OrderReferenceCache(self.env)
         for queue in self.filtered(lambda q: q.state not in ['completed']):
             cron_name = "odoo_magento2_ept.magento_ir_cron_parent_to_process_order_queue_data"
             process_cron_time = queue.instance_id.get_magento_cron_execution_time(cron_name)
+            if is_circuit_open(queue.instance_id, PRODUCT_API_PATH):
+                # Magento is failing, the queue is left as it is for the next run.
+                continue
+            # Only the lines claimed by this worker are processed, another worker may process the queue.
+            claimed = queue.line_ids.filtered(lambda l: l.state in domain).claim_lines(process_cron_time, domain)
+            if not claimed:
+                continue
             # To maintain that current queue has started to process.
             queue.write({'is_process_queue': True})
             log_line = self.env['common.log.lines.ept']
@@ -239,24 +306,64 @@ class MagentoOrderDataQueueEpt(models.Model):
                 queue.instance_id.create_schedule_activity(queue=queue, note=note)
                 domain.remove('failed')
                 queue.write({'is_process_queue': False})
-                continue
-            lines = queue.line_ids.filtered(lambda l: l.state in domain)
-            for line in lines:
-                is_processed = line.process_order_queue_line(line, log_line)
-                if is_processed:
-                    line.write({'state': 'done', 'processed_at': datetime.now(), 'data': False})
-                else:
-                    line.write({'state': 'failed', 'processed_at': datetime.now()})
+                claimed.release_lines()
                 self.env.cr.commit()
+                continue
+            # Orders already imported are set done at once, they are not processed again.
+            lines = claimed.filtered(lambda l: l.state in domain).done_imported_orders()
+            queue_start = time.time()
+            # The payloads decoded for the products are used again to process the lines.
+            lines = lines.with_payload_cache().with_context(magento_reference_cache=reference_cache)
+            lines.prefetch_order_products(queue.instance_id)
+            # The bulk import sets failed the lines whose resolve raises, each one needs a savepoint.
+            group_commit = GroupCommit(self.env, queue.instance_id,
+                                       savepoint=queue.instance_id.magento_bulk_order_create)
+            if queue.instance_id.magento_bulk_order_create:
+                processed = group_commit.get_env(lines).process_order_queue_lines_bulk(log_line, group_commit)
+            else:
+                processed = queue._process_order_queue_lines(group_commit.get_env(lines), log_line, group_commit,
+                                                             reference_cache)
+            group_commit.commit()
+            sizing = self.env['magento.queue.sizing'].get_sizing(queue.instance_id, 'order')
+            sizing.record_processing(processed, time.time() - queue_start)
             message = "Order Queue #{} Processed!!".format(queue.name)
             queue.instance_id.show_popup_notification(message)
             # To maintain that current queue process are completed and new queue will be executed.
             queue.write({'is_process_queue': False})
+            claimed.release_lines()
             self.env.cr.commit()
             if time.time() - start > process_cron_time - 60:
                 return True
         return True
 
+    def _process_order_queue_lines(self, lines, log_line, group_commit, reference_cache):
+        """
+        Import the orders of the lines one by one.
+        :return: Number of lines processed
+        """
+        processed = 0
+        for line in lines:
+            if is_circuit_open(self.instance_id, PRODUCT_API_PATH):
+                break
+            is_done, is_processed = group_commit.run(line.process_order_queue_line, line, log_line)
+            if not is_done:
+                # The records created by the rolled back line may be cached.
+                reference_cache.clear()
+                log_line.create_common_log_line_ept(
+                    message="Order {} could not be imported: {}".format(line.magento_id, is_processed),
+                    module='magento_ept', order_ref=line.magento_id,
+                    magento_order_data_queue_line_id=line.id, model_name=line._name,
+                    magento_instance_id=self.instance_id.id)
+                is_processed = False
+            if is_processed:
+                line.write({'state': 'done', 'processed_at': datetime.now(), **CLEAR_PAYLOAD})
+            else:
+                line.write({'state': 'failed', 'processed_at': datetime.now()})
+                line.forget_payload()
+            group_commit.line_done()
+            processed += 1
+        return processed
+
     def auto_reset_order_queue_data_process_count_magento(self):
         """
         This Method reset the process count to Zero for the queues which has been failed more than
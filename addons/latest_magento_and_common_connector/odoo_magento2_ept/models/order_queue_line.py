@@ -3,11 +3,20 @@
 """
 Describes methods to store Order Data queue line
 """
-import json
+import logging
 import pytz
 import time
+from datetime import datetime
 from odoo import models, fields, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL
+from odoo.tools.sql import table_exists
 from dateutil import parser
+from .api_request import is_circuit_open, PRODUCT_API_PATH
+from .order_reference_cache import get_reference_cache
+from .queue_payload import CLEAR_PAYLOAD
+
+_logger = logging.getLogger("Magento EPT")
 
 utc = pytz.utc
 
@@ -17,6 +26,7 @@ class MagentoOrderDataQueueLineEpt(models.Model):
     Describes Order Data Queue Line
     """
     _name = "magento.order.data.queue.line.ept"
+    _inherit = ['magento.queue.line.claim', 'magento.queue.payload']
     _description = "Magento Order Data Queue Line EPT"
     _rec_name = "magento_id"
 
@@ -29,11 +39,40 @@ class MagentoOrderDataQueueLineEpt(models.Model):
     sale_order_id = fields.Many2one(comodel_name="sale.order", copy=False,
                                     help="Order created in Odoo.")
     data = fields.Text(help="Data imported from Magento of current order.", copy=False)
+    ordered_sku = fields.Char(string="Ordered SKU", compute="_compute_ordered_sku", search="_search_ordered_sku",
+                              help="SKUs of the ordered products. Only the lines stored as JSONB are "
+                                   "found by this filter, set the payload storage to JSONB to move "
+                                   "the other lines to it.")
     processed_at = fields.Datetime(string="Processed At", copy=False,
                                    help="Shows Date and Time, When the data is processed")
     log_lines_ids = fields.One2many("common.log.lines.ept", "magento_order_data_queue_line_id",
                                     help="Log lines created against which line.")
 
+    _magento_draft_order_unique_index = models.UniqueIndex("(instance_id, magento_id) WHERE state = 'draft'")
+    _magento_payload_json_index = models.Index("USING gin (payload_json jsonb_path_ops)")
+
+    def _auto_init(self):
+        if table_exists(self.env.cr, self._table):
+            # Older duplicated draft lines are cancelled, so the unique index of draft lines can be created.
+            self.env.cr.execute(SQL("""
+                UPDATE %(table)s SET state = 'cancel'
+                WHERE state = 'draft' AND id NOT IN (
+                    SELECT max(id) FROM %(table)s WHERE state = 'draft' GROUP BY instance_id, magento_id)
+            """, table=SQL.identifier(self._table)))
+        return super()._auto_init()
+
+    def _compute_ordered_sku(self):
+        for line in self:
+            items = line.get_payload().get('items', []) if line.has_payload() else []
+            line.ordered_sku = ', '.join(dict.fromkeys(item.get('sku') for item in items if item.get('sku')))
+
+    def _search_ordered_sku(self, operator, value):
+        if operator == '=':
+            operator, value = 'in', [value]
+        if operator != 'in':
+            raise UserError(_("The ordered SKU can only be searched by exact value."))
+        return [('id', 'in', self._search_payload_items('sku', [sku for sku in value if sku]))]
+
     def open_sale_order(self):
         """
         call this method while click on > Order Data Queue line > Sale Order smart button
@@ -48,27 +87,85 @@ class MagentoOrderDataQueueLineEpt(models.Model):
             'domain': [('id', '=', self.sale_order_id.id)]
         }
 
-    def create_order_queue_line(self, instance, order, queue):
-        queueline = self.search([('instance_id', '=', instance.id),
-                                 ('magento_id', '=', order.get('increment_id')), ('state', '=', 'draft')], limit=1,
-                                order='id desc')
-        if queueline:
-            queueline.write({'data': json.dumps(order)})
-            return True
-        self.create({
-            'magento_id': order.get('increment_id'),
-            'instance_id': instance.id,
-            'data': json.dumps(order),
-            'queue_id': queue.id
-        })
-        return True
+    def create_order_queue_lines(self, instance, orders, queue_size):
+        """
+        Insert the orders of an API page in one statement. The data of the draft line of an order
+        already waiting in a queue is updated, the other orders fill the draft queues of the
+        instance up to the queue size and new queues are created for the rest.
+        :param instance: magento.instance()
+        :param orders: list of order responses
+        :param queue_size: Maximum number of lines of a queue
+        :return: ids of the queues of the orders
+        """
+        orders = list({order.get('increment_id'): order for order in orders}.values())
+        if not orders:
+            return []
+        cr = self.env.cr
+        # The draft lines are locked until the commit: a line set done in between would no longer
+        # match the upsert, and its order would be inserted without a queue.
+        cr.execute(SQL("SELECT magento_id FROM %s WHERE instance_id = %s AND state = 'draft' AND magento_id IN %s "
+                       "FOR UPDATE", SQL.identifier(self._table), instance.id,
+                       tuple(order.get('increment_id') for order in orders)))
+        drafts = {row[0] for row in cr.fetchall()}
+        slots = self.env['magento.order.data.queue.ept']._get_order_queue_slots(
+            instance, len([order for order in orders if order.get('increment_id') not in drafts]), queue_size)
+        storage = self.get_payload_storage()
+        rows = []
+        for order in orders:
+            queue_id = None if order.get('increment_id') in drafts else slots.pop(0)
+            data, payload_json, payload_zip = self._prepare_payload_columns(order, storage)
+            rows.append(SQL("(%s, %s, %s, %s, %s, %s, 'draft', %s, now() at time zone 'UTC', %s, "
+                            "now() at time zone 'UTC')", order.get('increment_id'), instance.id, queue_id,
+                            data, payload_json, payload_zip, self.env.uid, self.env.uid))
+        cr.execute(SQL("""
+            INSERT INTO %(table)s (magento_id, instance_id, queue_id, data, payload_json, payload_zip, state,
+                                   create_uid, create_date, write_uid, write_date)
+            VALUES %(rows)s
+            ON CONFLICT (instance_id, magento_id) WHERE state = 'draft'
+            DO UPDATE SET data = EXCLUDED.data, payload_json = EXCLUDED.payload_json,
+                          payload_zip = EXCLUDED.payload_zip, write_uid = EXCLUDED.write_uid,
+                          write_date = EXCLUDED.write_date
+            RETURNING id, queue_id
+        """, table=SQL.identifier(self._table), rows=SQL(', ').join(rows)))
+        result = cr.fetchall()
+        # The rows are written in SQL, the cache and the stored state of the queues are refreshed.
+        self.env.invalidate_all()
+        self.browse([row[0] for row in result]).modified(['queue_id', 'state'])
+        return list(dict.fromkeys(row[1] for row in result))
+
+    def done_imported_orders(self):
+        """
+        Set done in one statement the lines whose order is already imported in Odoo, like the
+        orders imported again by overlapping date windows.
+        :return: The other lines
+        """
+        if not self:
+            return self
+        self.flush_recordset()
+        self.env.cr.execute(SQL("""
+            UPDATE %(table)s line
+            SET state = 'done', processed_at = now() at time zone 'UTC', data = NULL, payload_json = NULL,
+                payload_zip = NULL, sale_order_id = sale.id, write_uid = %(uid)s, write_date = now() at time zone 'UTC'
+            FROM sale_order sale
+            WHERE line.id = ANY(%(ids)s) AND sale.magento_instance_id = line.instance_id
+            AND sale.magento_order_reference = line.magento_id
+            RETURNING line.id
+        """, table=SQL.identifier(self._table), uid=self.env.uid, ids=self.ids))
+        done = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if done:
+            # The rows are written in SQL, the cache and the stored state of the queues are refreshed.
+            done.invalidate_recordset()
+            done.modified(['state'])
+        return self - done
 
     def auto_import_order_queue_data(self):
         """
         This method used to process synced magento order data in batch of 50 queue lines.
         This method is called from cron job.
         """
+        # Lines claimed by another worker are left to it.
         query = """ SELECT queue_id FROM magento_order_data_queue_line_ept WHERE state = 'draft'
+                    AND (claim_expires_at IS NULL OR claim_expires_at < (now() at time zone 'UTC'))
                     GROUP BY queue_id, create_date
                     ORDER BY create_date ASC
                 """
@@ -79,14 +176,27 @@ class MagentoOrderDataQueueLineEpt(models.Model):
         queues.process_order_queues()
 
     def process_order_queue_line(self, line, log_line):
-        item = json.loads(line.data)
+        is_processed, item, order_vals = self.resolve_order_queue_line(line, log_line)
+        if order_vals:
+            magento_order = self.env['sale.order'].create_sale_orders_ept([(item, order_vals)], line.instance_id,
+                                                                         log_line)
+            line.write({'sale_order_id': magento_order.id})
+        return is_processed
+
+    def resolve_order_queue_line(self, line, log_line):
+        """
+        Check the order of the line and find or create what it needs: statuses, carrier,
+        products, pricelist, customer and taxes.
+        :return: (is_processed, item, values of the order to create or False)
+        """
+        item = line.get_payload()
         order_ref = item.get('increment_id')
         order = self.env['sale.order']
         instance = self.instance_id
         is_exists = order.search([('magento_instance_id', '=', instance.id),
                                   ('magento_order_reference', '=', order_ref)])
         if is_exists:
-            return True
+            return True, item, False
         create_at = item.get("created_at", False)
         # Need to compare the datetime object
         date_order = parser.parse(create_at).astimezone(utc).strftime("%Y-%m-%d %H:%M:%S")
@@ -100,19 +210,25 @@ class MagentoOrderDataQueueLineEpt(models.Model):
             log_line.create_common_log_line_ept(message=message, module='magento_ept', order_ref=line.magento_id,
                                                 magento_order_data_queue_line_id=line.id, model_name=self._name,
                                                 magento_instance_id=instance.id)
-            return False
+            return False, item, False
         is_processed = self.financial_status_config(item, instance, log_line, line)
         if is_processed:
             carrier = self.env['delivery.carrier']
             is_processed = carrier.find_delivery_carrier(item, instance, log_line, line)
             if is_processed:
-                # add create product method
-                item_ids = self.__prepare_product_dict(item.get('items'))
+                # The products checked and mapped by prefetch_order_products() are not asked
+                # again, the others are checked in Magento as before: a product missing in
+                # Magento is logged on the line.
+                cache = get_reference_cache(self.env)
+                unresolved = [order_item for order_item in item.get('items', [])
+                              if not self._get_cached_magento_product(cache, instance, order_item)]
+                item_ids = self.__prepare_product_dict(unresolved)
                 m_product = self.env['magento.product.product']
-                p_items = m_product.with_context(is_order=True).get_products(instance, item_ids, line)
-
+                p_items = m_product.with_context(is_order=True).get_products(instance, item_ids, line) \
+                    if item_ids else []
                 order_item = self.env['sale.order.line'].find_order_item(item, instance, log_line, line.id)
                 if not order_item:
+                    # Products missing in Odoo are downloaded from Magento and created.
                     if p_items:
                         p_queue = self.env['sync.import.magento.product.queue.line']
                         self._update_product_type(p_items, item)
@@ -123,10 +239,119 @@ class MagentoOrderDataQueueLineEpt(models.Model):
                     else:
                         is_processed = False
                 if is_processed:
-                    is_processed = order.create_sale_order_ept(item, instance, log_line, line.id)
-                    if is_processed:
-                        line.write({'sale_order_id': item.get('sale_order_id').id})
-        return is_processed
+                    order_vals = order.prepare_sale_order_ept(item, instance, log_line, line.id)
+                    return bool(order_vals), item, order_vals
+        return is_processed, item, False
+
+    def process_order_queue_lines_bulk(self, log_line, group_commit):
+        """
+        Import the orders of the lines in two phases. Each line is first resolved in a savepoint,
+        and a line failing is set failed. The orders of
+        the resolved lines are then created with one create(). When it fails, the orders are
+        created one by one, so only the failing lines are set failed.
+        :param log_line: common.log.lines.ept()
+        :param group_commit: GroupCommit of the run
+        :return: Number of lines processed
+        """
+        resolved = []
+        processed = 0
+        for line in self:
+            if is_circuit_open(line.instance_id, PRODUCT_API_PATH):
+                break
+            processed += 1
+            is_done, result = group_commit.run(self.resolve_order_queue_line, line, log_line)
+            if not is_done:
+                # The records created by the rolled back line may be cached.
+                get_reference_cache(self.env).clear()
+                self._fail_order_queue_line(line, log_line, result)
+            elif result[2]:
+                resolved.append((line, result[1], result[2]))
+                continue
+            elif result[0]:
+                line.write({'state': 'done', 'processed_at': datetime.now(), **CLEAR_PAYLOAD})
+            else:
+                line.write({'state': 'failed', 'processed_at': datetime.now()})
+                line.forget_payload()
+            group_commit.line_done()
+        if not resolved:
+            group_commit.commit()
+            return processed
+        instance = resolved[0][0].instance_id
+        sale_order = self.env['sale.order']
+        try:
+            with self.env.cr.savepoint():
+                magento_orders = sale_order.create_sale_orders_ept(
+                    [(item, vals) for _line, item, vals in resolved], instance, log_line)
+            batches = [(resolved, magento_orders)]
+        except Exception as error:
+            _logger.info("Magento orders created one by one: %s", error)
+            self.env.invalidate_all()
+            get_reference_cache(self.env).clear()
+            batches = []
+            for line, item, vals in resolved:
+                try:
+                    with self.env.cr.savepoint():
+                        magento_order = sale_order.create_sale_orders_ept([(item, vals)], instance, log_line)
+                    batches.append(([(line, item, vals)], magento_order))
+                except Exception as line_error:
+                    self.env.invalidate_all()
+                    get_reference_cache(self.env).clear()
+                    self._fail_order_queue_line(line, log_line, line_error)
+        for lines, magento_orders in batches:
+            for (line, _item, _vals), magento_order in zip(lines, magento_orders):
+                line.write({'state': 'done', 'processed_at': datetime.now(), 'sale_order_id': magento_order.id,
+                            **CLEAR_PAYLOAD})
+        group_commit.line_done()
+        group_commit.commit()
+        return processed
+
+    @staticmethod
+    def _fail_order_queue_line(line, log_line, error):
+        log_line.create_common_log_line_ept(
+            message="Order {} could not be imported: {}".format(line.magento_id, error),
+            module='magento_ept', order_ref=line.magento_id, magento_order_data_queue_line_id=line.id,
+            model_name=line._name, magento_instance_id=line.instance_id.id)
+        line.write({'state': 'failed', 'processed_at': datetime.now()})
+        line.forget_payload()
+        return True
+
+    def prefetch_order_products(self, instance):
+        """
+        Resolve at once the products ordered in the lines, before processing them. The Magento
+        products of the instance are searched by Magento id and SKU, the Odoo products by SKU
+        for the others, and the reference cache answers find_order_item() from these maps.
+        Only the products missing in Odoo are downloaded from Magento.
+        :param instance: magento.instance()
+        """
+        cache = get_reference_cache(self.env)
+        orders = [line.get_payload() for line in self.filtered(lambda l: l.has_payload())]
+        items = [item for order in orders for item in order.get('items', [])]
+        product_ids = list({str(item.get('product_id')) for item in items if item.get('product_id') is not None})
+        skus = list({item.get('sku') for item in items if item.get('sku')})
+        if not items:
+            return True
+        m_products = self.env['magento.product.product'].search([
+            ('magento_instance_id', '=', instance.id),
+            '|', ('magento_product_id', 'in', product_ids), ('magento_sku', 'in', skus)])
+        for m_product in m_products:
+            # The first product found is kept, as the search with limit=1 of find_order_item().
+            cache.get(('magento_product_id', instance.id, m_product.magento_product_id), lambda: m_product)
+            cache.get(('magento_product_sku', instance.id, m_product.magento_sku), lambda: m_product)
+        missing_items = [item for item in items if not self._get_cached_magento_product(cache, instance, item)]
+        missing_skus = list({item.get('sku') for item in missing_items if item.get('sku')})
+        products = self.env['product.product'].search([('default_code', 'in', missing_skus)]) if missing_skus else []
+        for sku in missing_skus:
+            cache.set(('odoo_product_sku', sku), products.filtered(lambda p: p.default_code == sku))
+        missing_ids = self.__prepare_product_dict([item for item in missing_items if not cache.lookup(
+            ('odoo_product_sku', item.get('sku')))])
+        if missing_ids:
+            self.env['magento.product.product'].prefetch_products(instance, missing_ids)
+        return True
+
+    @staticmethod
+    def _get_cached_magento_product(cache, instance, item):
+        return cache.lookup(('magento_product_id', instance.id, str(item.get('product_id')))) or \
+            cache.lookup(('magento_product_sku', instance.id, item.get('sku')))
 
     @staticmethod
     def __prepare_product_dict(items):
@@ -155,8 +380,9 @@ class MagentoOrderDataQueueLineEpt(models.Model):
         is_processed = True
         f_status = self.env['magento.financial.status.ept']
         method = item.get('payment', dict()).get('method')
-        gateway = instance_id.payment_method_ids.filtered(
-            lambda x: x.payment_method_code == method)
+        gateway = get_reference_cache(self.env).get(
+            ('payment_method', instance_id.id, method),
+            lambda: instance_id.payment_method_ids.filtered(lambda x: x.payment_method_code == method))
         payment_name = gateway.payment_method_name
         f_status = f_status.search_financial_status(item, instance_id, gateway)
         workflow = f_status.get('workflow')
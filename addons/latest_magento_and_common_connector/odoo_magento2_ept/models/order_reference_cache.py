@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the cache of the reference data looked up while importing orders.
+"""
+import threading
+from odoo import models, api
+
+# Generation of the reference data per database, increased when it is changed in this process.
+_generations = {}
+_generation_lock = threading.Lock()
+
+
+def invalidate_reference_cache(env):
+    with _generation_lock:
+        _generations[env.cr.dbname] = _generations.get(env.cr.dbname, 0) + 1
+
+
+def get_reference_cache(env):
+    """
+    Return the reference cache of the running queue process, or a cache keeping nothing.
+    """
+    return env.context.get('magento_reference_cache') or NO_CACHE
+
+
+class OrderReferenceCache:
+    """
+    Keeps the result of the lookups repeated for every order of a queue run, like the payment
+    methods, financial statuses, carriers, pricelists, currencies, taxes, store views and
+    countries. It is built at the start of the run and given to the order processing in the
+    context. Every value is dropped when the reference data is changed in this process, the
+    changes of the other processes are seen by the next run.
+    """
+
+    def __init__(self, env):
+        self.dbname = env.cr.dbname
+        self.generation = _generations.get(self.dbname, 0)
+        self.values = {}
+
+    def get(self, key, compute):
+        """
+        Return the cached value of the key, computed first with compute() when missing.
+        """
+        self._check_generation()
+        if key not in self.values:
+            self.values[key] = compute()
+        return self.values[key]
+
+    def set(self, key, value):
+        self._check_generation()
+        self.values[key] = value
+        return value
+
+    def lookup(self, key):
+        """
+        Return the cached value of the key, or None. A miss is not stored.
+        """
+        self._check_generation()
+        return self.values.get(key)
+
+    def clear(self):
+        self.values.clear()
+        return True
+
+    def _check_generation(self):
+        generation = _generations.get(self.dbname, 0)
+        if generation != self.generation:
+            self.values.clear()
+            self.generation = generation
+
+
+class _NoCache:
+    def get(self, key, compute):
+        return compute()
+
+    def set(self, key, value):
+        return value
+
+    def lookup(self, key):
+        return None
+
+    def clear(self):
+        return True
+
+
+NO_CACHE = _NoCache()
+
+
+class MagentoReferenceDataMixin(models.AbstractModel):
+    """
+    Drops the order reference caches of this process when the records are changed.
+    """
+    _name = "magento.reference.data.mixin"
+    _description = "Magento Reference Data"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        invalidate_reference_cache(self.env)
+        return super().create(vals_list)
+
+    def write(self, vals):
+        invalidate_reference_cache(self.env)
+        return super().write(vals)
+
+    def unlink(self):
+        invalidate_reference_cache(self.env)
+        return super().unlink()
@@ -8,10 +8,14 @@ import logging
 import time
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-from .api_request import req, create_search_criteria
+from .api_request import req, create_search_criteria, fetch_pages, fetch_cursor_pages, \
+    is_circuit_open, PRODUCT_API_PATH
+from .api_fields import get_import_fields
 from ..python_library.php import Php
 
 _logger = logging.getLogger('MagentoProductQueue')
+# SKUs searched by request, each SKU adds a filter to the URL.
+SKU_BATCH_SIZE = 20
 
 
 class MagentoProductQueue(models.Model):
@@ -132,8 +136,9 @@ class MagentoProductQueue(models.Model):
         return filters
 
     def _create_product_queue(self, instance):
+        queue_size = self.env['magento.queue.sizing'].get_sizing(instance, 'product').queue_size
         queue = self.search([('instance_id', '=', instance.id), ('state', '=', 'draft')])
-        queue = queue.filtered(lambda q: len(q.line_ids) < 50)
+        queue = queue.filtered(lambda q: len(q.line_ids) < queue_size)
         if not queue:
             queue = self.create({
                 'instance_id': instance.id,
@@ -143,50 +148,105 @@ class MagentoProductQueue(models.Model):
             instance.show_popup_notification(message)
         return queue
 
-    def create_product_queues(self, instance, from_date, to_date, p_type, is_update=True, current=0):
+    def create_product_queues(self, instance, from_date, to_date, p_type, is_update=True, current=0,
+                              tracker=None, watermark=None):
         """
         Creates product queues when sync/ import products from Magento.
         :param instance: current instance of Magento
         :param from_date:  Sync product start from this date
         :param to_date: Sync product end to this date
+        :param tracker: Watermark tracker skipping the products already imported
+        :param watermark: Watermark of the scheduled import, keeping its cursors
         :return:
         """
         queues = []
-        queue_line = self.env['sync.import.magento.product.queue.line']
         current_page = instance.magento_import_product_page_count
+        sizing = self.env['magento.queue.sizing'].get_sizing(instance, 'product')
+        is_resume = instance.magento_api_pagination == 'page' and (current_page > 1 or current)
+        page_size = sizing.get_page_size(is_resume)
         filters = self._get_product_search_filter(from_date=from_date, to_date=to_date, product_type=p_type,
                                                   import_product_on=instance.import_product_on,
                                                   import_disable_products=instance.import_disable_products)
         products = self._get_product_response(instance, filters, current_page, get_pages=True)
         self._update_import_product_counter(instance, products)
-        total_page = math.ceil(int(products.get('total_count')) / 50)
+        total_page = math.ceil(int(products.get('total_count')) / page_size)
+        if instance.magento_api_pagination == 'cursor':
+            watermark = watermark or self.env['magento.sync.watermark'].get_watermark(instance, 'manual_product')
+            return self._create_product_queues_by_cursor(instance, filters, is_update, queues, tracker,
+                                                         cursor_args=(watermark, p_type, from_date, to_date))
         if current:
             current_page = current
-        for page in range(current_page, total_page + 1):
-            products = self._get_product_response(instance, filters, page=page)
+        projection = get_import_fields(instance, 'product')
+        pages = fetch_pages(instance, lambda page: self._get_product_path(filters, page, projection=projection,
+                                                                          page_size=page_size),
+                            range(current_page, total_page + 1), is_raise=True, on_page=sizing.record_page)
+        for page, products in pages:
             if not products.get('items', []):
                 self._update_import_product_counter(instance, products)
                 break
-            queue = self._create_product_queue(instance)
-            queues.append(queue.id)
             try:
-                for product in products.get('items'):
-                    # Create new queue if the 50 queue_line count is reached.
-                    if len(queue.line_ids) == 50:
-                        queue = self._create_product_queue(instance)
-                    queue_line.create_product_queue_line(product=product,
-                                                         instance_id=instance.id,
-                                                         is_update=is_update,
-                                                         queue_id=queue.id)
+                self._create_product_queue_lines(instance, products.get('items'), is_update, queues, tracker)
                 self.env.cr.commit()
             except Exception as error:
                 _logger.error(error)
+                if tracker:
+                    tracker.failed = True
                 instance.write({'magento_import_product_page_count': page})
                 self.env.cr.commit()
         instance.write({'magento_import_product_page_count': 1})
         self.env.cr.commit()
         return queues
 
+    def _create_product_queues_by_cursor(self, instance, filters, is_update, queues, tracker=None,
+                                         cursor_args=None):
+        """
+        Creates the product queues with keyset pagination. The last imported product id is stored
+        in the watermark after each page, with the date window of the import, so an interrupted
+        import of the same window resumes right after it.
+        :param instance: magento.instance()
+        :param filters: Product search filters
+        :param is_update: If True, update the existing products
+        :param queues: List of created queue ids
+        :param tracker: Watermark tracker skipping the products already imported
+        :param cursor_args: (watermark, product type, from date, to date) keeping the cursor
+        :return: List of created queue ids
+        """
+        watermark, key, from_date, to_date = cursor_args
+        projection = get_import_fields(instance, 'product')
+        sizing = self.env['magento.queue.sizing'].get_sizing(instance, 'product')
+        page_size = sizing.page_size
+        pages = fetch_cursor_pages(
+            instance, lambda cursor: self._get_product_path(filters, cursor=cursor, projection=projection,
+                                                            page_size=page_size),
+            cursor=watermark.get_cursor(key, from_date, to_date), page_size=page_size, item_key='id',
+            is_raise=True, on_page=sizing.record_page)
+        for cursor, products in pages:
+            self._create_product_queue_lines(instance, products.get('items'), is_update, queues, tracker)
+            watermark.save_cursor(key, cursor, from_date, to_date)
+            self.env.cr.commit()
+        watermark.save_cursor(key, 0, from_date, to_date)
+        self.env.cr.commit()
+        return queues
+
+    def _create_product_queue_lines(self, instance, products, is_update, queues, tracker=None):
+        if tracker:
+            products = tracker.filter_items(products)
+        if not products:
+            return queues
+        queue_line = self.env['sync.import.magento.product.queue.line']
+        queue_size = self.env['magento.queue.sizing'].get_sizing(instance, 'product').queue_size
+        queue = self._create_product_queue(instance)
+        queues.append(queue.id)
+        for product in products:
+            # Create new queue if the queue size is reached.
+            if len(queue.line_ids) >= queue_size:
+                queue = self._create_product_queue(instance)
+            queue_line.create_product_queue_line(product=product,
+                                                 instance_id=instance.id,
+                                                 is_update=is_update,
+                                                 queue_id=queue.id)
+        return queues
+
     def _update_import_product_counter(self, instance, response):
         if not response.get('total_count', 0):
             instance.write({'magento_import_product_page_count': 1})
@@ -196,18 +256,27 @@ class MagentoProductQueue(models.Model):
 
     @staticmethod
     def _get_product_response(instance, filters, page=1, get_pages=False):
-        s_fields = []
+        api_url = MagentoProductQueue._get_product_path(filters, page, get_pages)
+        return req(instance, api_url, is_raise=True)
+
+    @staticmethod
+    def _get_product_path(filters, page=1, get_pages=False, cursor=None, projection=None, page_size=50):
+        s_fields = list(projection or [])
         if get_pages:
             page = 1
-            s_fields.append('total_count')
-        search_criteria = create_search_criteria(filters, page_size=50, page=page, fields=s_fields)
+            s_fields = ['total_count']
+        cursor_field = 'entity_id' if cursor is not None else False
+        search_criteria = create_search_criteria(filters, page_size=page_size, page=page, fields=s_fields,
+                                                 cursor=cursor, cursor_field=cursor_field)
         query_string = Php.http_build_query(search_criteria)
-        api_url = f'/V1/products?{query_string}'
-        return req(instance, api_url, is_raise=True)
+        return f'/V1/products?{query_string}'
 
     def import_specific_product(self, instance, product_sku_lists, is_update):
         """
         Creates product queues when sync/ import products from Magento.
+        The SKUs are searched by chunks, downloaded at the same time, and the SKUs not found
+        in Magento are logged once all the chunks are received. The SKUs with a comma can't be
+        given to an in filter, they are searched one by one.
         :param instance: current instance of Magento
         :param product_sku_lists:  Dictionary of Product SKUs
         :return:
@@ -215,31 +284,51 @@ class MagentoProductQueue(models.Model):
         queue_line = self.env["sync.import.magento.product.queue.line"]
         log_line = self.env['common.log.lines.ept']
         queues = []
-        queue = self._create_product_queue(instance)
-        queues.append(queue.id)
-        for product_sku in product_sku_lists:
-            try:
-                sku = Php.quote_sku(product_sku)
-                api_url = f'/V1/products/{sku}'
-                response = req(instance, api_url)
-            except Exception as error:
-                if len(product_sku_lists) > 1:
-                    log_line.create_common_log_line_ept(message=f'Magento Product Not found for SKU {product_sku}',
-                                                        module='magento_ept',
-                                                        default_code=product_sku,
-                                                        model_name=self._name,
-                                                        magento_instance_id=instance.id)
-                    continue
-                else:
-                    raise UserError(_("Error while requesting products" + str(error)))
-            if response:
-                if len(queue.line_ids) >= 50:
-                    queue = self._create_product_queue(instance)
-                    queues.append(queue.id)
-                queue_line.create_product_queue_line(product=response, instance_id=instance.id,
-                                                     is_update=is_update, queue_id=queue.id)
+        skus = list(dict.fromkeys(product_sku_lists))
+        in_skus = [sku for sku in skus if ',' not in str(sku)]
+        chunks = [[sku] for sku in skus if ',' in str(sku)]
+        chunks += [in_skus[index:index + SKU_BATCH_SIZE] for index in range(0, len(in_skus), SKU_BATCH_SIZE)]
+        projection = get_import_fields(instance, 'product')
+        products = []
+        try:
+            pages = fetch_pages(instance, lambda index: self._get_product_sku_path(chunks[index], projection),
+                                range(len(chunks)), is_raise=True)
+            for _index, response in pages:
+                products += response.get('items', [])
+        except Exception as error:
+            raise UserError(_("Error while requesting products" + str(error)))
+        found_skus = {str(product.get('sku')).lower() for product in products}
+        not_found_skus = [sku for sku in skus if str(sku).lower() not in found_skus]
+        if len(skus) == 1 and not_found_skus:
+            raise UserError(_("Magento Product Not found for SKU %s", skus[0]))
+        for product_sku in not_found_skus:
+            log_line.create_common_log_line_ept(message=f'Magento Product Not found for SKU {product_sku}',
+                                                module='magento_ept',
+                                                default_code=product_sku,
+                                                model_name=self._name,
+                                                magento_instance_id=instance.id)
+        queue_size = self.env['magento.queue.sizing'].get_sizing(instance, 'product').queue_size
+        index = 0
+        while index < len(products):
+            # A draft queue may already have lines, it is only filled up to the queue size.
+            queue = self._create_product_queue(instance)[0]
+            room = max(queue_size - len(queue.line_ids), 1)
+            if queue.id not in queues:
+                queues.append(queue.id)
+            queue_line.create_product_queue_lines(products[index:index + room], instance_id=instance.id,
+                                                  is_update=is_update, queue_id=queue.id)
+            queue.invalidate_recordset(['line_ids'])
+            index += room
         return queues
 
+    @staticmethod
+    def _get_product_sku_path(skus, projection=None):
+        condition = {'eq': skus[0]} if len(skus) == 1 else {'in': skus}
+        search_criteria = create_search_criteria({'sku': condition}, page_size=len(skus), page=1,
+                                                 fields=projection or [])
+        query_string = Php.http_build_query(search_criteria)
+        return f'/V1/products?{query_string}'
+
     @api.model
     def retrieve_dashboard(self, *args, **kwargs):
         dashboard = self.env['queue.line.dashboard']
@@ -250,10 +339,17 @@ class MagentoProductQueue(models.Model):
         for queue in self.filtered(lambda q: q.state not in ['completed']):
             cron_name = "odoo_magento2_ept.ir_cron_parent_to_process_product_queue_data"
             process_cron_time = queue.instance_id.get_magento_cron_execution_time(cron_name)
+            if is_circuit_open(queue.instance_id, PRODUCT_API_PATH):
+                # Magento is failing, the queue is left as it is for the next run.
+                continue
+            domain = ['draft', 'cancel', 'failed']
+            # Only the lines claimed by this worker are processed, another worker may process the queue.
+            claimed = queue.line_ids.filtered(lambda l: l.state in domain).claim_lines(process_cron_time, domain)
+            if not claimed:
+                continue
             # To maintain that current queue has started to process.
             self.env.cr.commit()
             queue.write({'is_process_queue': True})
-            domain = ['draft', 'cancel', 'failed']
             queue.write({'process_count': queue.process_count + 1})
             if not is_manual and queue.process_count >= 3:
                 queue.write({'process_count': queue.process_count + 1})
@@ -265,12 +361,17 @@ class MagentoProductQueue(models.Model):
                 queue.instance_id.create_schedule_activity(queue=queue, note=note)
                 domain.remove('failed')
                 queue.write({'is_process_queue': False})
-            lines = queue.line_ids.filtered(lambda l: l.state in domain)
+            lines = claimed.filtered(lambda l: l.state in domain)
+            queue_start = time.time()
             lines.process_queue_line()
+            processed = len(lines.filtered(lambda l: l.state in ('done', 'failed')))
+            sizing = self.env['magento.queue.sizing'].get_sizing(queue.instance_id, 'product')
+            sizing.record_processing(processed, time.time() - queue_start)
             message = f"Product Queue #{queue.name} Processed!!"
             queue.instance_id.show_popup_notification(message)
             # To maintain that current queue process are completed and new queue will be executed.
             queue.write({'is_process_queue': False})
+            claimed.release_lines()
             self.env.cr.commit()
             if time.time() - start > process_cron_time - 60:
                 return True
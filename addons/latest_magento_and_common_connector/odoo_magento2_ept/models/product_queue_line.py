@@ -3,9 +3,11 @@
 """
 Describes methods to store sync/ Import product queue line
 """
-import json
 from datetime import datetime
 from odoo import models, fields, _
+from .api_request import is_circuit_open, PRODUCT_API_PATH
+from .group_commit import GroupCommit, commit_line
+from .queue_payload import CLEAR_PAYLOAD
 
 
 class MagentoProductQueueLine(models.Model):
@@ -13,6 +15,7 @@ class MagentoProductQueueLine(models.Model):
     Describes sync/ Import product Queue Line
     """
     _name = "sync.import.magento.product.queue.line"
+    _inherit = ['magento.queue.line.claim', 'magento.queue.payload']
     _description = "Sync/ Import Product Queue Line"
     _rec_name = "product_sku"
     queue_id = fields.Many2one(comodel_name="sync.import.magento.product.queue", ondelete="cascade")
@@ -37,21 +40,42 @@ class MagentoProductQueueLine(models.Model):
                                  ('product_sku', '=', kwargs.get('product', {}).get('sku')),
                                  ('state', '=', 'draft')], limit=1, order='id desc')
         if queueline:
-            queueline.write({'data': json.dumps(kwargs.get('product'))})
+            queueline.write(self._prepare_payload_vals(kwargs.get('product')))
             return queueline
 
         values = self.__prepare_product_queue_line_values(**kwargs)
         return self.create(values)
 
-    @staticmethod
-    def __prepare_product_queue_line_values(**kwargs):
+    def create_product_queue_lines(self, products, **kwargs):
+        """
+        Creates the queue lines of many products at once. As in create_product_queue_line(),
+        the data of an existing draft line of the same SKU is updated instead.
+        :param products: list of product responses
+        :return: created queue lines
+        """
+        drafts = self.search([('instance_id', '=', kwargs.get('instance_id')),
+                              ('product_sku', 'in', [product.get('sku') for product in products]),
+                              ('state', '=', 'draft')], order='id desc')
+        draft_lines = {}
+        for draft in drafts:
+            draft_lines.setdefault(draft.product_sku, draft)
+        values = []
+        for product in products:
+            queueline = draft_lines.get(product.get('sku'))
+            if queueline:
+                queueline.write(self._prepare_payload_vals(product))
+                continue
+            values.append(self.__prepare_product_queue_line_values(product=product, **kwargs))
+        return self.create(values)
+
+    def __prepare_product_queue_line_values(self, **kwargs):
         return {
             'product_sku': kwargs.get('product', {}).get('sku'),
             'instance_id': kwargs.get('instance_id'),
-            'data': json.dumps(kwargs.get('product')),
             'queue_id': kwargs.get('queue_id', False),
             'state': 'draft',
-            'do_not_update_existing_product': kwargs.get('is_update', False)
+            'do_not_update_existing_product': kwargs.get('is_update', False),
+            **self._prepare_payload_vals(kwargs.get('product')),
         }
 
     def magento_create_product_queue(self, instance):
@@ -73,7 +97,9 @@ class MagentoProductQueueLine(models.Model):
         This method used to process synced magento product data in batch of 50 queue lines.
         This method is called from cron job.
         """
+        # Lines claimed by another worker are left to it.
         query = """ SELECT queue_id FROM sync_import_magento_product_queue_line WHERE state = 'draft'
+                    AND (claim_expires_at IS NULL OR claim_expires_at < (now() at time zone 'UTC'))
                     GROUP BY queue_id, create_date
                     ORDER BY create_date ASC
                 """
@@ -85,14 +111,25 @@ class MagentoProductQueueLine(models.Model):
         return True
 
     def process_queue_line(self):
-        for line in self:
-            item = json.loads(line.data)
-            is_processed = self.import_products(item, line)
+        group_commit = GroupCommit(self.env, self[:1].instance_id)
+        for line in group_commit.get_env(self):
+            if is_circuit_open(line.instance_id, PRODUCT_API_PATH):
+                break
+            item = line.get_payload()
+            is_done, is_processed = group_commit.run(line.import_products, item, line)
+            if not is_done:
+                self.env['common.log.lines.ept'].create_common_log_line_ept(
+                    message=f"Product {line.product_sku} could not be imported: {is_processed}",
+                    module='magento_ept', res_id=line.id, model_name=line._name,
+                    magento_import_product_queue_line_id=line.id, default_code=line.product_sku,
+                    magento_instance_id=line.instance_id.id)
+                is_processed = False
             if is_processed:
-                line.write({'state': 'done', 'processed_at': datetime.now(), 'data': False})
+                line.write({'state': 'done', 'processed_at': datetime.now(), **CLEAR_PAYLOAD})
             else:
                 line.write({'state': 'failed', 'processed_at': datetime.now()})
-            self.env.cr.commit()
+            group_commit.line_done()
+        group_commit.commit()
         return True
 
     def import_products(self, item, line):
@@ -158,6 +195,6 @@ class MagentoProductQueueLine(models.Model):
                                                     default_code=item.get('sku'),
                                                     magento_instance_id=line.instance_id.id)
             line.queue_id.write({'is_process_queue': False})
-            self.env.cr.commit()
+            commit_line(self.env)
             return False
         return True
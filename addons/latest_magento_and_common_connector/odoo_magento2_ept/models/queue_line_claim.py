@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the claim of queue lines by the workers processing the queues.
+"""
+import os
+import socket
+import threading
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+# Process crons which are copied to run several workers at the same time.
+WORKER_CRONS = [
+    'odoo_magento2_ept.magento_ir_cron_parent_to_process_order_queue_data',
+    'odoo_magento2_ept.ir_cron_parent_to_process_product_queue_data',
+    'odoo_magento2_ept.magento_ir_cron_to_process_export_stock_queue_data',
+]
+WORKER_CRON_SUFFIX = '_worker_%d'
+MAX_QUEUE_WORKERS = 8
+# States of the lines which can be processed.
+PROCESSABLE_STATES = ('draft', 'failed')
+
+
+class MagentoQueueLineClaim(models.AbstractModel):
+    """
+    Lets several workers process the queues of an instance at the same time. A worker claims the
+    lines of a queue before processing them: the lines are locked with FOR UPDATE SKIP LOCKED and
+    leased to the worker until they are released, or until the lease expires when the worker died.
+    The lines claimed or locked by another worker are skipped, as well as the queues in which
+    another worker holds a lease, so a line is never processed twice.
+    """
+    _name = "magento.queue.line.claim"
+    _description = "Magento Queue Line Claim"
+
+    claimed_by = fields.Char(string="Claimed By", copy=False, readonly=True,
+                             help="Worker processing the line.")
+    claim_expires_at = fields.Datetime(string="Claim Expires At", copy=False, readonly=True,
+                                       help="The line can be claimed by another worker after this date.")
+
+    @api.model
+    def _get_claim_worker(self):
+        return '{}-{}-{}'.format(socket.gethostname(), os.getpid(), threading.get_ident())
+
+    def claim_lines(self, lease_seconds, states=PROCESSABLE_STATES):
+        """
+        Claim the lines for the current worker and commit the claim. Only the lines still in one
+        of the states are claimed: a line finished and released by another worker since it was
+        read is not processed again.
+        :param lease_seconds: Seconds after which the claim expires
+        :param states: States of the lines which can be claimed
+        :return: Claimed lines, in the order of self
+        """
+        if not self:
+            return self
+        self.flush_recordset()
+        worker = self._get_claim_worker()
+        table = SQL.identifier(self._table)
+        self.env.cr.execute(SQL("""
+            UPDATE %(table)s SET claimed_by = %(worker)s,
+                                 claim_expires_at = (now() at time zone 'UTC') + %(lease)s * interval '1 second'
+            WHERE id IN (
+                SELECT line.id FROM %(table)s line
+                WHERE line.id = ANY(%(ids)s) AND line.state = ANY(%(states)s)
+                AND (line.claim_expires_at IS NULL OR line.claim_expires_at < (now() at time zone 'UTC')
+                     OR line.claimed_by = %(worker)s)
+                AND NOT EXISTS (
+                    SELECT 1 FROM %(table)s other
+                    WHERE other.queue_id = line.queue_id AND other.claimed_by != %(worker)s
+                    AND other.claim_expires_at >= (now() at time zone 'UTC'))
+                ORDER BY line.id
+                FOR UPDATE SKIP LOCKED)
+            RETURNING id
+        """, table=table, worker=worker, lease=int(lease_seconds), ids=self.ids, states=list(states)))
+        claimed_ids = {row[0] for row in self.env.cr.fetchall()}
+        # The state read before the claim may be outdated.
+        self.invalidate_recordset(['claimed_by', 'claim_expires_at', 'state'])
+        self.env.cr.commit()
+        return self.filtered(lambda line: line.id in claimed_ids)
+
+    def release_lines(self):
+        """
+        Release the lines claimed by the current worker.
+        """
+        if not self:
+            return True
+        self.env.cr.execute(SQL("""
+            UPDATE %(table)s SET claimed_by = NULL, claim_expires_at = NULL
+            WHERE id = ANY(%(ids)s) AND claimed_by = %(worker)s
+        """, table=SQL.identifier(self._table), ids=self.ids, worker=self._get_claim_worker()))
+        self.invalidate_recordset(['claimed_by', 'claim_expires_at'])
+        return True
+
+    @api.model
+    def update_worker_crons(self, workers):
+        """
+        Create or activate a copy of each process cron for every worker after the first one, and
+        deactivate the copies of the workers beyond the number given.
+        :param workers: Number of workers processing each kind of queue
+        """
+        for cron_name in WORKER_CRONS:
+            cron = self.env.ref(cron_name, raise_if_not_found=False)
+            if not cron:
+                continue
+            for worker in range(2, MAX_QUEUE_WORKERS + 1):
+                worker_cron = self.env.ref(cron_name + WORKER_CRON_SUFFIX % worker, raise_if_not_found=False)
+                if worker > workers:
+                    if worker_cron:
+                        worker_cron.write({'active': False})
+                    continue
+                vals = {'active': cron.active, 'interval_number': cron.interval_number,
+                        'interval_type': cron.interval_type}
+                if worker_cron:
+                    worker_cron.write(vals)
+                    continue
+                vals.update({'name': '{} (Worker {})'.format(cron.name, worker)})
+                worker_cron = cron.copy(default=vals)
+                module, name = cron_name.split('.')
+                self.env['ir.model.data'].create({
+                    'module': module,
+                    'name': name + WORKER_CRON_SUFFIX % worker,
+                    'model': 'ir.cron',
+                    'res_id': worker_cron.id,
+                    'noupdate': True
+                })
+        return True
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the storage of the Magento payloads of the queue lines.
+"""
+import base64
+import logging
+import time
+from odoo import models, fields, api
+from odoo.tools import SQL
+from .json_codec import compress_payload, decompress_payload, dumps, loads, ZSTD_MAGIC
+
+_logger = logging.getLogger("Magento EPT")
+
+PAYLOAD_STORAGE_PARAM = 'odoo_magento2_ept.queue_payload_storage'
+PAYLOAD_STORAGES = [('text', 'Text'), ('jsonb', 'JSONB'), ('compressed', 'Compressed')]
+# Columns of each storage, the other columns of a line are empty.
+PAYLOAD_COLUMNS = {'text': 'data', 'jsonb': 'payload_json', 'compressed': 'payload_zip'}
+CLEAR_PAYLOAD = {'data': False, 'payload_json': False, 'payload_zip': False}
+PAYLOAD_MODELS = [
+    'magento.order.data.queue.line.ept',
+    'sync.import.magento.product.queue.line',
+    'magento.customer.data.queue.line.ept',
+    'magento.export.stock.queue.line.ept',
+]
+MIGRATION_BATCH_SIZE = 500
+MIGRATION_SECONDS = 600
+
+
+class PayloadCache:
+    """
+    Keeps the payloads decoded during a queue run, so a line read by several steps of the run is
+    decoded once. It is given to the lines in the context by with_payload_cache(). The payload of
+    a line is dropped when it is written, and should be dropped with forget_payload() when the
+    processing of the line is rolled back, as the processing adds records to the payload.
+    """
+
+    def __init__(self):
+        self.payloads = {}
+
+    def get(self, key, compute):
+        if key not in self.payloads:
+            self.payloads[key] = compute()
+        return self.payloads[key]
+
+    def forget(self, keys):
+        for key in keys:
+            self.payloads.pop(key, None)
+        return True
+
+
+class MagentoQueuePayload(models.AbstractModel):
+    """
+    Stores the Magento payload of a queue line in the storage set in the settings:
+    Text keeps the JSON in the data column as before, JSONB keeps it in a jsonb column which can
+    be filtered in SQL, Compressed keeps it as zstd or zlib compressed JSON in a bytea column.
+    The payload is read with get_payload() and written with the values of _prepare_payload_vals(),
+    whatever the storage of the line. The lines of the other storages are moved by a scheduled
+    action after the storage is changed.
+    """
+    _name = "magento.queue.payload"
+    _description = "Magento Queue Payload"
+
+    data = fields.Text(string="Data", copy=False, help="Data imported from Magento, when stored as Text.")
+    payload_json = fields.Json(string="Payload", copy=False,
+                               help="Data imported from Magento, when stored as JSONB.")
+    # The compressed JSON is kept as raw bytes in the bytea column, not encoded in base64 as the
+    # other binary fields. It is never shown, the preview reads it through get_payload().
+    payload_zip = fields.Binary(string="Compressed Payload", attachment=False, copy=False,
+                                help="Data imported from Magento, when stored compressed.")
+    payload_preview = fields.Text(string="Data", compute="_compute_payload_preview",
+                                  help="Data imported from Magento.")
+
+    @api.depends('data', 'payload_json', 'payload_zip')
+    def _compute_payload_preview(self):
+        for line in self:
+            line.payload_preview = dumps(line._decode_payload(), indent=2) if line.has_payload() else False
+
+    def write(self, vals):
+        if set(vals) & set(CLEAR_PAYLOAD):
+            self.forget_payload()
+        return super().write(vals)
+
+    @api.model
+    def get_payload_storage(self):
+        storage = self.env['ir.config_parameter'].sudo().get_param(PAYLOAD_STORAGE_PARAM, 'text')
+        return storage if storage in PAYLOAD_COLUMNS else 'text'
+
+    def has_payload(self):
+        self.ensure_one()
+        return bool(self.data or self.payload_json or self.payload_zip)
+
+    def with_payload_cache(self):
+        """
+        Return the lines with a new payload cache for the run, unless one is already given.
+        """
+        if self.env.context.get('magento_payload_cache'):
+            return self
+        return self.with_context(magento_payload_cache=PayloadCache())
+
+    def get_payload(self):
+        """
+        Return the payload of the line decoded from its storage, or an empty dict. Within a run
+        with a payload cache, the same decoded payload is returned to every step of the run.
+        """
+        self.ensure_one()
+        cache = self.env.context.get('magento_payload_cache')
+        if not cache:
+            return self._decode_payload()
+        return cache.get((self._name, self.id), self._decode_payload)
+
+    def forget_payload(self):
+        cache = self.env.context.get('magento_payload_cache')
+        if cache:
+            cache.forget([(self._name, line_id) for line_id in self.ids])
+        return True
+
+    def _decode_payload(self):
+        if self.payload_zip:
+            blob = bytes(self.payload_zip)
+            if blob[:4] != ZSTD_MAGIC and blob[:1] != b'\x78':
+                # Compressed payloads written in base64 before they were stored as raw bytes.
+                blob = base64.b64decode(blob)
+            return decompress_payload(blob)
+        if self.payload_json:
+            return self.payload_json
+        return loads(self.data) if self.data else {}
+
+    @api.model
+    def _prepare_payload_vals(self, payload, storage=None):
+        """
+        Return the values writing the payload in the configured storage and emptying the others.
+        :param payload: Data received from Magento
+        :param storage: Storage to use instead of the configured one
+        """
+        storage = storage or self.get_payload_storage()
+        vals = dict(CLEAR_PAYLOAD)
+        if storage == 'jsonb':
+            vals['payload_json'] = payload
+        elif storage == 'compressed':
+            vals['payload_zip'] = compress_payload(payload)
+        else:
+            vals['data'] = dumps(payload)
+        return vals
+
+    @api.model
+    def _prepare_payload_columns(self, payload, storage=None):
+        """
+        Return the SQL values of the data, payload_json and payload_zip columns, for the lines
+        written in SQL.
+        """
+        vals = self._prepare_payload_vals(payload, storage)
+        return (vals['data'] or None,
+                SQL("%s::jsonb", dumps(vals['payload_json'])) if vals['payload_json'] else None,
+                vals['payload_zip'] or None)
+
+    def _migrate_payloads(self, storage, limit):
+        """
+        Move to the storage up to limit lines of this model kept in another storage.
+        :return: Number of lines moved
+        """
+        others = [SQL.identifier(column) for key, column in PAYLOAD_COLUMNS.items() if key != storage]
+        self.env.cr.execute(SQL("SELECT id FROM %s WHERE %s IS NOT NULL OR %s IS NOT NULL ORDER BY id LIMIT %s",
+                                SQL.identifier(self._table), others[0], others[1], limit))
+        lines = self.browse([row[0] for row in self.env.cr.fetchall()])
+        for line in lines:
+            line.write(self._prepare_payload_vals(line._decode_payload(), storage))
+        return len(lines)
+
+    @api.model
+    def _cron_migrate_queue_payloads(self):
+        """
+        Move the payloads of the queue lines to the configured storage by batches, each batch is
+        committed. The scheduled action is triggered again when lines are left at the time limit.
+        """
+        storage = self.get_payload_storage()
+        started_at = time.monotonic()
+        for model in PAYLOAD_MODELS:
+            while True:
+                moved = self.env[model]._migrate_payloads(storage, MIGRATION_BATCH_SIZE)
+                self.env.cr.commit()
+                if moved:
+                    _logger.info("Moved %s payloads of %s to the %s storage", moved, model, storage)
+                if moved < MIGRATION_BATCH_SIZE:
+                    break
+                if time.monotonic() - started_at > MIGRATION_SECONDS:
+                    self._trigger_payload_migration()
+                    return True
+        return True
+
+    @api.model
+    def _trigger_payload_migration(self):
+        cron = self.env.ref('odoo_magento2_ept.magento_ir_cron_to_migrate_queue_payloads', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return True
+
+    @api.model
+    def _search_payload_items(self, key, values):
+        """
+        Return the ids of the lines whose payload has an item with one of the values of key. Only
+        the JSONB storage is searched, with its GIN index. The Text and compressed payloads are
+        moved to it by the scheduled action once the storage is set to JSONB.
+        :param key: Key of the items, like sku
+        :param values: Searched values
+        """
+        conditions = [dumps({'items': [{key: value}]}) for value in values]
+        self.env.cr.execute(SQL("""
+            SELECT id FROM %(table)s WHERE payload_json @> ANY(%(conditions)s::jsonb[])
+        """, table=SQL.identifier(self._table), conditions=conditions))
+        return [row[0] for row in self.env.cr.fetchall()]
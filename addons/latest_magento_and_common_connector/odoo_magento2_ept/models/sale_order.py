@@ -3,13 +3,14 @@
 """
 Describes fields and methods for create/ update sale order
 """
-import json
 import pytz
 import time
 from datetime import datetime, timedelta
-from odoo import models, fields, api, _
+from odoo import models, fields, api, _, Command
 from odoo.exceptions import UserError
 from .api_request import req
+from .api_fields import get_import_fields
+from .order_reference_cache import get_reference_cache
 from dateutil import parser
 
 utc = pytz.utc
@@ -118,6 +119,7 @@ class SaleOrder(models.Model):
     _magento_sale_order_unique_constraint = models.Constraint(
                          'unique(magento_order_id,magento_instance_id,magento_order_reference)',
                          "Magento order must be unique")
+    _magento_order_reference_index = models.Index("(magento_instance_id, magento_order_reference)")
 
     def _cancel_order_exportable(self):
         """
@@ -139,6 +141,17 @@ class SaleOrder(models.Model):
                                                 store=True)
 
     def create_sale_order_ept(self, item, instance, log_line, line_id):
+        vals = self.prepare_sale_order_ept(item, instance, log_line, line_id)
+        if vals:
+            self.create_sale_orders_ept([(item, vals)], instance, log_line)
+        return bool(vals)
+
+    def prepare_sale_order_ept(self, item, instance, log_line, line_id):
+        """
+        Find or create the pricelist, customer and taxes of the order and check its warehouse and
+        products.
+        :return: Values of the order, without its lines, or False when it can't be imported
+        """
         is_processed = self._find_price_list(item, log_line, line_id, instance)
         order_line = self.env['sale.order.line']
         if is_processed:
@@ -151,14 +164,41 @@ class SaleOrder(models.Model):
                 if is_processed:
                     is_processed = self.__find_order_tax(item, instance, log_line, line_id)
                     if is_processed:
-                        vals = self._prepare_order_dict(item, instance)
-                        magento_order = self.create(vals)
-                        item.update({'sale_order_id': magento_order})
-                        order_line.create_order_line(item, instance, log_line, line_id)
-                        self.__create_discount_order_line(item, instance)
-                        self.__create_shipping_order_line(item, instance)
-                        self.__process_order_workflow(item, log_line)
-        return is_processed
+                        return self._prepare_order_dict(item, instance)
+        return False
+
+    def create_sale_orders_ept(self, orders, instance, log_line):
+        """
+        Create the orders prepared by prepare_sale_order_ept() in one create(), with their lines
+        as nested commands, and run their workflow. The lines of all the orders are prepared
+        together, on new orders.
+        :param orders: list of (item, order values)
+        :return: Created orders, in the order of orders
+        """
+        order_line = self.env['sale.order.line']
+        lines = []
+        for item, vals in orders:
+            item.update({'sale_order_id': self.new(vals)})
+            lines.append((item, self.__prepare_discount_order_line(item, instance) +
+                          self.__prepare_shipping_order_line(item, instance)))
+        vals_list, product_indexes = [], []
+        for (_item, vals), (lines_vals, indexes) in zip(orders, order_line.prepare_orders_lines_vals(lines, instance)):
+            # The new order of the values is replaced by the created one.
+            commands = [Command.create({key: value for key, value in line_vals.items() if key != 'order_id'})
+                        for line_vals in lines_vals]
+            vals_list.append(dict(vals, order_line=commands))
+            product_indexes.append(indexes)
+        magento_orders = self.create(vals_list)
+        product_lines = order_line
+        for magento_order, indexes in zip(magento_orders, product_indexes):
+            order_lines = magento_order.order_line.sorted('id')
+            product_lines |= order_line.browse([order_lines.ids[index] for index in indexes])
+        rounding = bool(instance.magento_tax_rounding_method == 'round_per_line')
+        product_lines.with_context(round=rounding)._compute_amount()
+        for (item, _vals), magento_order in zip(orders, magento_orders):
+            item.update({'sale_order_id': magento_order})
+        self.__process_orders_workflow([item for item, _vals in orders])
+        return magento_orders
 
     @staticmethod
     def __find_order_warehouse(item, log_line, line_id):
@@ -180,7 +220,9 @@ class SaleOrder(models.Model):
         currency = item.get('base_currency_code') if instance.is_order_base_currency else item.get(
             'order_currency_code')
         currency_id = self._find_currency(currency)
-        price_list = self.env['product.pricelist'].search([('currency_id', '=', currency_id.id)])
+        cache = get_reference_cache(self.env)
+        price_list = cache.get(('pricelist', currency_id.id),
+                               lambda: self.env['product.pricelist'].search([('currency_id', '=', currency_id.id)]))
         if price_list:
             price_list = price_list[0]
             item.update({'price_list_id': price_list})
@@ -191,21 +233,25 @@ class SaleOrder(models.Model):
                 # 'discount_policy': 'with_discount',
                 'company_id': self.company_id.id,
             })
+            cache.set(('pricelist', currency_id.id), price_list)
             item.update({'price_list_id': price_list})
         return is_processed
 
     def _find_currency(self, currency_code):
         currency = self.env['res.currency']
-        currency = currency.with_context(active_test=False).search([('name', '=', currency_code)],
-                                                                   limit=1)
+        currency = get_reference_cache(self.env).get(
+            ('currency', currency_code),
+            lambda: currency.with_context(active_test=False).search([('name', '=', currency_code)], limit=1))
         if not currency.active:
             currency.write({'active': True})
         return currency
 
     def __update_partner_dict(self, item, instance):
         addresses = []
-        magento_store = instance.magento_website_ids.store_view_ids.filtered(
-            lambda l: l.magento_storeview_id == str(item.get('store_id')))
+        magento_store = get_reference_cache(self.env).get(
+            ('store_view', instance.id, str(item.get('store_id'))),
+            lambda: instance.magento_website_ids.store_view_ids.filtered(
+                lambda l: l.magento_storeview_id == str(item.get('store_id'))))
         m_customer_id = self.__get_customer_id(item)
         website_id = magento_store.magento_website_id.magento_website_id
         customers = {
@@ -325,8 +371,10 @@ class SaleOrder(models.Model):
                     transaction_id = payment_info.get('value')
         return transaction_id
 
-    def __create_shipping_order_line(self, item, instance):
-        order_line = self.env['sale.order.line']
+    def __prepare_shipping_order_line(self, item, instance):
+        """
+        :return: list of (product, price, values) of the shipping line, created with the order lines
+        """
         incl_amount = float(item.get('base_shipping_incl_tax', 0.0)) if instance.is_order_base_currency else float(
             item.get('shipping_incl_tax', 0.0))
         excl_amount = float(item.get('base_shipping_amount', 0.0)) if instance.is_order_base_currency else float(
@@ -338,12 +386,11 @@ class SaleOrder(models.Model):
             price = incl_amount if tax_type else excl_amount
             default_product = self.env.ref('odoo_magento2_ept.product_product_shipping')
             product = sale_order_id.magento_instance_id.shipping_product_id or default_product
-            shipping_line = order_line.prepare_order_line_vals(item, {}, product, price, instance)
-            shipping_line.update({'is_delivery': True})
+            shipping_line = {'is_delivery': True}
             if item.get('shipping_tax'):
                 shipping_line.update({'tax_ids': [(6, 0, item.get('shipping_tax'))]})
-            order_line.create(shipping_line)
-        return True
+            return [(product, price, shipping_line)]
+        return []
 
     def __find_shipping_tax_percent(self, tax_details, ext_attrs):
         if "item_applied_taxes" in ext_attrs:
@@ -395,19 +442,21 @@ class SaleOrder(models.Model):
                 tax_type = True
         return tax_type
 
-    def __create_discount_order_line(self, item, instance):
-        order_line = self.env['sale.order.line']
+    def __prepare_discount_order_line(self, item, instance):
+        """
+        :return: list of (product, price, values) of the discount line, created with the order lines
+        """
         sale_order_id = item.get('sale_order_id')
         price = float(item.get('base_discount_amount') or 0.0) or False if instance.is_order_base_currency else float(
             item.get('discount_amount') or 0.0) or False
         if price:
             default_product = self.env.ref('odoo_magento2_ept.magento_product_product_discount')
             product = sale_order_id.magento_instance_id.discount_product_id or default_product
-            line = order_line.prepare_order_line_vals(item, {}, product, price, instance)
+            line = {}
             if item.get('discount_tax'):
                 line.update({'tax_ids': [(6, 0, item.get('discount_tax'))]})
-            order_line.create(line)
-        return True
+            return [(product, price, line)]
+        return []
 
     @staticmethod
     def __find_discount_tax_percent(items):
@@ -422,6 +471,7 @@ class SaleOrder(models.Model):
     def __find_order_tax(self, item, instance, log_line, line_id):
         order_line = self.env['sale.order.line']
         account_tax_obj = self.env['account.tax']
+        cache = get_reference_cache(self.env)
         tax_details = self.__find_tax_percent_title(item, instance)
         tax_id_list = []
         country_name = False
@@ -429,10 +479,12 @@ class SaleOrder(models.Model):
             'address', False)
         if shipping_details:
             country_code = shipping_details.get('country_id')
-            country_name = self.env['res.partner'].get_country(country_code)
+            country_name = cache.get(('country', country_code),
+                                     lambda: self.env['res.partner'].get_country(country_code))
         for tax in tax_details:
-            tax_id = account_tax_obj.get_tax_from_rate(
-                float(tax.get('tax_percent')), tax.get('tax_title'), tax.get('tax_type'))
+            tax_key = ('tax', float(tax.get('tax_percent')), bool(tax.get('tax_type')))
+            tax_id = cache.get(tax_key, lambda: account_tax_obj.get_tax_from_rate(
+                float(tax.get('tax_percent')), tax.get('tax_title'), tax.get('tax_type')))
             if tax_id and not tax_id.active:
                 message = _(f"""
                 Order {item['increment_id']} was skipped because the tax {tax_id.name}% was not found. 
@@ -445,7 +497,7 @@ class SaleOrder(models.Model):
                 return False
             if not tax_id:
                 tax_vals = order_line.prepare_tax_dict(tax, instance)
-                tax_id = account_tax_obj.sudo().create(tax_vals)
+                tax_id = cache.set(tax_key, account_tax_obj.sudo().create(tax_vals))
             if tax.get('line_tax') != 'shipping_tax':
                 item.update({tax.get('line_tax'): tax_id.ids})
             else:
@@ -454,32 +506,38 @@ class SaleOrder(models.Model):
             item.update({'shipping_tax': tax_id_list})
         return True
 
-    def __process_order_workflow(self, item, log_line):
+    def __process_orders_workflow(self, items):
+        """
+        Run the auto workflow of the created orders. The orders are grouped by workflow, shipment
+        and invoice status, the orders of a group are confirmed, invoiced and paid together.
+        :param items: Magento orders, with their created sale_order_id
+        """
         sale_workflow = self.env['sale.workflow.process.ept']
-        sale_order = item.get('sale_order_id')
-        # Changes On 04.12.2023 by Ketan Chauhan
-        # set and pass context in sale order self object to magento order status
-        # magento_order_status is used in new inherited "validate_and_paid_invoices_ept" method
-        # magento_order_status is used for by-pass invoice validate and invoice paid process...
-        # if magento order is pending
-        ctx = self.env.context.copy()
-        ctx.update({'is_invoice': item.get('extension_attributes').get('is_invoice')})
-        if item.get('status') == 'complete' or \
-                (item.get('status') == 'processing' and
-                 item.get('extension_attributes').get('is_shipment')):
-            sale_order.auto_workflow_process_id.with_context(ctx).shipped_order_workflow_ept(
-                sale_order.with_context(ctx))
-        else:
-            sale_workflow.with_context(ctx).auto_workflow_process_ept(
-                sale_order.auto_workflow_process_id.id, [sale_order.id])
-        if item.get('status') == 'complete' or \
-                (item.get('status') == 'processing' and
-                 item.get('extension_attributes').get('is_invoice')) and \
-                sale_order.invoice_ids:
-            # Here the magento order is complete state or
-            # processing state with invoice so invoice is already created
-            # So Make the Export invoice as true to hide Export invoice button from invoice.
-            sale_order.invoice_ids.write({'is_exported_to_magento': True})
+        groups = {}
+        exported_ids = []
+        for item in items:
+            sale_order = item.get('sale_order_id')
+            attributes = item.get('extension_attributes')
+            is_shipped = item.get('status') == 'complete' or \
+                (item.get('status') == 'processing' and attributes.get('is_shipment'))
+            # The Magento invoice status is passed in the context to validate_and_paid_invoices_ept,
+            # the invoices of the pending orders are not paid.
+            key = (is_shipped, sale_order.auto_workflow_process_id, attributes.get('is_invoice'))
+            groups.setdefault(key, []).append(sale_order.id)
+            if item.get('status') == 'complete' or \
+                    (item.get('status') == 'processing' and attributes.get('is_invoice')):
+                exported_ids.append(sale_order.id)
+        for (is_shipped, workflow, is_invoice), order_ids in groups.items():
+            ctx = dict(self.env.context, is_invoice=is_invoice)
+            if is_shipped:
+                workflow.with_context(ctx).shipped_order_workflow_ept(self.browse(order_ids).with_context(ctx))
+            else:
+                sale_workflow.with_context(ctx).auto_workflow_process_ept(workflow.id, order_ids)
+        # Here the magento order is complete state or
+        # processing state with invoice so invoice is already created
+        # So Make the Export invoice as true to hide Export invoice button from invoice.
+        self.browse(exported_ids).invoice_ids.write({'is_exported_to_magento': True})
+        return True
 
     def cancel_order_from_magento(self):
         """
@@ -510,8 +568,12 @@ class SaleOrder(models.Model):
         """
         instance = kwargs.get('instance')
         order_queue = self.env['magento.order.data.queue.ept']
+        kwargs.update({'fields': get_import_fields(instance, 'cancel_order')})
         orders = order_queue._get_order_response(instance, kwargs, False)
-        for order in orders['items']:
+        orders = orders['items']
+        if kwargs.get('tracker'):
+            orders = kwargs.get('tracker').filter_items(orders)
+        for order in orders:
             order_id = order.get('entity_id', 0)
             sale_order = self.search([('magento_instance_id', '=', instance.id),
                                       ('magento_order_id', '=', str(order_id))], limit=1)
@@ -554,6 +616,53 @@ class SaleOrder(models.Model):
             })
         return invoice_vals
 
+    def process_orders_and_invoices_ept(self):
+        """
+        Inherit this method from common connector:sale order
+        The Magento orders are processed by workflow: the orders of a workflow are confirmed
+        together, then invoiced, posted and paid together, instead of order by order.
+        :return: True
+        """
+        magento_orders = self.filtered(lambda order: order.magento_instance_id)
+        super(SaleOrder, self - magento_orders).process_orders_and_invoices_ept()
+        workflows = {}
+        for order in magento_orders:
+            if order.invoice_status != 'invoiced':
+                workflows.setdefault(order.auto_workflow_process_id, []).append(order.id)
+        for work_flow_process_record, order_ids in workflows.items():
+            orders = self.browse(order_ids)
+            if work_flow_process_record.validate_order:
+                orders.validate_orders_ept()
+            orders = orders.filtered(lambda order: order.__is_invoiced_by_workflow())
+            if orders:
+                orders.validate_and_paid_invoices_ept(work_flow_process_record)
+        return True
+
+    def __is_invoiced_by_workflow(self):
+        """
+        Same check as process_orders_and_invoices_ept of the common connector: the order is
+        invoiced by the workflow when it has storable products or only products invoiced on order.
+        """
+        order_lines = self.order_line.filtered(lambda l: l.product_id.invoice_policy == 'order')
+        return bool(order_lines.filtered(lambda l: l.product_id.type == 'consu' and l.product_id.is_storable)) or \
+            len(self.order_line) == len(order_lines.filtered(
+                lambda l: l.product_id.type in ['service', 'consu'] and not l.product_id.is_storable))
+
+    def validate_orders_ept(self):
+        """
+        Confirm the orders together and write back their order dates, as validate_order_ept does
+        for one order.
+        :return: True
+        """
+        date_orders = {}
+        for order in self:
+            date_orders.setdefault(order.date_order, []).append(order.id)
+        self.env['product.product'].invalidate_model(fnames=['display_name'])
+        self.action_confirm()
+        for date_order, order_ids in date_orders.items():
+            self.browse(order_ids).write({'date_order': date_order})
+        return True
+
     def validate_and_paid_invoices_ept(self, work_flow_process_record):
         """
         Inherit this method from common connector:sale order
@@ -561,34 +670,80 @@ class SaleOrder(models.Model):
         but changes is flow is, if magento order status is pending then only create draft invoice, do not validate
         and register payment
         changes by @Ketan Chauhan On 04.Dec.2023 when magento migration in v17
+        The Magento orders are invoiced together: one _create_invoices() creating an invoice per
+        order, the invoices are posted together and paid by paid_invoices_ept().
 
         :param : work_flow_process_record: sale.workflow.process.ept()
         :return: True
         """
-        self.ensure_one()
-        if not self.magento_instance_id:
-            return super(SaleOrder, self).validate_and_paid_invoices_ept(work_flow_process_record)
-
-        if work_flow_process_record.create_invoice:
-            if work_flow_process_record.invoice_date_is_order_date:
-                # if self.check_fiscal_year_lock_date_ept():
-                #     return True
-                if self.check_fiscal_year_lock_date_ept():
-                    return True
-            if work_flow_process_record.sale_journal_id:
-                invoices = self.with_context(journal_ept=work_flow_process_record.sale_journal_id)._create_invoices()
-            else:
-                invoices = self._create_invoices()
-            self.validate_invoice_ept(invoices)
-            if work_flow_process_record.register_payment:
-                is_invoice = True
-                _logger.info(self.env.context)
-                if self.env.context.get('is_invoice') is not None:
-                    is_invoice = self.env.context.get('is_invoice')
-                if self.magento_instance_id and not is_invoice:
-                    return True
-                _logger.info("Going to create payment....")
-                self.paid_invoice_ept(invoices)
+        for order in self.filtered(lambda order: not order.magento_instance_id):
+            super(SaleOrder, order).validate_and_paid_invoices_ept(work_flow_process_record)
+        orders = self.filtered(lambda order: order.magento_instance_id)
+        if not orders or not work_flow_process_record.create_invoice:
+            return True
+        if work_flow_process_record.invoice_date_is_order_date:
+            orders = orders.filtered(lambda order: not order.check_fiscal_year_lock_date_ept())
+            if not orders:
+                return True
+        if work_flow_process_record.sale_journal_id:
+            orders = orders.with_context(journal_ept=work_flow_process_record.sale_journal_id)
+        # Grouped by order, the orders of a customer are not invoiced together.
+        invoices = orders._create_invoices(grouped=True)
+        invoices.action_post()
+        if work_flow_process_record.register_payment:
+            is_invoice = True
+            if self.env.context.get('is_invoice') is not None:
+                is_invoice = self.env.context.get('is_invoice')
+            if not is_invoice:
+                return True
+            _logger.info("Going to create payment....")
+            orders.paid_invoices_ept(invoices, work_flow_process_record)
+        return True
+
+    def paid_invoices_ept(self, invoices, work_flow_process_record):
+        """
+        Pay the invoices as paid_invoice_ept does, with one payment per invoice. The payments are
+        created, posted and reconciled together.
+        :param : invoices: account.move()
+        :param : work_flow_process_record: sale.workflow.process.ept()
+        :return: account.payment()
+        """
+        vals_list = []
+        invoice_ids = []
+        for invoice in invoices:
+            total_payment_sum = sum(
+                invoice.matched_payment_ids.filtered(lambda P: P.state in ['in_process', 'paid']).mapped('amount'))
+            invoice_amount = invoice.amount_residual
+            if (invoice_amount - total_payment_sum) > 0:
+                vals = invoice.prepare_payment_dict(work_flow_process_record)
+                vals.update({'amount': invoice_amount - total_payment_sum})
+                vals_list.append(vals)
+                invoice_ids.append(invoice.id)
+        payments = self.env['account.payment'].create(vals_list)
+        payments.action_post()
+        self.reconcile_payments_ept(payments, invoices.browse(invoice_ids))
+        return payments
+
+    def reconcile_payments_ept(self, payments, invoices):
+        """
+        Reconcile each payment with its invoice, as reconcile_payment_ept does, in one
+        reconciliation of all the invoices.
+        :param: payments: account.payment()
+        :param: invoices: account.move(), the invoice of each payment
+        :return: True
+        """
+        domain = [('account_type', 'in', ('asset_receivable', 'liability_payable')), ('parent_state', '=', 'posted'),
+                  ('reconciled', '=', False)]
+        reconciliation_plan = []
+        for payment, invoice in zip(payments, invoices):
+            invoice_lines = invoice.line_ids.filtered(lambda line: line.account_type == 'asset_receivable')
+            payment_lines = payment.move_id.line_ids.filtered_domain(domain)
+            for account in payment_lines.account_id:
+                reconciliation_plan.append((payment_lines + invoice_lines).filtered_domain(
+                    [('account_id', '=', account.id), ('parent_state', '=', 'posted'), ('reconciled', '=', False)]))
+        self.env['account.move.line']._reconcile_plan(reconciliation_plan)
+        for payment, invoice in zip(payments, invoices):
+            invoice.matched_payment_ids += payment
         return True
 
     def open_order_in_magento(self):
@@ -3,8 +3,9 @@
 """For Odoo Magento2 Connector Module"""
 from odoo import models, fields, api, _
 from datetime import datetime
+from .order_reference_cache import get_reference_cache
+from .json_codec import loads
 MAGENTO_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
-import json
 
 class SaleOrderLine(models.Model):
     """
@@ -17,21 +18,38 @@ class SaleOrderLine(models.Model):
         help="Magento Sale Order Line Reference"
     )
 
-    def create_order_line(self, item, instance, log_line, line_id):
-        order_lines = item.get('items')
-        rounding = bool(instance.magento_tax_rounding_method == 'round_per_line')
-        for line in order_lines:
-            if line.get('product_type') in ['configurable', 'bundle']:
-                continue
-            product = line.get('line_product')
-            price = self.__find_order_item_price(item, line, instance)
-            customer_option = self.__get_custom_option(item, line)
-            line_vals = self.with_context(custom_options=customer_option).prepare_order_line_vals(
-                item, line, product, price, instance)
-            order_line = self.create(line_vals)
-            order_line.with_context(round=rounding)._compute_amount()
-            self.__create_line_desc_note(customer_option, item.get('sale_order_id'))
-        return True
+    def prepare_orders_lines_vals(self, orders, instance):
+        """
+        Return the values of the lines of many orders, prepared together: the product lines with
+        the notes of their custom options, followed by the extra lines.
+        :param orders: list of (item, extra_lines), extra_lines being a list of (product, price,
+        values) of the lines added after the products, like the discount and shipping lines
+        :return: list of (values of the lines, indexes of the product lines in them) per order
+        """
+        entries, layouts = [], []
+        for item, extra_lines in orders:
+            notes = []
+            for line in item.get('items'):
+                if line.get('product_type') in ['configurable', 'bundle']:
+                    continue
+                price = self.__find_order_item_price(item, line, instance)
+                entries.append((item, line, line.get('line_product'), price, instance))
+                notes.append(self.__get_custom_option(item, line))
+            entries += [(item, {}, product, price, instance) for product, price, _values in extra_lines]
+            layouts.append((item, notes, extra_lines))
+        lines_vals = iter(self.prepare_order_lines_vals(entries))
+        result = []
+        for item, notes, extra_lines in layouts:
+            vals_list, product_indexes = [], []
+            for note in notes:
+                product_indexes.append(len(vals_list))
+                vals_list.append(next(lines_vals))
+                if note:
+                    vals_list.append(self.__prepare_line_desc_note(note, item.get('sale_order_id')))
+            for _product, _price, values in extra_lines:
+                vals_list.append(dict(next(lines_vals), **values))
+            result.append((vals_list, product_indexes))
+        return result
 
     def __find_order_item_price(self, item, order_line, instance):
         tax_type = item.get('website').tax_calculation_method
@@ -56,7 +74,7 @@ class SaleOrderLine(models.Model):
         ept_option_title = item.get("extension_attributes").get('ept_option_title')
         if ept_option_title:
             for custom_opt_itm in ept_option_title:
-                custom_opt = json.loads(custom_opt_itm)
+                custom_opt = loads(custom_opt_itm)
                 if line_item_id == int(custom_opt.get('order_item_id')):
                     for option_data in custom_opt.get('option_data'):
                         description += option_data.get('label') + " : " + option_data.get('value') + "\n"
@@ -67,13 +85,19 @@ class SaleOrderLine(models.Model):
             if item.get('product_type') == 'bundle' and 'bundle_ept' in list(self.env.context.keys()):
                 continue
             product_sku = item.get('sku')
-            magento_product = self.env['magento.product.product'].search([
-                '|', ('magento_product_id', '=', item.get('product_id')),
-                ('magento_sku', '=', product_sku),
-                ('magento_instance_id', '=', instance.id)
-            ], limit=1)
+            # The products of the queue are resolved before processing it, see prefetch_order_products().
+            cache = get_reference_cache(self.env)
+            magento_product = self.env['magento.order.data.queue.line.ept']._get_cached_magento_product(
+                cache, instance, item)
             if not magento_product:
-                product_obj = self.env['product.product'].search([('default_code', '=', product_sku)])
+                magento_product = self.env['magento.product.product'].search([
+                    '|', ('magento_product_id', '=', item.get('product_id')),
+                    ('magento_sku', '=', product_sku),
+                    ('magento_instance_id', '=', instance.id)
+                ], limit=1)
+            if not magento_product:
+                product_obj = cache.lookup(('odoo_product_sku', product_sku)) or \
+                    self.env['product.product'].search([('default_code', '=', product_sku)])
                 if not product_obj:
                     message = ("An order %s will be skipped as the ordered product %s not exists in Odoo. \nBut "
                                "order will be imported and product will be created automatically if "
@@ -113,20 +137,33 @@ class SaleOrderLine(models.Model):
         return custom_options
 
     def prepare_order_line_vals(self, item, line, product, price, instance):
-        order_qty = float(line.get('qty_ordered', 1.0))
-        sale_order = item.get('sale_order_id')
+        return self.prepare_order_lines_vals([(item, line, product, price, instance)])[0]
+
+    def prepare_order_lines_vals(self, entries):
+        """
+        Return the values of order lines, of one or many orders.
+        :param entries: list of (item, line, product, price, instance)
+        :return: list of values, in the order of the entries
+        """
+        base_vals_list = []
+        for item, line, product, price, _instance in entries:
+            sale_order = item.get('sale_order_id')
+            base_vals_list.append({
+                'order_id': sale_order.id,
+                'product_id': product.id,
+                'company_id': sale_order.company_id.id,
+                'name': item.get('name'),
+                'description': product.name or (sale_order and sale_order.name),
+                'product_uom_id': product.uom_id.id,
+                'order_qty': float(line.get('qty_ordered', 1.0)),
+                'price_unit': price,
+            })
+        lines_vals = self.create_sale_order_lines_ept(base_vals_list)
+        return [self.__update_order_line_vals(line_vals, *entry) for line_vals, entry in zip(lines_vals, entries)]
+
+    @staticmethod
+    def __update_order_line_vals(line_vals, item, line, product, price, instance):
         order_line_ref = line.get('parent_item_id') or line.get('item_id')
-        line_vals = {
-            'order_id': sale_order.id,
-            'product_id': product.id,
-            'company_id': sale_order.company_id.id,
-            'name': item.get('name'),
-            'description': product.name or (sale_order and sale_order.name),
-            'product_uom_id': product.uom_id.id,
-            'order_qty': order_qty,
-            'price_unit': price,
-        }
-        line_vals = self.create_sale_order_line_ept(line_vals)
         line_vals.update({
             'magento_sale_order_line_ref': order_line_ref,
         })
@@ -193,45 +230,87 @@ class SaleOrderLine(models.Model):
             })
         return tax_dict
 
-    def __create_line_desc_note(self, description, sale_order):
-        if description:
-            self.env['sale.order.line'].create({
-                'name': description,
-                'display_type': 'line_note',
-                'product_id': False,
-                'product_uom_id': False,
-                'price_unit': 0,
-                'order_id': sale_order.id,
-            })
+    @staticmethod
+    def __prepare_line_desc_note(description, sale_order):
+        return {
+            'name': description,
+            'display_type': 'line_note',
+            'product_id': False,
+            'product_uom_id': False,
+            'price_unit': 0,
+            'order_id': sale_order.id,
+        }
 
     def create_sale_order_line_ept(self, vals):
         """
         Required data in dictionary :- order_id, name, product_id.
         """
+        return self.create_sale_order_lines_ept([vals])[0]
+
+    def create_sale_order_lines_ept(self, vals_list):
+        """
+        Return the values of order lines with the values set by the onchanges of the product.
+        The onchanges are run on all the new lines together, once per product and unit, and per
+        company, fiscal position, pricelist and customer language of the order. Their values are
+        kept in the reference cache for the queue run. The description is set on each line
+        afterwards, the name of a product line is computed from its product as before.
+        Required data in each dictionary :- order_id, name, product_id.
+        """
         sale_order_line = self.env['sale.order.line']
-        order_line = {
-            'order_id': vals.get('order_id', False),
-            'product_id': vals.get('product_id', False),
-            'company_id': vals.get('company_id', False),
-            'name': vals.get('description', ''),
-            'product_uom_id': vals.get('product_uom_id')
-        }
+        cache = get_reference_cache(self.env)
+        keys, templates, missing = [], {}, {}
+        for vals in vals_list:
+            order = self.env['sale.order'].browse(vals.get('order_id', False))
+            key = ('order_line_onchange', order.company_id.id, order.fiscal_position_id.id, order.pricelist_id.id,
+                   order.partner_id.lang, vals.get('product_id', False), vals.get('product_uom_id'))
+            keys.append(key)
+            if key not in templates and key not in missing:
+                template = cache.lookup(key)
+                if template:
+                    templates[key] = template
+                else:
+                    missing[key] = vals
+        if missing:
+            new_order_lines = sale_order_line.browse()
+            for vals in missing.values():
+                new_order_lines |= sale_order_line.new({
+                    'order_id': vals.get('order_id', False),
+                    'product_id': vals.get('product_id', False),
+                    'company_id': vals.get('company_id', False),
+                    'name': vals.get('description', ''),
+                    'product_uom_id': vals.get('product_uom_id')
+                })
+            new_order_lines._compute_name()
+            new_order_lines._compute_tax_ids()
+            for new_order_line in new_order_lines:
+                new_order_line._onchange_product_id()
+            new_order_lines._compute_customer_lead()
+            for key, new_order_line in zip(missing, new_order_lines):
+                templates[key] = cache.set(key, self.__get_onchange_template(new_order_line))
 
-        new_order_line = sale_order_line.new(order_line)
-        # new_order_line.product_id_change()
-        new_order_line._compute_name()
-        new_order_line._compute_tax_ids()
-        new_order_line._onchange_product_id()
-
-        # new_order_line._onchange_product_id_set_customer_lead()
-        new_order_line._compute_customer_lead()
-        order_line = sale_order_line._convert_to_write({name: new_order_line[name] for name in new_order_line._cache})
-
-        order_line.update({
-            'order_id': vals.get('order_id', False),
-            'product_uom_qty': vals.get('order_qty', 0.0),
-            'price_unit': vals.get('price_unit', 0.0),
-            'discount': vals.get('discount', 0.0),
-            'state': 'draft',
-        })
-        return order_line
\ No newline at end of file
+        lines_vals = []
+        for vals, key in zip(vals_list, keys):
+            order_line = dict(templates[key])
+            order_line.update({
+                'order_id': vals.get('order_id', False),
+                'product_uom_qty': vals.get('order_qty', 0.0),
+                'price_unit': vals.get('price_unit', 0.0),
+                'discount': vals.get('discount', 0.0),
+                'state': 'draft',
+            })
+            if not vals.get('product_id') or not order_line.get('name'):
+                order_line['name'] = vals.get('description', '')
+            lines_vals.append(order_line)
+        return lines_vals
+
+    def __get_onchange_template(self, new_order_line):
+        """
+        Return the values of the new line shared by the lines of the same product. The order and
+        the fields related to it are left out, they are set from the order of each line.
+        """
+        order_line = self._convert_to_write({name: new_order_line[name] for name in new_order_line._cache})
+        for name in list(order_line):
+            related = self._fields[name].related
+            if name == 'order_id' or (related and related.split('.')[0] == 'order_id'):
+                order_line.pop(name)
+        return order_line
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from . import test_queue_line_claim
+from . import test_order_queue_lines
+from . import test_import_cursor
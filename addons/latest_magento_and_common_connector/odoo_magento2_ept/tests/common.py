@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Describes the records shared by the tests of the queues.
+"""
+from odoo.tests.common import TransactionCase
+
+
+class MagentoQueueCase(TransactionCase):
+    """
+    Creates an instance without calling Magento. The queue methods commit after each page or
+    claim, the commits are skipped in the tests.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.instance = cls.env['magento.instance'].create({
+            'name': 'Test Magento',
+            'magento_version': '2.3',
+            'magento_url': 'https://magento.example.com',
+            'warehouse_ids': [(6, 0, cls.env.ref('stock.warehouse0').ids)],
+        })
+        cls.order_queue = cls.env['magento.order.data.queue.ept']
+        cls.order_line = cls.env['magento.order.data.queue.line.ept']
+
+    def setUp(self):
+        super().setUp()
+        self.patch(type(self.env.cr), 'commit', lambda cr: None)
+        self.patch(type(self.env['magento.instance']), 'show_popup_notification', lambda instance, message: True)
+
+    @staticmethod
+    def make_order(number, **values):
+        return dict({'increment_id': '%09d' % number, 'entity_id': number, 'items': [],
+                     'updated_at': '2026-01-01 10:00:00'}, **values)
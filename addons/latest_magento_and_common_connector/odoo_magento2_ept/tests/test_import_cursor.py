@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from datetime import datetime
+from unittest.mock import patch
+from odoo.tests import tagged
+from .common import MagentoQueueCase
+
+FETCH_CURSOR_PAGES = 'odoo.addons.odoo_magento2_ept.models.order_queue.fetch_cursor_pages'
+
+
+@tagged('post_install', '-at_install')
+class TestImportCursor(MagentoQueueCase):
+
+    def setUp(self):
+        super().setUp()
+        self.watermark = self.env['magento.sync.watermark'].get_watermark(self.instance, 'shipped_order')
+        self.from_date = datetime(2026, 1, 1, 10, 0, 0)
+        self.to_date = datetime(2026, 1, 2, 10, 0, 0)
+
+    def import_orders(self, pages, fail_after=None, **kwargs):
+        """
+        Run a cursor import on the pages of orders, raising after fail_after pages.
+        :return: Cursor the import started from
+        """
+        started_from = []
+
+        def fetch_cursor_pages(instance, get_path, cursor=0, **_kwargs):
+            started_from.append(cursor)
+            for index, orders in enumerate(page for page in pages if page[-1]['entity_id'] > cursor):
+                if index == fail_after:
+                    raise ConnectionError("Magento stopped answering")
+                yield orders[-1]['entity_id'], {'items': orders}
+
+        kwargs = dict({'instance': self.instance, 'status': 'complete', 'from_date': self.from_date,
+                       'to_date': self.to_date, 'page_size': 2, 'watermark': self.watermark}, **kwargs)
+        with patch(FETCH_CURSOR_PAGES, fetch_cursor_pages):
+            try:
+                self.order_queue._create_order_queues_by_cursor(self.instance, kwargs, [])
+            except ConnectionError:
+                pass
+        return started_from[0]
+
+    def get_imported(self):
+        return self.order_line.search([('instance_id', '=', self.instance.id)]).mapped('magento_id')
+
+    def test_window_and_cursor(self):
+        self.watermark.save_cursor('complete', 120, self.from_date, self.to_date)
+        self.assertEqual(self.watermark.get_cursor('complete', self.from_date, self.to_date), 120)
+        self.assertEqual(self.watermark.get_cursor('pending', self.from_date, self.to_date), 0)
+        self.assertEqual(self.watermark.get_cursor('complete', self.from_date, datetime(2026, 1, 3)), 0)
+        self.assertEqual(self.watermark.get_import_window('', datetime(2026, 1, 3)), (self.from_date, self.to_date))
+        self.watermark.save_cursor('complete', 0, self.from_date, self.to_date)
+        self.assertFalse(self.watermark.resume_state)
+        self.assertEqual(self.watermark.get_import_window('', self.to_date), ('', self.to_date))
+
+    def test_resume_interrupted_import(self):
+        pages = [[self.make_order(1), self.make_order(2)], [self.make_order(3), self.make_order(4)],
+                 [self.make_order(5)]]
+        self.assertEqual(self.import_orders(pages, fail_after=1), 0)
+        self.assertEqual(self.watermark.get_cursor('complete', self.from_date, self.to_date), 2)
+        # The next scheduled run is given the window of the interrupted one.
+        from_date, to_date = self.watermark.get_import_window(self.from_date, datetime(2026, 1, 5))
+        self.assertEqual(self.import_orders(pages, from_date=from_date, to_date=to_date), 2)
+        self.assertEqual(sorted(self.get_imported()), ['%09d' % number for number in range(1, 6)])
+        self.assertFalse(self.watermark.resume_state)
+
+    def test_cursor_per_stream(self):
+        pages = [[self.make_order(1), self.make_order(2)], [self.make_order(3)]]
+        self.import_orders(pages, fail_after=1)
+        unshipped = self.env['magento.sync.watermark'].get_watermark(self.instance, 'unshipped_order')
+        # Another stream starts from the first order and leaves the cursor of the interrupted one.
+        self.assertEqual(self.import_orders(pages, status=['pending'], watermark=unshipped), 0)
+        self.assertEqual(self.watermark.get_cursor('complete', self.from_date, self.to_date), 2)
+        # A manual import on another window doesn't resume either.
+        self.assertEqual(self.import_orders(pages, watermark=False, to_date=datetime(2026, 1, 3)), 0)
+        self.assertEqual(self.watermark.get_cursor('complete', self.from_date, self.to_date), 2)
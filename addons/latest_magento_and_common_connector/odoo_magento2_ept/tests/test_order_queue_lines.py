@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo.tests import tagged
+from .common import MagentoQueueCase
+
+
+@tagged('post_install', '-at_install')
+class TestOrderQueueLines(MagentoQueueCase):
+
+    def get_lines(self):
+        return self.order_line.search([('instance_id', '=', self.instance.id)], order='id')
+
+    def test_duplicate_orders_of_a_page(self):
+        orders = [self.make_order(1, status='pending'), self.make_order(2), self.make_order(1, status='processing')]
+        queue_ids = self.order_line.create_order_queue_lines(self.instance, orders, 10)
+        lines = self.get_lines()
+        self.assertEqual(lines.mapped('magento_id'), ['000000001', '000000002'])
+        self.assertEqual(len(queue_ids), 1)
+        self.assertEqual(lines[0].get_payload().get('status'), 'processing')
+
+    def test_draft_line_updated(self):
+        self.order_line.create_order_queue_lines(self.instance, [self.make_order(1, status='pending')], 10)
+        line = self.get_lines()
+        queue_ids = self.order_line.create_order_queue_lines(self.instance, [self.make_order(1, status='complete')],
+                                                             10)
+        self.assertEqual(self.get_lines(), line)
+        self.assertEqual(queue_ids, line.queue_id.ids)
+        self.assertEqual(line.get_payload().get('status'), 'complete')
+
+    def test_processed_line_not_updated(self):
+        self.order_line.create_order_queue_lines(self.instance, [self.make_order(1, status='pending')], 10)
+        line = self.get_lines()
+        line.write({'state': 'done'})
+        self.order_line.create_order_queue_lines(self.instance, [self.make_order(1, status='complete')], 10)
+        lines = self.get_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines.mapped('state'), ['done', 'draft'])
+        self.assertEqual(lines[1].get_payload().get('status'), 'complete')
+
+    def test_queue_size(self):
+        self.order_line.create_order_queue_lines(self.instance, [self.make_order(1)], 2)
+        queue_ids = self.order_line.create_order_queue_lines(
+            self.instance, [self.make_order(n) for n in range(2, 6)], 2)
+        queues = self.order_queue.browse(queue_ids)
+        self.assertEqual(len(queues), 3)
+        self.assertEqual([len(queue.line_ids) for queue in queues.sorted('id')], [2, 2, 1])
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo.tests import tagged
+from odoo.tools import SQL
+from .common import MagentoQueueCase
+
+
+@tagged('post_install', '-at_install')
+class TestQueueLineClaim(MagentoQueueCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order_line.create_order_queue_lines(self.instance, [self.make_order(n) for n in range(1, 4)], 10)
+        self.lines = self.order_line.search([('instance_id', '=', self.instance.id)], order='id')
+        self.set_worker('worker-a')
+
+    def set_worker(self, worker):
+        self.patch(type(self.order_line), '_get_claim_worker', lambda model: worker)
+
+    def expire_claims(self):
+        self.env.cr.execute(SQL("UPDATE %s SET claim_expires_at = (now() at time zone 'UTC') - interval '1 hour' "
+                                "WHERE id = ANY(%s)", SQL.identifier(self.order_line._table), self.lines.ids))
+        self.lines.invalidate_recordset(['claim_expires_at'])
+
+    def test_claim_lines(self):
+        claimed = self.lines.claim_lines(60)
+        self.assertEqual(claimed, self.lines)
+        self.assertEqual(set(claimed.mapped('claimed_by')), {'worker-a'})
+        self.assertTrue(all(claimed.mapped('claim_expires_at')))
+
+    def test_claim_skips_finished_lines(self):
+        # Another worker set the line done since this worker read it.
+        self.env.cr.execute(SQL("UPDATE %s SET state = 'done' WHERE id = %s",
+                                SQL.identifier(self.order_line._table), self.lines[0].id))
+        claimed = self.lines.claim_lines(60, ['draft', 'failed'])
+        self.assertEqual(claimed, self.lines[1:])
+        self.assertEqual(self.lines[0].state, 'done')
+        self.assertFalse(self.lines[0].claimed_by)
+
+    def test_claim_skips_queue_leased_by_other_worker(self):
+        self.lines[:1].claim_lines(60)
+        self.set_worker('worker-b')
+        self.assertFalse(self.lines.claim_lines(60))
+        self.set_worker('worker-a')
+        self.assertEqual(self.lines.claim_lines(60), self.lines)
+
+    def test_claim_after_lease_expired(self):
+        self.lines.claim_lines(60)
+        self.expire_claims()
+        self.set_worker('worker-b')
+        self.assertEqual(self.lines.claim_lines(60), self.lines)
+        self.assertEqual(set(self.lines.mapped('claimed_by')), {'worker-b'})
+
+    def test_release_lines(self):
+        self.lines.claim_lines(60)
+        self.set_worker('worker-b')
+        self.lines.release_lines()
+        self.assertEqual(set(self.lines.mapped('claimed_by')), {'worker-a'})
+        self.set_worker('worker-a')
+        self.lines.release_lines()
+        self.assertFalse(any(self.lines.mapped('claimed_by')))
+        self.set_worker('worker-b')
+        self.assertEqual(self.lines.claim_lines(60), self.lines)
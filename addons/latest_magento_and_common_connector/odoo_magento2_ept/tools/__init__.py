@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Support tools to run the connector against a local stand-in of Magento. They only use the
+Python standard library and are not loaded by the Odoo module.
+"""
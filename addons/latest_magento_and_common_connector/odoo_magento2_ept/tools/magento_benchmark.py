@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+End-to-end benchmark of the import and export pipelines against the local Magento stand-in.
+
+It needs a throwaway database with the module installed and one configured Magento instance,
+its Magento URL and access token are pointed to the stand-in during the run and restored after:
+
+    python3 magento_benchmark.py -c /etc/odoo/odoo.conf -d magento_bench --instance-id 1
+
+Each stage reports the records processed per second, the SQL queries and API calls per
+record and the peak RSS of the process. The measures are compared to benchmark_budgets.json,
+the exit code is 1 when a budget is exceeded. The budgets are measured on the reference machine
+with --write-budgets, and again after a deliberate change of the pipelines. Until then there is
+no budget file and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from magento_standin import MagentoDataset, MagentoStandinServer  # noqa: E402
+
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_budgets.json')
+FROM_DATE = datetime(2025, 1, 1)
+TO_DATE = datetime(2026, 1, 2)
+# Stand-in dataset used until the budget file gives its own.
+DATASET = {'orders': 2000, 'products': 1000, 'customers': 500, 'configurables': 50, 'children': 20, 'seed': 1}
+# Rounds of queue processing before giving up, the processors stop at the cron time limit.
+MAX_PROCESS_ROUNDS = 50
+# Headroom of the budgets written by --write-budgets. One more query per record is always caught.
+QUERY_HEADROOM = 0.5
+THROUGHPUT_HEADROOM = 0.7
+RSS_HEADROOM = 1.3
+
+QUEUE_PROCESSORS = {
+    'magento.order.data.queue.ept': 'process_order_queues',
+    'sync.import.magento.product.queue': 'process_product_queues',
+    'magento.customer.data.queue.ept': 'process_customer_queues',
+    'magento.export.stock.queue.ept': 'process_export_stock_queues',
+}
+
+
+def _process_queues(queues, states=('draft',)):
+    """
+    Process the queues until no line is left in the given states.
+    :return: Lines of the queues
+    """
+    for _round in range(MAX_PROCESS_ROUNDS):
+        pending = queues.filtered(lambda queue: queue.line_ids.filtered(lambda line: line.state in states))
+        if not pending:
+            break
+        getattr(pending, QUEUE_PROCESSORS[queues._name])(is_manual=True)
+        queues.invalidate_recordset()
+    return queues.line_ids
+
+
+def stage_order_import(env, instance):
+    queue_obj = env['magento.order.data.queue.ept']
+    queue_ids = queue_obj.create_order_queues(instance=instance, from_date=FROM_DATE, to_date=TO_DATE,
+                                              status=['complete', 'processing', 'pending'],
+                                              import_order_on='updated_at', is_manual=True)
+    lines = _process_queues(queue_obj.browse(queue_ids))
+    return lines, len(lines)
+
+
+def stage_product_import(env, instance):
+    queue_obj = env['sync.import.magento.product.queue']
+    queue_ids = []
+    for p_type in ('configurable', 'simple'):
+        queue_ids += queue_obj.create_product_queues(instance, FROM_DATE, TO_DATE, p_type, is_update=True) or []
+    lines = _process_queues(queue_obj.browse(queue_ids))
+    return lines, len(lines)
+
+
+def stage_customer_import(env, instance):
+    queue_obj = env['magento.customer.data.queue.ept']
+    queue_ids = queue_obj.create_customer_queues(instance=instance, from_date=FROM_DATE, to_date=TO_DATE)
+    lines = _process_queues(queue_obj.browse(queue_ids), states=('draft', 'cancel'))
+    return lines, len(lines)
+
+
+def stage_stock_export(env, instance):
+    """
+    The records of the stock export are the stock rows, counted before the lines are sent.
+    """
+    queue_obj = env['magento.export.stock.queue.ept']
+    existing = queue_obj.search([('instance_id', '=', instance.id)])
+    env['magento.export.product.ept'].export_product_stock_operation(instance)
+    queues = queue_obj.search([('instance_id', '=', instance.id)]) - existing
+    records = sum(len(rows) for line in queues.line_ids for rows in line.get_payload().values())
+    return _process_queues(queues), records
+
+
+STAGES = [
+    ('product_import', stage_product_import),
+    ('customer_import', stage_customer_import),
+    ('order_import', stage_order_import),
+    ('stock_export', stage_stock_export),
+]
+
+
+def run_stage(env, instance, server, name, stage):
+    cr = env.cr
+    server.control('POST', '/standin/reset')
+    queries = cr.sql_log_count
+    started_at = time.monotonic()
+    lines, records = stage(env, instance)
+    duration = time.monotonic() - started_at
+    queries = cr.sql_log_count - queries
+    api_calls = sum(server.control('GET', '/standin/stats').values())
+    return {
+        'stage': name,
+        'records': records,
+        'failed': len(lines.filtered(lambda line: line.state == 'failed')),
+        'seconds': round(duration, 3),
+        'records_per_sec': round(records / duration, 2) if duration else 0.0,
+        'queries_per_record': round(queries / records, 2) if records else 0.0,
+        'api_calls_per_record': round(api_calls / records, 3) if records else 0.0,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def check_budgets(results, budgets):
+    """
+    Return the messages of the exceeded budgets.
+    """
+    errors = []
+    for result in results:
+        budget = budgets.get(result['stage'], {})
+        if result['records'] < budget.get('min_records', 0):
+            errors.append('{stage}: {records} records processed, expected at least {min}'.format(
+                min=budget.get('min_records'), **result))
+        if 'min_records_per_sec' in budget and result['records_per_sec'] < budget['min_records_per_sec']:
+            errors.append('{stage}: {records_per_sec} records/s is below {min}'.format(
+                min=budget['min_records_per_sec'], **result))
+        if 'max_queries_per_record' in budget and result['queries_per_record'] > budget['max_queries_per_record']:
+            errors.append('{stage}: {queries_per_record} SQL queries/record is above {max}'.format(
+                max=budget['max_queries_per_record'], **result))
+        if 'max_api_calls_per_record' in budget and \
+                result['api_calls_per_record'] > budget['max_api_calls_per_record']:
+            errors.append('{stage}: {api_calls_per_record} API calls/record is above {max}'.format(
+                max=budget['max_api_calls_per_record'], **result))
+    peak_rss = max([result['peak_rss_mb'] for result in results] or [0])
+    if 'max_peak_rss_mb' in budgets and peak_rss > budgets['max_peak_rss_mb']:
+        errors.append('peak RSS {} MB is above {} MB'.format(peak_rss, budgets['max_peak_rss_mb']))
+    return errors
+
+
+def make_budgets(results, budgets):
+    """
+    Return the budgets measured from the results, keeping the dataset of the current budgets.
+    """
+    new_budgets = {'dataset': budgets.get('dataset', DATASET)}
+    for result in results:
+        new_budgets[result['stage']] = {
+            'min_records': result['records'],
+            'min_records_per_sec': round(result['records_per_sec'] * THROUGHPUT_HEADROOM, 2),
+            'max_queries_per_record': round(result['queries_per_record'] + QUERY_HEADROOM, 2),
+            'max_api_calls_per_record': round(result['api_calls_per_record'] * 1.1 + 0.01, 3),
+        }
+    new_budgets['max_peak_rss_mb'] = round(max(result['peak_rss_mb'] for result in results) * RSS_HEADROOM)
+    return new_budgets
+
+
+def print_results(results):
+    columns = ['stage', 'records', 'failed', 'seconds', 'records_per_sec', 'queries_per_record',
+               'api_calls_per_record', 'peak_rss_mb']
+    print(' | '.join(column.ljust(20 if column == 'stage' else 10) for column in columns))
+    for result in results:
+        print(' | '.join(str(result[column]).ljust(20 if column == 'stage' else 10) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', help="Odoo server configuration file.")
+    parser.add_argument('-d', '--database', required=True, help="Throwaway database of the benchmark.")
+    parser.add_argument('--instance-id', type=int, required=True, help="Configured Magento instance to use.")
+    parser.add_argument('--stages', default=','.join(name for name, _stage in STAGES),
+                        help="Comma separated stages to run.")
+    parser.add_argument('--budgets', default=BUDGET_FILE, help="Budget file to check the results against.")
+    parser.add_argument('--write-budgets', action='store_true', help="Store the measured budgets instead.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to the stand-in answers.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    budgets = {}
+    if os.path.exists(args.budgets):
+        with open(args.budgets, encoding='utf-8') as budget_file:
+            budgets = json.load(budget_file)
+
+    import odoo
+    from odoo.modules.registry import Registry
+    odoo.tools.config.parse_config((['-c', args.config] if args.config else []) + ['-d', args.database])
+    server = MagentoStandinServer(dataset=MagentoDataset(**budgets.get('dataset', DATASET)),
+                                  latency=args.latency).start()
+    results = []
+    with Registry(args.database).cursor() as cr:
+        env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        instance = env['magento.instance'].browse(args.instance_id)
+        origin = {'magento_url': instance.magento_url, 'access_token': instance.access_token}
+        instance.write({'magento_url': server.url, 'access_token': 'benchmark-{}'.format(os.getpid())})
+        cr.commit()
+        try:
+            for name, stage in STAGES:
+                if name in args.stages.split(','):
+                    results.append(run_stage(env, instance, server, name, stage))
+        finally:
+            cr.rollback()
+            instance.write(origin)
+            cr.commit()
+            server.stop()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.write_budgets:
+        with open(args.budgets, 'w', encoding='utf-8') as budget_file:
+            json.dump(make_budgets(results, budgets), budget_file, indent=2)
+            budget_file.write('\n')
+        return 0
+    if not budgets:
+        print('NO BUDGETS: measure them in {} with --write-budgets on the reference machine'.format(args.budgets))
+        return 1
+    errors = check_budgets(results, budgets)
+    for error in errors:
+        print('BUDGET EXCEEDED: {}'.format(error))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Benchmark of the storages of the queue line payloads and of the JSON codecs on the records of
+the Magento stand-in.
+
+For each kind of record and each storage, it reports the stored bytes per record and the
+CPU time of encoding and decoding a payload, as done by the queue lines. For each installed
+JSON codec, it reports the CPU seconds spent on 10,000 orders, to decode their API pages,
+write their queue lines and read them back, and the seconds saved compared to json:
+
+    python3 magento_payload_benchmark.py --orders 2000 --products 1000 --customers 500
+
+The JSONB payloads are encoded and decoded as JSON text by the database driver, their size
+is only known from PostgreSQL. With --dsn the payloads are inserted in a temporary table and
+the size of the stored columns, TOAST compression included, is reported as well:
+
+    python3 magento_payload_benchmark.py --dsn "dbname=magento_bench"
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+TOOLS_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_PATH)
+from magento_standin import MagentoDataset  # noqa: E402
+
+# The codec of the module only uses the standard library, it is loaded without Odoo.
+_spec = importlib.util.spec_from_file_location(
+    'json_codec', os.path.join(os.path.dirname(TOOLS_PATH), 'models', 'json_codec.py'))
+json_codec = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(json_codec)
+PAGE_SIZE = 200
+CODEC_ORDERS = 10000
+
+
+def _text_codec():
+    return json_codec.dumps, json_codec.loads
+
+
+def _compressed_codec(compression):
+    def encode(payload):
+        # The compressed payloads are stored as raw bytes in the bytea column.
+        return json_codec.compress_payload(payload, compression)
+
+    def decode(value):
+        return json_codec.decompress_payload(value)
+    return encode, decode
+
+
+def get_storages():
+    storages = [('text', _text_codec()), ('jsonb', _text_codec()), ('zlib', _compressed_codec('zlib'))]
+    if json_codec.zstandard:
+        storages.append(('zstd', _compressed_codec('zstd')))
+    return storages
+
+
+def measure(kind, payloads, storage, codec):
+    encode, decode = codec
+    started_at = time.process_time()
+    values = [encode(payload) for payload in payloads]
+    encode_seconds = time.process_time() - started_at
+    started_at = time.process_time()
+    for value in values:
+        decode(value)
+    decode_seconds = time.process_time() - started_at
+    count = len(payloads) or 1
+    return {
+        'kind': kind,
+        'storage': storage,
+        'records': len(payloads),
+        'bytes_per_record': round(sum(len(value) for value in values) / count) if storage != 'jsonb' else None,
+        'encode_us': round(encode_seconds / count * 1e6, 1),
+        'decode_us': round(decode_seconds / count * 1e6, 1),
+        'values': values,
+    }
+
+
+def measure_codecs(orders):
+    """
+    Return the CPU seconds spent by each installed codec on 10,000 orders, as the connector
+    decodes the API pages, encodes the queue line payloads and decodes them again.
+    """
+    pages = [json.dumps({'items': orders[index:index + PAGE_SIZE], 'total_count': len(orders)}).encode('utf-8')
+             for index in range(0, len(orders), PAGE_SIZE)]
+    codecs = [name for name in json_codec.CODECS if name == 'json' or getattr(json_codec, name)]
+    results = []
+    for name in codecs:
+        json_codec.set_codec(name)
+        started_at = time.process_time()
+        for page in pages:
+            for order in json_codec.loads(page)['items']:
+                json_codec.loads(json_codec.dumps(order))
+        seconds = (time.process_time() - started_at) * CODEC_ORDERS / (len(orders) or 1)
+        results.append({'codec': name, 'seconds_per_10k_orders': round(seconds, 3)})
+    json_codec.set_codec(codecs[0])
+    baseline = [result['seconds_per_10k_orders'] for result in results if result['codec'] == 'json'][0]
+    for result in results:
+        result['seconds_saved'] = round(baseline - result['seconds_per_10k_orders'], 3)
+    return results
+
+
+def measure_database(dsn, results):
+    """
+    Set the stored bytes per record measured in PostgreSQL, TOAST compression included.
+    """
+    import psycopg2
+    columns = {'text': 'text', 'jsonb': 'jsonb', 'zlib': 'bytea', 'zstd': 'bytea'}
+    with psycopg2.connect(dsn) as connection, connection.cursor() as cr:
+        for result in results:
+            column = columns[result['storage']]
+            cr.execute("CREATE TEMP TABLE payload_benchmark (value {}) ON COMMIT DROP".format(column))
+            cr.executemany("INSERT INTO payload_benchmark (value) VALUES (%s::{})".format(column),
+                           [(psycopg2.Binary(value) if column == 'bytea' else value,) for value in result['values']])
+            cr.execute("SELECT avg(pg_column_size(value)) FROM payload_benchmark")
+            result['db_bytes_per_record'] = round(cr.fetchone()[0] or 0)
+            cr.execute("DROP TABLE payload_benchmark")
+        connection.rollback()
+    return results
+
+
+def print_results(results, columns):
+    print(' | '.join(column.ljust(19) for column in columns))
+    for result in results:
+        print(' | '.join(str(result.get(column, '')).ljust(19) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1000, help="Number of orders of the dataset.")
+    parser.add_argument('--products', type=int, default=500, help="Number of products of the dataset.")
+    parser.add_argument('--customers', type=int, default=300, help="Number of customers of the dataset.")
+    parser.add_argument('--seed', type=int, default=1, help="Seed of the generated dataset.")
+    parser.add_argument('--dsn', help="PostgreSQL connection measuring the stored sizes.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    dataset = MagentoDataset(orders=args.orders, products=args.products, customers=args.customers, seed=args.seed)
+    results = []
+    for kind, payloads in (('order', dataset.orders), ('product', dataset.products),
+                           ('customer', dataset.customers)):
+        for storage, codec in get_storages():
+            results.append(measure(kind, payloads, storage, codec))
+    if args.dsn:
+        measure_database(args.dsn, results)
+    for result in results:
+        del result['values']
+    codec_results = measure_codecs(dataset.orders)
+    print_results(results, ['kind', 'storage', 'records', 'bytes_per_record', 'db_bytes_per_record',
+                            'encode_us', 'decode_us'])
+    print()
+    print_results(codec_results, ['codec', 'seconds_per_10k_orders', 'seconds_saved'])
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'storages': results, 'codecs': codec_results}, output_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
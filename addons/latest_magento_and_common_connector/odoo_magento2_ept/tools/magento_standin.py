@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""
+Local stand-in of the Magento 2 REST API, answering the endpoints called by the connector from a
+generated dataset. It is used to measure the import and export pipelines without a live store.
+
+    python3 magento_standin.py --port 8095 --orders 5000 --products 2000 --latency 0.05 --error-rate 0.01
+
+Then set http://localhost:8095 as Magento URL of an instance, any access token is accepted.
+GET /standin/stats returns the number of requests served per endpoint, POST /standin/reset
+clears it.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+ORDER_STATUSES = ('complete', 'processing', 'pending', 'canceled')
+# Fields of the filters which are stored under another key in the dataset.
+FIELD_ALIASES = {'products': {'entity_id': 'id'}, 'customers': {'entity_id': 'id'}}
+ROUTE_PATTERN = re.compile(r'^(?:/rest)?(?:/(?!async/)(?P<store>[a-z0-9_]+))?'
+                           r'(?P<mode>/async/bulk|/async)?/V1/(?P<route>.*)$')
+
+
+class MagentoDataset:
+    """
+    Orders, products, customers and catalog data generated from a seed, so two runs with the
+    same options answer the same records.
+    """
+
+    def __init__(self, orders=1000, products=500, customers=300, configurables=0, children=0, seed=1):
+        self.random = random.Random(seed)
+        self.now = datetime(2026, 1, 1)
+        self.products = [self._make_product(index) for index in range(1, products + 1)]
+        for index in range(configurables):
+            self.products += self._make_configurable(len(self.products) + 1, children)
+        self.simple_products = [product for product in self.products if product['type_id'] == 'simple']
+        self.customers = [self._make_customer(index) for index in range(1, customers + 1)]
+        self.orders = [self._make_order(index) for index in range(1, orders + 1)]
+        self.products_by_sku = {product['sku']: product for product in self.products}
+        self.orders_by_id = {order['entity_id']: order for order in self.orders}
+        self.bulks = {}
+        self.next_document_id = 1
+        self.lock = threading.Lock()
+
+    def _make_date(self, days=90):
+        return (self.now - timedelta(seconds=self.random.randint(0, days * 86400))).strftime(DATETIME_FORMAT)
+
+    def _make_product(self, index):
+        created_at = self._make_date()
+        return {
+            'id': index,
+            'sku': 'SKU-{:06d}'.format(index),
+            'name': 'Product {}'.format(index),
+            'attribute_set_id': 4,
+            'price': round(self.random.uniform(5, 500), 2),
+            'status': 1,
+            'visibility': 4,
+            'type_id': 'simple',
+            'created_at': created_at,
+            'updated_at': max(created_at, self._make_date(30)),
+            'weight': round(self.random.uniform(0.1, 10), 2),
+            'extension_attributes': {
+                'website_ids': [1],
+                'category_links': [{'position': 0, 'category_id': str(3 + index % 5)}],
+                'stock_item': {'item_id': index, 'product_id': index, 'stock_id': 1,
+                               'qty': self.random.randint(0, 200), 'is_in_stock': True},
+            },
+            'custom_attributes': [
+                {'attribute_code': 'description', 'value': '<p>Description of product {}</p>'.format(index)},
+                {'attribute_code': 'tax_class_id', 'value': '2'},
+                {'attribute_code': 'category_ids', 'value': [str(3 + index % 5)]},
+            ],
+            'media_gallery_entries': [],
+        }
+
+    def _make_configurable(self, index, children):
+        """
+        Return a configurable product followed by its children, one per color.
+        """
+        parent = self._make_product(index)
+        parent.update({'sku': 'CONF-{:06d}'.format(index), 'name': 'Configurable {}'.format(index),
+                       'type_id': 'configurable', 'price': 0})
+        products = [parent]
+        for position in range(1, children + 1):
+            child = self._make_product(index + position)
+            child.update({'sku': 'CONF-{:06d}-{}'.format(index, position), 'visibility': 1,
+                          'name': 'Configurable {} - Color {}'.format(index, position)})
+            child['extension_attributes']['simple_parent_id'] = index
+            child['custom_attributes'].append({'attribute_code': 'color', 'value': str(1000 + position)})
+            products.append(child)
+        parent['extension_attributes'].update({
+            'configurable_product_links': [child['id'] for child in products[1:]],
+            'configurable_product_options': [{
+                'id': index, 'attribute_id': '93', 'label': 'Color', 'position': 0, 'product_id': index,
+                'values': [{'value_index': 1000 + position} for position in range(1, children + 1)],
+            }],
+        })
+        return products
+
+    def _make_address(self, index, customer_id=None):
+        return {
+            'id': index, 'customer_id': customer_id, 'firstname': 'First{}'.format(index),
+            'lastname': 'Last{}'.format(index), 'street': ['{} Main Street'.format(index)],
+            'city': 'Springfield', 'postcode': '{:05d}'.format(10000 + index % 89999), 'country_id': 'US',
+            'region': {'region_code': 'IL', 'region': 'Illinois', 'region_id': 23}, 'region_id': 23,
+            'region_code': 'IL', 'telephone': '555{:07d}'.format(index),
+            'email': 'customer{}@example.com'.format(index),
+            'default_billing': True, 'default_shipping': True,
+        }
+
+    def _make_customer(self, index):
+        created_at = self._make_date()
+        return {
+            'id': index, 'email': 'customer{}@example.com'.format(index), 'firstname': 'First{}'.format(index),
+            'lastname': 'Last{}'.format(index), 'website_id': 1, 'store_id': 1, 'group_id': 1, 'taxvat': '',
+            'created_at': created_at, 'updated_at': max(created_at, self._make_date(30)),
+            'addresses': [self._make_address(index, index)],
+        }
+
+    def _make_order(self, index):
+        created_at = self._make_date()
+        customer = self.random.choice(self.customers) if self.customers and self.random.random() < 0.7 else None
+        address = self._make_address(customer['id'] if customer else 100000 + index,
+                                     customer['id'] if customer else None)
+        items = []
+        simples = self.simple_products
+        for position, product in enumerate(self.random.sample(simples, min(len(simples), self.random.randint(1, 3)))):
+            qty = self.random.randint(1, 4)
+            items.append({
+                'item_id': index * 10 + position, 'parent_item_id': None, 'product_id': product['id'],
+                'product_type': 'simple', 'sku': product['sku'], 'name': product['name'], 'qty_ordered': qty,
+                'price': product['price'], 'base_price': product['price'], 'price_incl_tax': product['price'],
+                'base_price_incl_tax': product['price'], 'original_price': product['price'],
+                'base_original_price': product['price'], 'tax_percent': 0, 'row_total': product['price'] * qty,
+            })
+        subtotal = round(sum(item['row_total'] for item in items), 2)
+        return {
+            'entity_id': index, 'increment_id': '{:09d}'.format(index), 'created_at': created_at,
+            'updated_at': max(created_at, self._make_date(30)), 'status': ORDER_STATUSES[index % len(ORDER_STATUSES)],
+            'state': ORDER_STATUSES[index % len(ORDER_STATUSES)], 'store_id': 1,
+            'customer_id': customer['id'] if customer else None, 'customer_is_guest': 0 if customer else 1,
+            'customer_firstname': address['firstname'], 'customer_lastname': address['lastname'],
+            'customer_email': address['email'], 'base_currency_code': 'USD', 'order_currency_code': 'USD',
+            'shipping_amount': 5.0, 'base_shipping_amount': 5.0, 'shipping_incl_tax': 5.0,
+            'base_shipping_incl_tax': 5.0, 'discount_amount': 0.0, 'base_discount_amount': 0.0,
+            'subtotal': subtotal, 'grand_total': subtotal + 5.0,
+            'billing_address': dict(address, address_type='billing'),
+            'payment': {'method': 'checkmo'}, 'items': items,
+            'extension_attributes': {
+                'shipping_assignments': [{
+                    'shipping': {'address': dict(address, address_type='shipping'), 'method': 'flatrate_flatrate',
+                                 'total': {'shipping_amount': 5.0, 'base_shipping_amount': 5.0}},
+                    'items': items,
+                }],
+                'is_invoice': False, 'is_shipment': False, 'item_applied_taxes': [],
+                'apply_shipping_on_prices': False, 'apply_discount_on_prices': False,
+            },
+        }
+
+    def get_categories(self):
+        children = [{'id': category_id, 'parent_id': 2, 'name': 'Category {}'.format(category_id),
+                     'is_active': True, 'position': category_id, 'level': 2, 'product_count': 0,
+                     'children_data': []} for category_id in range(3, 8)]
+        return {'id': 2, 'parent_id': 1, 'name': 'Default Category', 'is_active': True, 'position': 1,
+                'level': 1, 'product_count': 0, 'children_data': children}
+
+    @staticmethod
+    def get_attributes():
+        return [{
+            'attribute_id': 90 + index, 'attribute_code': code, 'frontend_input': 'select',
+            'default_frontend_label': code.title(), 'is_required': False, 'scope': 'global',
+            'is_user_defined': True, 'frontend_labels': [],
+            'options': [{'label': ' ', 'value': ''}] + [{'label': '{} {}'.format(code.title(), value),
+                                                           'value': str(index * 10 + value)} for value in range(1, 4)],
+        } for index, code in enumerate(('color', 'size', 'material'), start=1)]
+
+    @staticmethod
+    def get_store(route):
+        if route == 'store/websites':
+            return [{'id': 0, 'code': 'admin', 'name': 'Admin', 'default_group_id': 0},
+                    {'id': 1, 'code': 'base', 'name': 'Main Website', 'default_group_id': 1}]
+        if route == 'store/storeGroups':
+            return [{'id': 1, 'website_id': 1, 'root_category_id': 2, 'default_store_id': 1,
+                     'name': 'Main Website Store', 'code': 'main_website_store'}]
+        if route == 'store/storeViews':
+            return [{'id': 0, 'code': 'admin', 'name': 'Admin', 'website_id': 0, 'store_group_id': 0,
+                     'is_active': 1},
+                    {'id': 1, 'code': 'default', 'name': 'Default Store View', 'website_id': 1,
+                     'store_group_id': 1, 'is_active': 1}]
+        if route == 'store/storeConfigs':
+            return [{'id': 1, 'code': 'default', 'website_id': 1, 'locale': 'en_US',
+                     'base_currency_code': 'USD', 'default_display_currency_code': 'USD', 'timezone': 'UTC',
+                     'weight_unit': 'lbs', 'base_url': 'http://localhost/', 'base_link_url': 'http://localhost/',
+                     'secure_base_url': 'http://localhost/', 'secure_base_link_url': 'http://localhost/'}]
+        return None
+
+    def create_bulk(self, operation_count):
+        bulk_uuid = str(uuid.uuid4())
+        with self.lock:
+            self.bulks[bulk_uuid] = operation_count
+        return {
+            'bulk_uuid': bulk_uuid,
+            'request_items': [{'id': index, 'data_hash': None, 'status': 'accepted'}
+                              for index in range(operation_count)],
+            'errors': False,
+        }
+
+    def get_bulk_status(self, bulk_uuid):
+        count = self.bulks.get(bulk_uuid)
+        if count is None:
+            return None
+        return {
+            'bulk_id': bulk_uuid, 'operation_count': count, 'description': 'Stand-in bulk', 'user_type': 2,
+            'operations_list': [{'id': index + 1, 'topic_name': 'async.standin', 'status': 1,
+                                 'result_serialized_data': None, 'result_message': None, 'error_code': None}
+                                for index in range(count)],
+        }
+
+    def next_document(self):
+        with self.lock:
+            self.next_document_id += 1
+            return str(self.next_document_id)
+
+
+def parse_query(query):
+    """
+    Parse a query string built by Php.http_build_query() into nested dicts, lists being dicts
+    keyed by the index.
+    """
+    result = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        parts = re.findall(r'[^\[\]]+', key)
+        node = result
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if isinstance(node, dict) and parts:
+            node[parts[-1]] = value
+    return result
+
+
+def _values(node):
+    if isinstance(node, dict):
+        return [node[key] for key in sorted(node, key=lambda key: int(key) if key.isdigit() else key)]
+    return node or []
+
+
+def _compare(left, right):
+    try:
+        return (float(left) > float(right)) - (float(left) < float(right))
+    except (TypeError, ValueError):
+        return (str(left) > str(right)) - (str(left) < str(right))
+
+
+def match_filter(item, field, condition, value):
+    current = item.get(field)
+    if condition in ('eq', 'neq'):
+        equal = str(current) == str(value)
+        return equal if condition == 'eq' else not equal
+    if condition in ('in', 'nin'):
+        found = str(current) in [part.strip() for part in str(value).split(',')]
+        return found if condition == 'in' else not found
+    if condition in ('like', 'nlike'):
+        pattern = '^{}$'.format(re.escape(str(value)).replace('%', '.*'))
+        found = bool(re.match(pattern, str(current or '')))
+        return found if condition == 'like' else not found
+    if condition == 'null':
+        return current in (None, '')
+    if condition == 'notnull':
+        return current not in (None, '')
+    if current is None:
+        return False
+    result = _compare(current, value)
+    return {
+        'gt': result > 0, 'gteq': result >= 0, 'from': result >= 0,
+        'lt': result < 0, 'lteq': result <= 0, 'to': result <= 0,
+    }.get(condition, True)
+
+
+def search(items, criteria, aliases=None):
+    """
+    Apply the searchCriteria of Magento to the items: filter groups are joined by AND and the
+    filters of a group by OR. A page after the last one answers the last page, like Magento.
+    """
+    aliases = aliases or {}
+    criteria = criteria or {}
+    for group in _values(criteria.get('filterGroups') or criteria.get('filter_groups')):
+        filters = _values(group.get('filters'))
+        items = [item for item in items if not filters or any(
+            match_filter(item, aliases.get(flt.get('field'), flt.get('field')),
+                         flt.get('condition_type') or flt.get('conditionType') or 'eq', flt.get('value'))
+            for flt in filters)]
+    for order in reversed(_values(criteria.get('sortOrders'))):
+        field = aliases.get(order.get('field'), order.get('field'))
+        items = sorted(items, key=lambda item: (item.get(field) is None, item.get(field)),
+                       reverse=str(order.get('direction', 'ASC')).upper() == 'DESC')
+    total = len(items)
+    page_size = int(criteria.get('pageSize') or criteria.get('page_size') or 0)
+    if page_size:
+        last_page = max((total + page_size - 1) // page_size, 1)
+        page = min(max(int(criteria.get('currentPage') or 1), 1), last_page)
+        items = items[(page - 1) * page_size: page * page_size]
+    return {'items': items, 'search_criteria': criteria, 'total_count': total}
+
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers the REST calls with the dataset of the server.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            super().log_message(*args)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if url.path.startswith('/standin/'):
+            return self._send(200, self.server.control(method, url.path))
+        match = ROUTE_PATTERN.match(url.path)
+        if not match:
+            return self._send(404, {'message': 'Request does not match any route.'})
+        route = match.group('route').rstrip('/')
+        self.server.count(method, match.group('mode'), route)
+        time.sleep(max(self.server.latency + self.server.random.uniform(-1, 1) * self.server.jitter, 0))
+        if self.server.random.random() < self.server.error_rate:
+            return self._send(503, {'message': 'Service temporarily unavailable (stand-in error).'})
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self._send(401, {'message': 'The consumer isn\'t authorized to access %resources.'})
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            return self._send(400, {'message': 'Decoding error: invalid JSON body.'})
+        status, answer = self.server.answer(method, match.group('mode'), route, parse_query(url.query), data)
+        return self._send(status, answer)
+
+    def _send(self, status, answer):
+        content = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class MagentoStandinServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server of the stand-in. It can be started in the background of a benchmark
+    with start() and stop(), or from the command line.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, dataset=None, latency=0.0, jitter=0.0, error_rate=0.0, verbose=False):
+        super().__init__(('127.0.0.1', port), StandinRequestHandler)
+        self.dataset = dataset or MagentoDataset()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.random = random.Random()
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='magento_standin', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        return True
+
+    def count(self, method, mode, route):
+        endpoint = re.sub(r'/(\d+|SKU-[^/]+|[0-9a-f-]{36})(?=/|$)', '/{id}', route)
+        with self.stats_lock:
+            self.stats['{} {}/V1/{}'.format(method, mode or '', endpoint)] += 1
+
+    def control(self, method, path):
+        with self.stats_lock:
+            stats = dict(self.stats)
+            if method == 'POST' and path == '/standin/reset':
+                self.stats.clear()
+        return stats
+
+    def answer(self, method, mode, route, query, data):
+        """
+        Return (HTTP status, answer) of a call to the route, the path after /V1/.
+        """
+        dataset = self.dataset
+        if mode:
+            operations = data if mode == '/async/bulk' and isinstance(data, list) else [data]
+            return 202, dataset.create_bulk(len(operations))
+        criteria = query.get('searchCriteria', {})
+        parts = route.split('/')
+        if method == 'GET':
+            if route == 'orders':
+                return 200, search(dataset.orders, criteria)
+            if parts[0] == 'orders' and len(parts) == 2:
+                order = dataset.orders_by_id.get(int(parts[1])) if parts[1].isdigit() else None
+                return (200, order) if order else (404, {'message': 'The entity that was requested doesn\'t exist.'})
+            if route == 'products':
+                return 200, search(dataset.products, criteria, FIELD_ALIASES['products'])
+            if route == 'products/attributes':
+                return 200, search(dataset.get_attributes(), criteria)
+            if parts[0] == 'products' and len(parts) == 2:
+                product = dataset.products_by_sku.get(unquote(parts[1]))
+                if not product:
+                    return 404, {'message': 'The product that was requested doesn\'t exist.'}
+                return 200, product
+            if route == 'customers/search':
+                return 200, search(dataset.customers, criteria, FIELD_ALIASES['customers'])
+            if route == 'categories':
+                return 200, dataset.get_categories()
+            if route == 'inventory/source-items':
+                items = [{'sku': product['sku'], 'source_code': 'default', 'status': 1,
+                          'quantity': product['extension_attributes']['stock_item']['qty']}
+                         for product in dataset.products]
+                return 200, search(items, criteria)
+            if parts[0] == 'bulk' and len(parts) == 3:
+                status = dataset.get_bulk_status(parts[1])
+                return (200, status) if status else (404, {'message': 'Bulk is not found'})
+            if parts[0] == 'store':
+                answer = dataset.get_store(route)
+                if answer is not None:
+                    return 200, answer
+        if method == 'POST' and route == 'inventory/source-items':
+            return 200, []
+        if method == 'PUT' and route == 'product/updatestock':
+            return 200, [{'code': '200', 'message': 'Stock updated'}]
+        if method == 'POST' and parts[0] == 'order' and len(parts) == 3 and parts[2] in ('ship', 'invoice'):
+            if not parts[1].isdigit() or int(parts[1]) not in dataset.orders_by_id:
+                return 404, {'message': 'The entity that was requested doesn\'t exist.'}
+            return 200, dataset.next_document()
+        if method in ('PUT', 'POST') and parts[0] == 'products':
+            return 200, data.get('product', data) if isinstance(data, dict) else []
+        return 404, {'message': 'Request does not match any route.'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8095)
+    parser.add_argument('--orders', type=int, default=1000, help="Number of orders of the dataset.")
+    parser.add_argument('--products', type=int, default=500, help="Number of products of the dataset.")
+    parser.add_argument('--customers', type=int, default=300, help="Number of customers of the dataset.")
+    parser.add_argument('--configurables', type=int, default=0, help="Number of configurable products.")
+    parser.add_argument('--children', type=int, default=0, help="Number of children of each configurable.")
+    parser.add_argument('--seed', type=int, default=1, help="Seed of the generated dataset.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every answer.")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random seconds added or removed to the latency.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of the calls answered with HTTP 503.")
+    parser.add_argument('--verbose', action='store_true', help="Log every request.")
+    args = parser.parse_args()
+    dataset = MagentoDataset(orders=args.orders, products=args.products, customers=args.customers,
+                             configurables=args.configurables, children=args.children, seed=args.seed)
+    server = MagentoStandinServer(port=args.port, dataset=dataset, latency=args.latency, jitter=args.jitter,
+                                  error_rate=args.error_rate, verbose=args.verbose)
+    print('Magento stand-in listening on {}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
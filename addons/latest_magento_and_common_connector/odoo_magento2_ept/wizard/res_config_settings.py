@@ -7,6 +7,8 @@ import os
 from odoo import models, fields, api, _, SUPERUSER_ID
 from odoo.exceptions import UserError
 from odoo.http import request
+from ..models.queue_line_claim import MAX_QUEUE_WORKERS
+from ..models.queue_payload import PAYLOAD_STORAGES, PAYLOAD_STORAGE_PARAM
 
 MAGENTO_FINANCIAL_STATUS_EPT = 'magento.financial.status.ept'
 STOCK_WAREHOUSE = 'stock.warehouse'
@@ -202,6 +204,18 @@ class ResConfigSettings(models.TransientModel):
                                                     string='Website Analytic Account')
     magento_show_net_profit_report = fields.Boolean(string='Magento Net Profit Report',
                                                     config_parameter="odoo_magento2_ept.magento_show_net_profit_report")
+    magento_queue_workers = fields.Integer(string="Queue Workers", default=1,
+                                           config_parameter="odoo_magento2_ept.queue_workers",
+                                           help="Number of scheduled actions processing the order, product and "
+                                                "export stock queues at the same time. Each worker claims the "
+                                                "lines of a queue, so a line is never processed twice.")
+    magento_queue_payload_storage = fields.Selection(PAYLOAD_STORAGES, string="Queue Payload Storage", default='text',
+                                                     config_parameter=PAYLOAD_STORAGE_PARAM,
+                                                     help="Text: the Magento data of the queue lines is kept as "
+                                                          "JSON text.\nJSONB: it can be filtered in the database, "
+                                                          "like the failed orders of a SKU.\nCompressed: it takes "
+                                                          "the least space.\nThe existing lines are moved to the "
+                                                          "new storage by a scheduled action.")
     is_magento_digest = fields.Boolean(string="Send Periodic Digest?", help='If checked, Then it will send periodic '
                                                                             'digest per KPI.')
     import_customer_as_company = fields.Boolean(string="Import Customer as a Company",
@@ -312,7 +326,14 @@ class ResConfigSettings(models.TransientModel):
         Save all selected Magento Instance configurations
         """
         magento_instance_id = self.magento_instance_id
+        if not 1 <= self.magento_queue_workers <= MAX_QUEUE_WORKERS:
+            raise UserError(_("Queue workers must be between 1 and %s.", MAX_QUEUE_WORKERS))
+        payload_obj = self.env['magento.queue.payload']
+        payload_storage = payload_obj.get_payload_storage()
         res = super(ResConfigSettings, self).execute()
+        self.env['magento.queue.line.claim'].update_worker_crons(self.magento_queue_workers)
+        if payload_obj.get_payload_storage() != payload_storage:
+            payload_obj._trigger_payload_migration()
         IrModule = self.env['ir.module.module']
         exist_module = IrModule.search([('name', '=', 'magento_net_profit_report_ept'), ('state', '=', 'installed')])
         if magento_instance_id: